@@ -0,0 +1,82 @@
+"""Temps d'affichage de l'historique des ventes selon la taille du registre.
+
+Pour chaque taille, dans un processus séparé, mesure ce que coûte un rerun
+de la page : obtenir les lignes à afficher puis les sérialiser en Arrow comme
+le fait ``st.dataframe``. Compare l'ancien affichage (tout le DataFrame) à
+l'historique paginé (``requetes.page``, 50 lignes, avec et sans filtre).
+Le temps paginé ne doit pas dépendre du nombre de lignes (hors premier appel,
+qui calcule l'ordre de tri).
+
+    python benchmarks/bench_historique.py [--lignes 10000 100000 1000000] [--stockage csv]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from bench_stockage import RACINE, historique_ventes
+
+MESURE = """
+import datetime, json, time
+import pyarrow as pa
+from gestion import donnees, requetes
+
+def arrow(df):
+    # Ce que st.dataframe envoie au navigateur
+    table = pa.Table.from_pandas(df)
+    puits = pa.BufferOutputStream()
+    with pa.ipc.new_stream(puits, table.schema) as flux:
+        flux.write_table(table)
+    return puits.getvalue().size
+
+def chrono(fonction, repetitions=5):
+    debut = time.perf_counter()
+    for _ in range(repetitions):
+        octets = fonction()
+    return (time.perf_counter() - debut) / repetitions, octets
+
+df = donnees.charger("ventes")
+resultats = {"lignes": len(df)}
+resultats["complet"] = chrono(lambda: arrow(donnees.charger("ventes")), 3)
+debut = time.perf_counter()
+requetes.page("ventes", 0, 50)
+resultats["premiere_page"] = (time.perf_counter() - debut, None)
+resultats["page"] = chrono(lambda: arrow(requetes.page("ventes", 10, 50)[0]))
+resultats["page_filtree"] = chrono(lambda: arrow(requetes.page(
+    "ventes", 0, 50, datetime.date(2022, 1, 1), datetime.date(2023, 1, 1), {"Produit": ["Café"]})[0]))
+print(json.dumps(resultats))
+"""
+
+
+def mesurer(dossier, format_stockage):
+    env = dict(os.environ, MAISON_SABA_DONNEES=dossier, MAISON_SABA_STOCKAGE=format_stockage,
+               PYTHONPATH=RACINE)
+    # Premier lancement : migration éventuelle vers le format cible, hors mesure
+    subprocess.run([sys.executable, "-c", "from gestion import donnees; donnees.charger('ventes')"],
+                   env=env, check=True, capture_output=True)
+    sortie = subprocess.run([sys.executable, "-c", MESURE], env=env, check=True,
+                            capture_output=True, text=True)
+    return json.loads(sortie.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lignes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--stockage", default="csv", choices=["csv", "parquet", "sqlite"])
+    args = parser.parse_args()
+
+    print(f"{'lignes':>10}{'complet (ms)':>14}{'Ko':>10}{'1re page (ms)':>15}"
+          f"{'page (ms)':>11}{'filtrée (ms)':>14}{'Ko':>8}")
+    for n in args.lignes:
+        with tempfile.TemporaryDirectory() as dossier:
+            historique_ventes(n).to_csv(os.path.join(dossier, "ventes.csv"), index=False)
+            r = mesurer(dossier, args.stockage)
+        print(f"{r['lignes']:>10}{r['complet'][0] * 1000:>14.1f}{r['complet'][1] / 1024:>10.0f}"
+              f"{r['premiere_page'][0] * 1000:>15.1f}{r['page'][0] * 1000:>11.2f}"
+              f"{r['page_filtree'][0] * 1000:>14.2f}{r['page'][1] / 1024:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""Banc d'essai de toutes les pages : rerun de chaque module et interactions clés, résultats en JSON.
+
+Génère un jeu complet (``generateur.py``, ``--lignes`` ventes) dans un dossier
+temporaire, puis pilote l'application sans navigateur (``streamlit.testing``) :
+
+- ``rerun <module>`` : pour chaque entrée de la barre latérale, le premier
+  affichage (``froid_ms``, caches vides) puis ``--repetitions`` reruns
+  complets de la page ;
+- ``ajout vente`` : saisie d'une vente et clic sur « Ajouter la vente » ;
+- ``modification achat`` : modification du fournisseur d'un achat (compaction
+  du registre) ;
+- ``export <format>`` : génération du fichier servi par « Télécharger »
+  (historique complet des ventes ; 30 derniers jours pour l'Excel) ;
+- ``demarrage`` : dans un processus neuf, import de Streamlit, premier
+  affichage de l'application (imports de l'application compris), ouverture
+  de la page Achats ``PAUSE`` secondes plus tard (le temps de lire la
+  première), mémoire résidente (RSS) à ce moment et au maximum, et
+  dépendances lourdes importées (``LOURDES``).
+
+Les durées (ms, rerun déclenché par l'interaction compris) sont écrites dans
+``--sortie`` avec le commit, les versions et la taille des registres ; avec
+``--comparer ancien.json``, chaque mesure est affichée à côté de l'ancienne.
+
+    python benchmarks/bench_modules.py [--lignes 100000] [--repetitions 5] [--stockage csv]
+                                       [--sortie bench_modules.json] [--comparer ancien.json]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+import generateur
+from bench_stockage import RACINE
+
+PAUSE = 3.0
+LOURDES = ["altair", "gspread", "google.oauth2", "google_auth_oauthlib", "googleapiclient", "requests"]
+
+DEMARRAGE = """
+import json, sys, time
+debut = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+import_streamlit = time.perf_counter() - debut
+at = AppTest.from_file(sys.argv[1], default_timeout=3600)
+debut = time.perf_counter()
+at.run()
+premier = time.perf_counter() - debut
+lourdes_premier = [m for m in sys.argv[3:] if m in sys.modules]
+time.sleep(float(sys.argv[2]))
+at.sidebar.radio[0].set_value("Achats")
+debut = time.perf_counter()
+at.run()
+achats = time.perf_counter() - debut
+with open("/proc/self/status") as f:
+    statut = dict(l.split(":", 1) for l in f)
+print(json.dumps({
+    "import_streamlit_ms": round(import_streamlit * 1000, 2),
+    "premier_affichage_ms": round(premier * 1000, 2),
+    "page_achats_ms": round(achats * 1000, 2),
+    "rss_mo": round(int(statut["VmRSS"].split()[0]) / 1024, 1),
+    "rss_max_mo": round(int(statut["VmHWM"].split()[0]) / 1024, 1),
+    "lourdes_premier_affichage": lourdes_premier,
+    "lourdes_importees": [m for m in sys.argv[3:] if m in sys.modules],
+}))
+"""
+
+
+def demarrage(dossier, stockage):
+    env = dict(os.environ, MAISON_SABA_DONNEES=dossier, MAISON_SABA_STOCKAGE=stockage, PYTHONPATH=RACINE)
+    sortie = subprocess.run([sys.executable, "-c", DEMARRAGE, os.path.join(RACINE, "streamlit_app.py"), str(PAUSE), *LOURDES],
+                            env=env, check=True, capture_output=True, text=True)
+    return json.loads(sortie.stdout.strip().splitlines()[-1])
+
+
+def chrono(action, repetitions):
+    durees = []
+    for i in range(repetitions):
+        debut = time.perf_counter()
+        action(i)
+        durees.append((time.perf_counter() - debut) * 1000)
+    return durees
+
+
+def resume(durees, froid=None):
+    mesure = {"p50_ms": round(statistics.median(durees), 2), "min_ms": round(min(durees), 2),
+              "max_ms": round(max(durees), 2), "repetitions": len(durees)}
+    if froid is not None:
+        mesure["froid_ms"] = round(froid, 2)
+    return mesure
+
+
+def executer(at):
+    at.run()
+    if at.exception:
+        sys.exit(f"exception dans l'application : {at.exception[0].value}")
+
+
+def commit():
+    try:
+        sortie = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RACINE, check=True,
+                                capture_output=True, text=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return sortie.stdout.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lignes", type=int, default=100_000)
+    parser.add_argument("--repetitions", type=int, default=5)
+    parser.add_argument("--stockage", default="csv", choices=["csv", "parquet", "sqlite"])
+    parser.add_argument("--sortie", default="bench_modules.json")
+    parser.add_argument("--comparer", help="résultats JSON d'une exécution précédente")
+    args = parser.parse_args()
+
+    mesures = {}
+    with tempfile.TemporaryDirectory() as dossier:
+        registres = generateur.lancer(dossier, args.lignes)
+        # Processus neuf, avant que celui-ci n'importe quoi de l'application
+        infos_demarrage = demarrage(dossier, args.stockage)
+        # Avant le premier import de gestion : l'application lit ces variables au chargement
+        os.environ.update(MAISON_SABA_DONNEES=dossier, MAISON_SABA_STOCKAGE=args.stockage)
+        sys.path.insert(0, RACINE)
+        import streamlit
+        from streamlit.testing.v1 import AppTest
+        from gestion import export
+
+        at = AppTest.from_file(os.path.join(RACINE, "streamlit_app.py"), default_timeout=3600)
+        debut = time.perf_counter()
+        executer(at)
+        mesures["premier affichage"] = resume([(time.perf_counter() - debut) * 1000])
+        # Entrées de la barre latérale, lues dans l'application elle-même
+        for module in at.sidebar.radio[0].options:
+            debut = time.perf_counter()
+            at.sidebar.radio[0].set_value(module)
+            executer(at)
+            froid = (time.perf_counter() - debut) * 1000
+            mesures[f"rerun {module}"] = resume(chrono(lambda i: executer(at), args.repetitions), froid)
+            print(f"rerun {module} : {mesures[f'rerun {module}']['p50_ms']:.1f} ms", file=sys.stderr)
+
+        at.sidebar.radio[0].set_value("Ventes")
+        executer(at)
+
+        def ajout_vente(i):
+            at.number_input(key="vente_quantite").set_value(1 + i % 3)
+            next(b for b in at.button if b.label == "Ajouter la vente").click()
+            executer(at)
+        mesures["ajout vente"] = resume(chrono(ajout_vente, args.repetitions))
+
+        at.sidebar.radio[0].set_value("Achats")
+        executer(at)
+
+        def modification_achat(i):
+            next(t for t in at.text_input if (t.key or "").startswith("mod_fournisseur")).set_value(f"Fournisseur {i}")
+            next(b for b in at.button if b.label == "Modifier l'achat").click()
+            executer(at)
+            if not at.success:
+                sys.exit(f"modification refusée : {[e.value for e in at.error]}")
+        mesures["modification achat"] = resume(chrono(modification_achat, args.repetitions))
+
+        for format_export in export.FORMATS:
+            debut = datetime.date.today() - datetime.timedelta(days=30) if format_export == "xlsx" else None
+            mesures[f"export {format_export}"] = resume(chrono(
+                lambda i: export.octets("ventes", format_export, debut), max(1, args.repetitions // 2)))
+
+    resultats = {
+        "commit": commit(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "streamlit": streamlit.__version__,
+        "pandas": pd.__version__,
+        "stockage": args.stockage,
+        "lignes": args.lignes,
+        "registres": registres,
+        "demarrage": infos_demarrage,
+        "mesures": mesures,
+    }
+    with open(args.sortie, "w", encoding="utf-8") as f:
+        json.dump(resultats, f, ensure_ascii=False, indent=2)
+
+    ancien, anciennes = {}, {}
+    if args.comparer:
+        with open(args.comparer, encoding="utf-8") as f:
+            ancien = json.load(f)
+        anciennes = ancien["mesures"]
+        if (ancien["lignes"], ancien["stockage"]) != (args.lignes, args.stockage):
+            print(f"attention : comparaison avec {ancien['lignes']} ventes ({ancien['stockage']})")
+    print(f"{args.lignes} ventes ({args.stockage}), commit {resultats['commit']}, médiane en ms")
+    print(f"{'mesure':<32}{'froid':>10}{'p50':>10}" + (f"{'avant':>10}{'écart':>9}" if anciennes else ""))
+    for nom, mesure in mesures.items():
+        froid = f"{mesure['froid_ms']:.1f}" if "froid_ms" in mesure else ""
+        ligne = f"{nom:<32}{froid:>10}{mesure['p50_ms']:>10.1f}"
+        if nom in anciennes:
+            avant = anciennes[nom]["p50_ms"]
+            ligne += f"{avant:>10.1f}{(mesure['p50_ms'] - avant) / avant:>+9.0%}"
+        print(ligne)
+    for titre, infos in (("démarrage", infos_demarrage), ("avant", ancien.get("demarrage"))):
+        if infos:
+            print(f"{titre} : import de Streamlit {infos['import_streamlit_ms']:.0f} ms, premier affichage "
+                  f"{infos['premier_affichage_ms']:.0f} ms, page Achats {infos.get('page_achats_ms', float('nan')):.0f} ms, "
+                  f"RSS {infos['rss_mo']:.0f} Mo (max {infos['rss_max_mo']:.0f} Mo), dépendances lourdes au premier "
+                  f"affichage : {', '.join(infos.get('lourdes_premier_affichage', infos['lourdes_importees'])) or 'aucune'}")
+    print(f"résultats écrits dans {args.sortie}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Coût et qualité des prévisions de ventes (``gestion/prevision.py``).
+
+Sur le jeu synthétique de ``generateur.py`` (``--produits`` plats) :
+
+- ajustement complet du modèle (série quotidienne + lissage de tous les
+  produits), registre déjà en mémoire ;
+- mise à jour après une vente ajoutée (rejeu incrémental) ;
+- recommandations de production pour le lendemain ;
+- erreur des prévisions sur les ``--test`` derniers jours, chacune faite
+  avec les ventes des jours précédents (le modèle apprend un jour à la
+  fois), comparée à la prévision naïve « même jour la semaine dernière »
+  (erreur absolue, en % des ventes).
+
+    python benchmarks/bench_prevision.py [--lignes 1000000] [--produits 300] [--test 28]
+"""
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+import generateur
+from bench_stockage import RACINE
+
+
+def chrono(fonction):
+    debut = time.perf_counter()
+    resultat = fonction()
+    return (time.perf_counter() - debut) * 1000, resultat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lignes", type=int, default=1_000_000)
+    parser.add_argument("--produits", type=int, default=300)
+    parser.add_argument("--test", type=int, default=28, help="jours de test, à la fin de l'historique")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dossier:
+        generateur.lancer(dossier, args.lignes, nb_produits=args.produits)
+        # Avant le premier import de gestion : l'application lit cette variable au chargement
+        os.environ.update(MAISON_SABA_DONNEES=dossier, MAISON_SABA_STOCKAGE="csv")
+        sys.path.insert(0, RACINE)
+        from gestion import donnees, prevision
+
+        donnees.charger("ventes")
+        print(f"{args.lignes} ventes, {args.produits} produits")
+        ms, _ = chrono(prevision.modele)
+        print(f"{'ajustement complet':<32}{ms:>10.1f} ms")
+        ms, _ = chrono(prevision.modele)
+        print(f"{'modèle à jour (cache)':<32}{ms:>10.1f} ms")
+        aujourdhui = datetime.date.today()
+        donnees.ajouter("ventes", {"Date": str(aujourdhui), "Produit": generateur.PLATS[0], "Quantité": 1,
+                                   "Prix unitaire": 5.0, "Total": 5.0, "Mode de paiement": "Espèces"})
+        donnees.charger("ventes")
+        ms, _ = chrono(prevision.modele)
+        print(f"{'après une vente (rejeu)':<32}{ms:>10.1f} ms")
+        ms, reco = chrono(prevision.recommandations)
+        print(f"{'recommandations':<32}{ms:>10.1f} ms  ({len(reco)} produits)")
+
+        serie = prevision.serie()
+        erreur = naive = vendus = 0.0
+        for jour in serie.index[-args.test - 1:-1]:
+            attendu = prevision.prevoir(jour).iloc[0]
+            reel = serie.loc[jour]
+            erreur += (attendu - reel).abs().sum()
+            naive += (serie.loc[jour - datetime.timedelta(days=7)] - reel).abs().sum()
+            vendus += reel.sum()
+        print(f"erreur sur {args.test} jours : modèle {erreur / vendus:.1%}, "
+              f"même jour la semaine dernière {naive / vendus:.1%} ({prevision.stats()})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Coût d'une interaction : rerun complet de la page contre rerun du seul fragment.
+
+Chaque interaction (changer une quantité, paginer un historique, choisir une
+période...) est rejouée avec ``streamlit.testing`` sur le jeu synthétique de
+``generateur.py``. L'application note la durée de chaque exécution dans
+``st.session_state["mesures_reruns"]`` : ``app`` pour le script entier,
+le nom de la fonction pour un fragment.
+
+- « avant » : durée du script entier, ce que coûtait l'interaction quand tout
+  widget relançait la page ;
+- « après » : durée du fragment qui contient le widget, seul relancé
+  maintenant dans le navigateur.
+
+``AppTest`` relance toujours le script entier : « après » est mesuré à
+l'intérieur de ce rerun, sans le coût fixe de Streamlit (envoi des éléments
+au navigateur), qui ne fait qu'agrandir l'écart.
+
+    python benchmarks/bench_reruns.py [--lignes 100000] [--repetitions 5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+
+import generateur
+from bench_stockage import RACINE
+
+# (module, fragment attendu, libellé, interaction)
+INTERACTIONS = [
+    ("Dashboard", "indicateurs_periode", "Choisir la période",
+     lambda at, i: next(r for r in at.radio if r.label == "Période").set_value(["Jour", "Mois"][i % 2])),
+    ("Ventes", "saisie_vente", "Changer la quantité d'une vente",
+     lambda at, i: at.number_input(key="vente_quantite").set_value(2 + i % 2)),
+    ("Ventes", "afficher_historique", "Page suivante de l'historique",
+     lambda at, i: at.number_input(key="ventes_hist_page").set_value(2 + i % 2)),
+    ("Achats", "saisie_achat", "Saisir la quantité d'un achat",
+     lambda at, i: at.number_input(key="quantite").set_value(1.0 + i % 2)),
+    ("Trésorerie", "flux_tresorerie", "Regrouper les flux par semaine ou par mois",
+     lambda at, i: next(r for r in at.radio if r.label == "Regrouper par").set_value(["Semaine", "Mois"][i % 2])),
+    ("Paie", "module_paie", "Changer le taux horaire par défaut",
+     lambda at, i: at.number_input[0].set_value(12.5 + i % 2)),
+]
+
+
+def durees(at, zone):
+    return [m["ms"] for m in at.session_state["mesures_reruns"] if m["zone"] == zone]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lignes", type=int, default=100_000, help="ventes (jeu complet de generateur.py)")
+    parser.add_argument("--repetitions", type=int, default=5)
+    parser.add_argument("--stockage", default="csv", choices=["csv", "parquet", "sqlite"])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dossier:
+        generateur.lancer(dossier, args.lignes)
+        # Avant le premier import de gestion : l'application lit ces variables au chargement
+        os.environ.update(MAISON_SABA_DONNEES=dossier, MAISON_SABA_STOCKAGE=args.stockage)
+        sys.path.insert(0, RACINE)
+        from streamlit.testing.v1 import AppTest
+
+        print(f"{args.lignes} ventes, médiane sur {args.repetitions} interactions (ms)")
+        print(f"{'interaction':<45} {'avant':>10} {'après':>10} {'gain':>7}")
+        for module, zone, libelle, interaction in INTERACTIONS:
+            at = AppTest.from_file(os.path.join(RACINE, "streamlit_app.py"), default_timeout=600)
+            at.run()
+            at.sidebar.radio[0].set_value(module).run()
+            avant, apres = [], []
+            for i in range(args.repetitions):
+                at.session_state["mesures_reruns"] = []
+                interaction(at, i)
+                at.run()
+                if at.exception:
+                    sys.exit(f"{libelle} : {at.exception[0].value}")
+                avant += durees(at, "app")
+                apres += durees(at, zone)[-1:]
+            avant, apres = statistics.median(avant), statistics.median(apres)
+            print(f"{libelle:<45} {avant:>10.1f} {apres:>10.1f} {avant / apres:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
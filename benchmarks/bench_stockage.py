@@ -0,0 +1,81 @@
+"""Compare le chargement du registre des ventes en CSV et en Parquet.
+
+Génère un historique synthétique (1 million de lignes par défaut), puis mesure
+dans un processus séparé par format le temps de ``donnees.charger("ventes")``
+et la mémoire résidente maximale (RSS).
+
+    python benchmarks/bench_stockage.py [--lignes 1000000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MESURE = """
+import json, resource, time
+from gestion import donnees
+debut = time.perf_counter()
+df = donnees.charger("ventes")
+duree = time.perf_counter() - debut
+try:
+    # VmHWM : pic propre au processus (ru_maxrss hérite du parent au fork)
+    with open("/proc/self/status") as f:
+        rss = next(int(l.split()[1]) for l in f if l.startswith("VmHWM"))
+except OSError:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"lignes": len(df), "secondes": duree, "rss_max_ko": rss}))
+"""
+
+
+def historique_ventes(n, graine=0):
+    rng = np.random.default_rng(graine)
+    produits = np.array(["Brioche perdue", "Cookie pistache", "Café", "Thé glacé", "Banana bread", "Cheesecake"])
+    prix = np.array([8.0, 3.5, 2.0, 3.0, 4.5, 5.5])
+    modes = np.array(["Espèces", "Carte bancaire", "Ticket restaurant", "Autre"])
+    idx = rng.integers(0, len(produits), n)
+    quantite = rng.integers(1, 5, n)
+    jours = pd.Timestamp("2020-01-01") + pd.to_timedelta(np.sort(rng.integers(0, 365 * 5, n)), unit="D")
+    return pd.DataFrame({
+        "Date": jours.strftime("%Y-%m-%d"),
+        "Produit": produits[idx],
+        "Quantité": quantite,
+        "Prix unitaire": prix[idx],
+        "Total": quantite * prix[idx],
+        "Mode de paiement": modes[rng.integers(0, len(modes), n)],
+    })
+
+
+def mesurer(dossier, format_stockage):
+    env = dict(os.environ, MAISON_SABA_DONNEES=dossier, MAISON_SABA_STOCKAGE=format_stockage,
+               PYTHONPATH=RACINE)
+    sortie = subprocess.run([sys.executable, "-c", MESURE], env=env, check=True,
+                            capture_output=True, text=True)
+    return json.loads(sortie.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lignes", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dossier:
+        historique_ventes(args.lignes).to_csv(os.path.join(dossier, "ventes.csv"), index=False)
+        resultats = {"csv": mesurer(dossier, "csv")}
+        # Premier passage Parquet = migration du CSV, le second mesure la lecture seule
+        resultats["parquet (migration)"] = mesurer(dossier, "parquet")
+        resultats["parquet"] = mesurer(dossier, "parquet")
+
+    print(f"{'format':<22}{'lignes':>10}{'temps (s)':>12}{'RSS max (Mo)':>15}")
+    for nom, r in resultats.items():
+        print(f"{nom:<22}{r['lignes']:>10}{r['secondes']:>12.3f}{r['rss_max_ko'] / 1024:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
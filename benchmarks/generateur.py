@@ -0,0 +1,266 @@
+"""Jeu de données synthétique complet, aux schémas des registres et documents de l'application.
+
+Écrit dans un dossier de données (celui de ``MAISON_SABA_DONNEES``) :
+
+- registres CSV : ventes (``--lignes``, de 1 000 à 10 millions), achats (un
+  dixième), mouvements de trésorerie manuels (un cinquantième), inventaires
+  mensuels et soldes bancaires de fin de mois ;
+- documents JSON : plats et prix, recettes (3 à 6 ingrédients par plat),
+  seuils de stock, fiches employés et planning de la semaine type.
+
+Les ventes suivent un rythme réaliste : plus de monde le week-end, une
+saisonnalité annuelle et quelques plats qui font l'essentiel du chiffre
+d'affaires. Tout est tiré d'un générateur initialisé par ``--graine`` : deux
+appels identiques produisent les mêmes fichiers. Les registres sont écrits
+par morceaux, sans jamais tenir 10 millions de lignes en mémoire.
+
+    python benchmarks/generateur.py DOSSIER [--lignes 100000] [--produits 30] [--employes 12] [--jours 1095]
+"""
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+
+from bench_stockage import RACINE
+
+TAILLE_MORCEAU = 1_000_000
+
+PLATS = ["Brioche perdue", "Cookie pistache", "Café", "Thé glacé", "Banana bread", "Cheesecake",
+         "Cinnamon roll", "Tarte citron", "Granola bowl", "Chocolat chaud", "Muffin myrtille", "Pancakes"]
+# ingrédient -> (unité, prix unitaire moyen, fournisseur)
+INGREDIENTS = {
+    "Farine": ("kg", 1.2, "Metro"), "Sucre": ("kg", 1.1, "Metro"), "Beurre": ("kg", 9.5, "Promocash"),
+    "Oeufs": ("u", 0.3, "Ferme Martin"), "Lait": ("L", 1.0, "Promocash"), "Crème": ("L", 4.2, "Promocash"),
+    "Pistache": ("kg", 28.0, "Metro"), "Chocolat": ("kg", 14.0, "Metro"), "Vanille": ("u", 2.5, "Metro"),
+    "Levure": ("kg", 6.0, "Metro"), "Café": ("kg", 22.0, "Torréfaction Saba"), "Thé": ("kg", 35.0, "Metro"),
+    "Citron": ("kg", 3.2, "Marché"), "Myrtilles": ("kg", 12.0, "Marché"), "Banane": ("kg", 2.0, "Marché"),
+    "Fromage frais": ("kg", 7.5, "Promocash"), "Cannelle": ("kg", 18.0, "Metro"), "Flocons d'avoine": ("kg", 2.4, "Metro"),
+}
+MODES_VENTE = ["Espèces", "Carte bancaire", "Ticket restaurant", "Autre"]
+MODES_ACHAT = ["Carte bancaire", "Virement", "Chèque", "Espèces"]
+# Lundi -> dimanche : plus de monde en fin de semaine
+RYTHME_SEMAINE = np.array([0.8, 0.85, 0.9, 1.0, 1.2, 1.5, 1.3])
+SERVICES = ["7h-15h", "8h-16h", "11h-19h", "14h-22h", "9h-13h / 17h-21h", ""]
+
+
+def _schemas():
+    # Import tardif : gestion lit MAISON_SABA_DONNEES au chargement
+    sys.path.insert(0, RACINE)
+    from gestion import documents, donnees
+    return donnees.REGISTRES, documents
+
+
+def _jours(nb_jours, fin=None):
+    fin = pd.Timestamp(fin or datetime.date.today())
+    return pd.date_range(end=fin, periods=nb_jours, freq="D")
+
+
+def _ecrire_registre(dossier, registres, nom, morceaux):
+    path = os.path.join(dossier, registres[nom]["fichier"])
+    colonnes = registres[nom]["colonnes"]
+    nb = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(",".join(colonnes) + "\n")
+        for morceau in morceaux:
+            morceau.reindex(columns=colonnes).to_csv(f, header=False, index=False, lineterminator="\n")
+            nb += len(morceau)
+    return nb
+
+
+def plats(nb_produits, rng):
+    noms = PLATS[:nb_produits] + [f"Plat {i:03d}" for i in range(len(PLATS), nb_produits)]
+    return {nom: float(p) for nom, p in zip(noms, rng.choice(np.arange(2.0, 12.5, 0.5), len(noms)))}
+
+
+def ventes(n, carte, jours, rng):
+    """Morceaux de ventes, dans l'ordre des dates, ``n`` lignes en tout."""
+    noms = np.array(list(carte))
+    prix = np.array(list(carte.values()))
+    # Quelques plats font l'essentiel des ventes (loi de Zipf)
+    popularite = 1.0 / np.arange(1, len(noms) + 1) ** 1.1
+    popularite /= popularite.sum()
+    saison = 1.0 + 0.2 * np.sin(2 * np.pi * (jours.dayofyear.to_numpy() - 80) / 365.25)
+    poids = RYTHME_SEMAINE[jours.dayofweek.to_numpy()] * saison
+    par_jour = rng.multinomial(n, poids / poids.sum())
+    # Découpage en morceaux de jours consécutifs d'environ TAILLE_MORCEAU lignes
+    bornes = np.searchsorted(np.cumsum(par_jour), np.arange(TAILLE_MORCEAU, n, TAILLE_MORCEAU), side="right")
+    for debut, fin in zip(np.r_[0, bornes], np.r_[bornes, len(jours)]):
+        dates = np.repeat(jours[debut:fin].strftime("%Y-%m-%d").to_numpy(), par_jour[debut:fin])
+        m = len(dates)
+        if not m:
+            continue
+        produit = rng.choice(len(noms), m, p=popularite)
+        quantite = rng.integers(1, 5, m)
+        yield pd.DataFrame({
+            "Date": dates,
+            "Produit": noms[produit],
+            "Quantité": quantite,
+            "Prix unitaire": prix[produit],
+            "Total": quantite * prix[produit],
+            "Mode de paiement": np.array(MODES_VENTE)[rng.choice(4, m, p=[0.25, 0.6, 0.12, 0.03])],
+        })
+
+
+def achats(n, jours, rng):
+    """Morceaux d'achats d'ingrédients, dans l'ordre des dates."""
+    noms = np.array(list(INGREDIENTS))
+    unites = np.array([u for u, _, _ in INGREDIENTS.values()])
+    prix = np.array([p for _, p, _ in INGREDIENTS.values()])
+    fournisseurs = np.array([f for _, _, f in INGREDIENTS.values()])
+    dates_jours = jours.strftime("%Y-%m-%d").to_numpy()
+    tirage = np.sort(rng.integers(0, len(jours), n))
+    for debut in range(0, n, TAILLE_MORCEAU):
+        dates = dates_jours[tirage[debut:debut + TAILLE_MORCEAU]]
+        m = len(dates)
+        ingredient = rng.integers(0, len(noms), m)
+        quantite = rng.integers(1, 25, m).astype(float)
+        prix_unitaire = (prix[ingredient] * rng.uniform(0.85, 1.15, m)).round(2)
+        yield pd.DataFrame({
+            "Date": dates,
+            "Fournisseur": fournisseurs[ingredient],
+            "Produit": noms[ingredient],
+            "Quantité": quantite,
+            "Unité": unites[ingredient],
+            "Prix unitaire": prix_unitaire,
+            "Total": (quantite * prix_unitaire).round(2),
+            "Mode de paiement": np.array(MODES_ACHAT)[rng.choice(4, m, p=[0.6, 0.3, 0.05, 0.05])],
+            "Catégorie": "Matières premières",
+        })
+
+
+def tresorerie(n, jours, rng):
+    """Mouvements saisis à la main (les autres sont déduits des ventes et achats)."""
+    libelles = np.array(["Loyer", "Électricité", "Assurance", "Fond de caisse", "Réparation", "Divers"])
+    montants = np.array([1800.0, 240.0, 95.0, 150.0, 320.0, 60.0])
+    libelle = rng.integers(0, len(libelles), n)
+    entree = libelles[libelle] == "Fond de caisse"
+    yield pd.DataFrame({
+        "Date": np.sort(rng.choice(jours.strftime("%Y-%m-%d").to_numpy(), n)),
+        "Libellé": libelles[libelle],
+        "Type": np.where(entree, "Entrée", "Sortie"),
+        "Montant": (montants[libelle] * rng.uniform(0.8, 1.2, n)).round(2),
+        "Mode": np.where(entree, "Espèces", "Virement"),
+        "Catégorie": "Divers",
+        "Référence": "",
+    })
+
+
+def inventaires(jours, rng):
+    """Un inventaire de chaque ingrédient le premier de chaque mois."""
+    mois = jours[jours.day == 1].strftime("%Y-%m-%d").to_numpy()
+    noms = np.array(list(INGREDIENTS))
+    yield pd.DataFrame({
+        "Date": np.repeat(mois, len(noms)),
+        "Ingrédient": np.tile(noms, len(mois)),
+        "Type": "Inventaire",
+        "Quantité": rng.uniform(0, 40, len(mois) * len(noms)).round(1),
+        "Motif": "Inventaire",
+    })
+
+
+def soldes(jours, rng, comptes=("Compte courant", "Livret")):
+    fins = pd.date_range(jours[0], jours[-1], freq="ME").strftime("%Y-%m-%d").to_numpy()
+    for compte, depart in zip(comptes, (8_000.0, 20_000.0)):
+        yield pd.DataFrame({
+            "Date": fins,
+            "Compte": compte,
+            "Solde": (depart + rng.normal(300, 1500, len(fins)).cumsum()).round(2),
+            "Origine": "Saisie",
+        })
+
+
+def recettes(carte, rng):
+    noms = list(INGREDIENTS)
+    resultat = {}
+    for plat in carte:
+        choisis = rng.choice(len(noms), rng.integers(3, 7), replace=False)
+        resultat[plat] = {
+            "duree": f"{int(rng.integers(1, 5))} jours",
+            "ingredients": {noms[i]: float(rng.choice([0.01, 0.02, 0.05, 0.1, 0.2, 1.0])) for i in choisis},
+            "etapes": "Peser, mélanger, cuire.",
+        }
+    return resultat
+
+
+def equipe(nb_employes, rng):
+    employes, planning = {}, {}
+    jours = ["Lundi", "Mardi", "Mercredi", "Jeudi", "Vendredi", "Samedi", "Dimanche"]
+    for i in range(nb_employes):
+        nom = f"Employé {i + 1:02d}"
+        employes[nom] = {"contrat": "CDI 35 h" if i % 3 else "Extra", "taux_horaire": float(rng.choice([12.0, 13.5, 15.0])),
+                         "prime": 0.0, "absences": ""}
+        for jour, service in zip(jours, rng.choice(SERVICES, 7, p=[0.2, 0.2, 0.2, 0.15, 0.1, 0.15])):
+            if service:
+                planning.setdefault(jour, {})[nom] = str(service)
+    return employes, planning
+
+
+def generer(dossier, lignes=100_000, nb_produits=30, nb_employes=12, nb_jours=3 * 365, graine=0):
+    """Écrit le jeu complet dans ``dossier`` ; renvoie le nombre de lignes par registre.
+
+    Importe gestion : à appeler avec ``MAISON_SABA_DONNEES=dossier`` et le
+    stockage CSV (voir ``lancer``).
+    """
+    registres, documents = _schemas()
+    rng = np.random.default_rng(graine)
+    jours = _jours(nb_jours)
+    carte = plats(nb_produits, rng)
+    employes, planning = equipe(nb_employes, rng)
+    contenus = {
+        "plats": carte,
+        "recettes": recettes(carte, rng),
+        "stock": {nom: {"seuil": 5.0} for nom in INGREDIENTS},
+        "employes": employes,
+        "planning": planning,
+    }
+    for nom, contenu in contenus.items():
+        with open(os.path.join(dossier, documents.DOCUMENTS[nom]["fichier"]), "w", encoding="utf-8") as f:
+            json.dump(documents.valider(nom, contenu), f, ensure_ascii=False, indent=2)
+
+    return {
+        "ventes": _ecrire_registre(dossier, registres, "ventes", ventes(lignes, carte, jours, rng)),
+        "achats": _ecrire_registre(dossier, registres, "achats", achats(max(1, lignes // 10), jours, rng)),
+        "tresorerie": _ecrire_registre(dossier, registres, "tresorerie", tresorerie(max(1, lignes // 50), jours, rng)),
+        "mouvements_stock": _ecrire_registre(dossier, registres, "mouvements_stock", inventaires(jours, rng)),
+        "soldes_bancaires": _ecrire_registre(dossier, registres, "soldes_bancaires", soldes(jours, rng)),
+    }
+
+
+def lancer(dossier, lignes=100_000, **options):
+    """``generer`` dans un processus séparé, pour les bancs d'essai qui importent ensuite gestion.
+
+    En SQLite, l'import de gestion migre les CSV présents à ce moment-là : le
+    jeu doit donc être écrit avant, par un autre processus.
+    """
+    code = f"import json, generateur; print(json.dumps(generateur.generer({dossier!r}, {lignes!r}, **{options!r})))"
+    env = dict(os.environ, MAISON_SABA_DONNEES=dossier, MAISON_SABA_STOCKAGE="csv")
+    sortie = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            env=env, check=True, capture_output=True, text=True)
+    return json.loads(sortie.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("dossier")
+    parser.add_argument("--lignes", type=int, default=100_000, help="ventes (1 000 à 10 000 000)")
+    parser.add_argument("--produits", type=int, default=30)
+    parser.add_argument("--employes", type=int, default=12)
+    parser.add_argument("--jours", type=int, default=3 * 365, help="historique jusqu'à aujourd'hui")
+    parser.add_argument("--graine", type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.dossier, exist_ok=True)
+    # Le jeu est écrit en CSV ; l'application le migre au premier lancement si besoin
+    os.environ.update(MAISON_SABA_DONNEES=args.dossier, MAISON_SABA_STOCKAGE="csv")
+    nombres = generer(args.dossier, args.lignes, args.produits, args.employes, args.jours, args.graine)
+    for nom, nb in nombres.items():
+        print(f"{nom:<18}{nb:>12} lignes")
+
+
+if __name__ == "__main__":
+    main()
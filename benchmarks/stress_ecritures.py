@@ -0,0 +1,109 @@
+"""Écritures concurrentes : aucune ligne ne doit se perdre avec 50 processus écrivains.
+
+Lance ``--ecrivains`` processus qui, en même temps, ajoutent chacun
+``--ajouts`` ventes (une par une, comme la caisse) et modifient de temps en
+temps une vente existante par ``agregats.modifier_ligne`` (compaction du
+registre, comme le formulaire de modification des achats). À la fin, vérifie
+que toutes les ventes ajoutées sont présentes une seule fois et que les
+agrégats correspondent au registre.
+
+    python benchmarks/stress_ecritures.py [--ecrivains 50] [--ajouts 40] [--stockage csv]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_stockage import RACINE, historique_ventes
+
+ECRIVAIN = """
+import json, random, sys, time
+from gestion import agregats, donnees
+
+numero, ajouts, modifier_tous = int(sys.argv[1]), int(sys.argv[2]), int(sys.argv[3])
+hasard = random.Random(numero)
+compteurs = {"ajouts": 0, "modifications": 0, "conflits": 0}
+debut = time.perf_counter()
+for i in range(ajouts):
+    agregats.ajouter("ventes", {
+        "Date": "2024-06-01", "Produit": f"e{numero}-{i}", "Quantité": 1,
+        "Prix unitaire": 1.0, "Total": 1.0, "Mode de paiement": "Espèces",
+    })
+    compteurs["ajouts"] += 1
+    if i % modifier_tous == modifier_tous - 1:
+        df = donnees.charger("ventes")
+        index = df.index[hasard.randrange(len(df))]
+        try:
+            agregats.modifier_ligne("ventes", index, df.loc[index], {"Quantité": float(df.at[index, "Quantité"]) + 1})
+            compteurs["modifications"] += 1
+        except donnees.ConflitEcriture:
+            compteurs["conflits"] += 1
+compteurs["secondes"] = time.perf_counter() - debut
+print(json.dumps(compteurs))
+"""
+
+VERIFICATION = """
+import json
+from gestion import agregats, donnees
+df = donnees.charger("ventes")
+ajoutes = df["Produit"].astype(str)
+ajoutes = ajoutes[ajoutes.str.match(r"e\\d+-\\d+$")]
+nb, total = agregats.obtenir("ventes").total()
+print(json.dumps({"lignes": len(df), "ajoutees": int(ajoutes.nunique()), "doublons": int(ajoutes.duplicated().sum()),
+                  "agregat_lignes": nb, "agregat_total": total, "total": float(df["Total"].sum()),
+                  "revision": donnees.revision("ventes")}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ecrivains", type=int, default=50)
+    parser.add_argument("--ajouts", type=int, default=40)
+    parser.add_argument("--modifier-tous", type=int, default=10, help="une modification tous les N ajouts")
+    parser.add_argument("--lignes", type=int, default=1_000, help="ventes déjà présentes")
+    parser.add_argument("--stockage", default="csv", choices=["csv", "parquet", "sqlite"])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dossier:
+        historique_ventes(args.lignes).to_csv(os.path.join(dossier, "ventes.csv"), index=False)
+        env = dict(os.environ, MAISON_SABA_DONNEES=dossier, MAISON_SABA_STOCKAGE=args.stockage,
+                   PYTHONPATH=RACINE)
+        subprocess.run([sys.executable, "-c", "from gestion import agregats; agregats.obtenir('ventes')"],
+                       env=env, check=True, capture_output=True)
+        debut = time.perf_counter()
+        processus = [
+            subprocess.Popen([sys.executable, "-c", ECRIVAIN, str(n), str(args.ajouts), str(args.modifier_tous)],
+                             env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            for n in range(args.ecrivains)
+        ]
+        bilans = []
+        for p in processus:
+            sortie, erreurs = p.communicate()
+            if p.returncode != 0:
+                sys.exit(f"écrivain en échec :\n{erreurs}")
+            bilans.append(json.loads(sortie.strip().splitlines()[-1]))
+        duree = time.perf_counter() - debut
+        sortie = subprocess.run([sys.executable, "-c", VERIFICATION], env=env, check=True,
+                                capture_output=True, text=True)
+        r = json.loads(sortie.stdout.strip().splitlines()[-1])
+
+    attendues = args.ecrivains * args.ajouts
+    modifications = sum(b["modifications"] for b in bilans)
+    conflits = sum(b["conflits"] for b in bilans)
+    print(f"{args.ecrivains} écrivains, {attendues} ajouts, {modifications} modifications "
+          f"({conflits} abandonnées sur conflit) en {duree:.1f} s")
+    print(f"lignes : {r['lignes']} (attendu {args.lignes + attendues}), ventes ajoutées retrouvées : "
+          f"{r['ajoutees']}/{attendues}, doublons : {r['doublons']}, révision : {r['revision']}")
+    print(f"agrégats : {r['agregat_lignes']} lignes, total {r['agregat_total']:.2f} "
+          f"(registre : {r['total']:.2f})")
+    ok = (r["lignes"] == args.lignes + attendues and r["ajoutees"] == attendues and not r["doublons"]
+          and r["agregat_lignes"] == r["lignes"] and abs(r["agregat_total"] - r["total"]) < 1e-6 * max(1.0, r["total"]))
+    print("OK" if ok else "ÉCHEC : des écritures ont été perdues")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Briques de données et de calcul de l'application Maison Saba Gestion."""
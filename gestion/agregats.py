@@ -0,0 +1,291 @@
+"""Agrégats matérialisés des registres pour les tableaux de bord.
+
+Pour chaque registre on tient à jour, en nombre de lignes et en somme du
+montant : le total, les totaux par jour, par mois et par dimension (produit,
+mode de paiement, catégorie...). Les agrégats sont enregistrés à côté des
+données (``agregats_ventes.json``) avec la version du registre
+(``donnees.version``) à partir de laquelle ils ont été calculés.
+
+- une nouvelle transaction passée par ``ajouter`` met à jour les totaux en
+  mémoire en O(1) (le fichier n'est réécrit qu'aux reconstructions et
+  modifications) ;
+- une modification ou suppression passée par ``modifier`` applique un delta
+  (ancienne ligne retirée, nouvelle ajoutée) ;
+- si le registre a changé par un autre chemin (version différente), tout est
+  recalculé une fois depuis le DataFrame, en vectorisé. C'est aussi le cas
+  quand un autre processus a écrit entre la lecture des agrégats et notre
+  écriture (la révision a avancé de plus d'un cran).
+
+``modifier_ligne`` modifie ou supprime une ligne lue plus tôt (formulaire) :
+si le registre a bougé entre-temps, la modification est rejouée sur les
+données à jour, sauf si la ligne elle-même a changé (``ConflitEcriture``).
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+from gestion import donnees, journal, profil
+
+# registre -> (colonne sommée, dimensions suivies)
+DIMENSIONS = {
+    "ventes": ("Total", ["Produit", "Mode de paiement"]),
+    "achats": ("Total", ["Catégorie", "Produit", "Fournisseur", "Mode de paiement"]),
+    "tresorerie": ("Montant", ["Type", "Catégorie", "Mode"]),
+}
+# Dimensions aussi suivies jour par jour (axe "jour|Produit", clé "AAAA-MM-JJ|produit")
+PAR_JOUR = {
+    "ventes": ["Produit"],
+    "achats": [],
+    "tresorerie": ["Type"],
+}
+# À incrémenter quand la structure des totaux change : force la reconstruction
+FORMAT = 2
+
+_agregats = {}
+_verrou = threading.RLock()
+_compteurs = {"reconstructions": 0, "deltas": 0, "conflits": 0}
+
+
+def _chemin(nom):
+    return os.path.join(donnees.DOSSIER, f"agregats_{nom}.json")
+
+
+class Agregat:
+    def __init__(self, nom, version, totaux):
+        self.nom = nom
+        self.version = version
+        # totaux[axe][cle] = [nombre de lignes, somme] ; axes : "total", "jour", "mois" + dimensions
+        self.totaux = totaux
+
+    @classmethod
+    def depuis_df(cls, nom, df, version):
+        valeur, dimensions = DIMENSIONS[nom]
+        totaux = {"total": {"": [len(df), float(df[valeur].sum())]}}
+        axes = {
+            "jour": df["Date"].dt.strftime("%Y-%m-%d"),
+            "mois": df["Date"].dt.strftime("%Y-%m"),
+        }
+        for dim in dimensions:
+            axes[dim] = df[dim].astype(object)
+        for dim in PAR_JOUR[nom]:
+            axes[f"jour|{dim}"] = axes["jour"] + "|" + df[dim].astype(str).where(df[dim].notna())
+        for axe, cles in axes.items():
+            groupes = df[valeur].groupby(cles, dropna=True)
+            nb, somme = groupes.size(), groupes.sum()
+            totaux[axe] = {str(k): [int(n), float(x)] for k, n, x in zip(nb.index, nb.to_numpy(), somme.to_numpy())}
+        return cls(nom, version, totaux)
+
+    def _cles(self, ligne):
+        date = pd.to_datetime(ligne.get("Date"), errors="coerce")
+        cles = {"total": ""}
+        if not pd.isna(date):
+            cles["jour"] = date.strftime("%Y-%m-%d")
+            cles["mois"] = date.strftime("%Y-%m")
+        for dim in DIMENSIONS[self.nom][1]:
+            v = ligne.get(dim)
+            if v is not None and not pd.isna(v) and v != "":
+                cles[dim] = str(v)
+                if dim in PAR_JOUR[self.nom] and "jour" in cles:
+                    cles[f"jour|{dim}"] = f"{cles['jour']}|{v}"
+        return cles
+
+    def appliquer(self, ligne, signe):
+        """Ajoute (signe=+1) ou retire (signe=-1) une ligne des totaux."""
+        montant = pd.to_numeric(ligne.get(DIMENSIONS[self.nom][0]), errors="coerce")
+        montant = 0.0 if pd.isna(montant) else float(montant)
+        for axe, cle in self._cles(ligne).items():
+            case = self.totaux.setdefault(axe, {}).setdefault(cle, [0, 0.0])
+            case[0] += signe
+            case[1] += signe * montant
+            if case[0] <= 0 and axe != "total":
+                del self.totaux[axe][cle]
+
+    # --- lecture -------------------------------------------------------------
+
+    def total(self):
+        nb, somme = self.totaux["total"].get("", [0, 0.0])
+        return nb, somme
+
+    def periode(self, axe, cle):
+        """(nombre, somme) pour un jour ("AAAA-MM-JJ") ou un mois ("AAAA-MM")."""
+        nb, somme = self.totaux.get(axe, {}).get(cle, [0, 0.0])
+        return nb, somme
+
+    def depuis(self, axe, debut):
+        """(nombre, somme) cumulés sur les clés de ``axe`` (jour ou mois) >= ``debut``."""
+        nb, somme = 0, 0.0
+        for cle, (n, x) in self.totaux.get(axe, {}).items():
+            if cle >= debut:
+                nb += n
+                somme += x
+        return nb, somme
+
+    def par_depuis(self, dim, debut):
+        """Somme par modalité de ``dim`` sur les jours >= ``debut`` (dimension de PAR_JOUR)."""
+        cumul = {}
+        for cle, (_, x) in self.totaux.get(f"jour|{dim}", {}).items():
+            jour, _, modalite = cle.partition("|")
+            if jour >= debut:
+                cumul[modalite] = cumul.get(modalite, 0.0) + x
+        serie = pd.Series(cumul, name=DIMENSIONS[self.nom][0], dtype="float64")
+        serie.index.name = dim
+        return serie.sort_values(ascending=False)
+
+    def par(self, axe):
+        """Somme par modalité de ``axe``, triée par ordre décroissant."""
+        valeur = DIMENSIONS[self.nom][0]
+        serie = pd.Series({k: v[1] for k, v in self.totaux.get(axe, {}).items()}, name=valeur, dtype="float64")
+        serie.index.name = axe
+        return serie.sort_values(ascending=False)
+
+    def sauvegarder(self):
+        contenu = json.dumps({"format": FORMAT, "version": self.version, "totaux": self.totaux}, ensure_ascii=False)
+
+        def ecrire(tmp):
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(contenu)
+        journal.remplacer_atomique(_chemin(self.nom), ecrire)
+
+
+def _depuis_disque(nom, version):
+    try:
+        with open(_chemin(nom), encoding="utf-8") as f:
+            contenu = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if contenu.get("version") != version or contenu.get("format") != FORMAT:
+        return None
+    return Agregat(nom, version, contenu["totaux"])
+
+
+def obtenir(nom):
+    """Agrégats à jour du registre ``nom`` (reconstruits seulement si le registre a changé)."""
+    version = donnees.version(nom)
+    with _verrou:
+        agregat = _agregats.get(nom)
+        if agregat is not None and agregat.version == version:
+            return agregat
+        with profil.mesure(f"agregats {nom}"):
+            agregat = _depuis_disque(nom, version)
+            if agregat is None:
+                agregat = Agregat.depuis_df(nom, donnees.charger(nom), version)
+                agregat.sauvegarder()
+                _compteurs["reconstructions"] += 1
+        _agregats[nom] = agregat
+        return agregat
+
+
+@contextmanager
+def verrouiller(nom):
+    """Verrou des agrégats puis du registre ``nom`` (bloc ``with``), dans l'ordre des écritures.
+
+    Pour lire le registre, calculer et écrire sans qu'une autre écriture (autre
+    thread ou autre processus) ne s'intercale.
+    """
+    with _verrou, donnees.verrouiller(nom) as verrou:
+        yield verrou
+
+
+def ajouter(nom, ligne):
+    """Enregistre une transaction dans le registre et met les agrégats à jour en O(1)."""
+    ajouter_lignes(nom, [ligne])
+
+
+def _suivre(agregat, nom, revision_avant, revision_apres):
+    # Une autre écriture s'est glissée (autre processus) : le delta ne suffit
+    # pas, la version n'est pas avancée et le prochain ``obtenir`` reconstruit
+    if revision_apres == revision_avant + 1:
+        agregat.version = donnees.version(nom)
+    else:
+        _agregats.pop(nom, None)
+
+
+def ajouter_lignes(nom, lignes):
+    """Comme ``ajouter``, pour plusieurs transactions écrites en une fois."""
+    with _verrou:
+        revision = donnees.revision(nom)
+        agregat = obtenir(nom)
+        apres = donnees.ajouter_lignes(nom, lignes)
+        for ligne in lignes:
+            agregat.appliquer(ligne, +1)
+        _suivre(agregat, nom, revision, apres)
+        _compteurs["deltas"] += len(lignes)
+
+
+def modifier(nom, df, ancienne=None, nouvelle=None, revision_lue=None):
+    """Compacte le registre avec ``df`` et corrige les agrégats par delta.
+
+    ``ancienne`` est la ligne retirée ou remplacée, ``nouvelle`` la ligne qui la
+    remplace (None pour une suppression). ``revision_lue`` : voir ``donnees.ecrire``.
+    """
+    with _verrou:
+        revision = donnees.revision(nom)
+        agregat = obtenir(nom)
+        apres = donnees.ecrire(nom, df, revision_lue)
+        if ancienne is not None:
+            agregat.appliquer(ancienne, -1)
+        if nouvelle is not None:
+            agregat.appliquer(nouvelle, +1)
+        _suivre(agregat, nom, revision, apres)
+        if nom in _agregats:
+            agregat.sauvegarder()
+        _compteurs["deltas"] += 1
+
+
+def _meme_ligne(nom, a, b):
+    return all(
+        (pd.isna(a[c]) and pd.isna(b[c])) or str(a[c]) == str(b[c])
+        for c in donnees.REGISTRES[nom]["colonnes"]
+    )
+
+
+class LigneModifiee(donnees.ConflitEcriture):
+    """La ligne à modifier n'est plus celle que l'utilisateur a vue : inutile de réessayer."""
+
+
+def modifier_ligne(nom, index, attendue, valeurs=None, essais=3):
+    """Remplace les ``valeurs`` (dict colonne -> valeur) de la ligne ``index``, ou la supprime (None).
+
+    ``attendue`` est la ligne telle que l'utilisateur l'a vue. Si le registre a
+    été écrit entre-temps, la modification est rejouée sur les données à jour
+    (le dernier essai sous le verrou du registre) tant que la ligne ``index``
+    est toujours ``attendue`` ; sinon ``ConflitEcriture``. Renvoie la ligne
+    écrite (None pour une suppression).
+    """
+    for essai in range(essais):
+        if essai == essais - 1:
+            # Dernier essai : registre verrouillé de la lecture à l'écriture, il aboutit
+            with verrouiller(nom):
+                return _modifier_ligne(nom, index, attendue, valeurs)
+        try:
+            return _modifier_ligne(nom, index, attendue, valeurs)
+        except LigneModifiee:
+            raise
+        except donnees.ConflitEcriture:
+            with _verrou:
+                _compteurs["conflits"] += 1
+
+
+def _modifier_ligne(nom, index, attendue, valeurs):
+    revision = donnees.revision(nom)
+    df = donnees.charger(nom)
+    if index not in df.index or not _meme_ligne(nom, df.loc[index], attendue):
+        raise LigneModifiee(f"{nom} : la ligne {index} a été modifiée ou supprimée par une autre session")
+    ancienne = df.loc[index]
+    if valeurs is None:
+        df, nouvelle = df.drop(index), None
+    else:
+        df = donnees.copie_modifiable(df)
+        for colonne, valeur in valeurs.items():
+            df.at[index, colonne] = valeur
+        nouvelle = df.loc[index]
+    modifier(nom, df, ancienne=ancienne, nouvelle=nouvelle, revision_lue=revision)
+    return nouvelle
+
+
+def stats():
+    with _verrou:
+        return dict(_compteurs)
@@ -0,0 +1,399 @@
+"""Relevés bancaires : import CSV / OFX, soldes quotidiens et pointage.
+
+- ``lire_csv`` et ``lire_ofx`` lisent le fichier au fil de l'eau et produisent
+  des morceaux de lignes normalisées (Date, Compte, Libellé, Montant signé,
+  Identifiant, Solde éventuel, Fin de relevé) ; un relevé de plusieurs années ne passe jamais
+  en entier en mémoire ;
+- ``importer`` ajoute les nouvelles lignes au registre ``releves_bancaires``
+  (une ligne déjà importée, reconnue à son identifiant, est ignorée) et les
+  soldes de fin de journée de chaque compte au registre ``soldes_bancaires`` ;
+- ``pointer`` associe chaque ligne de relevé à un mouvement de trésorerie de
+  même montant à quelques jours près, via un index montant -> dates : le coût
+  est quasi linéaire au lieu de comparer chaque ligne à chaque mouvement.
+"""
+import bisect
+import codecs
+import csv
+import hashlib
+import io
+import re
+import threading
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from gestion import donnees, profil
+
+TAILLE_MORCEAU = 10_000
+FENETRE_JOURS = 3
+
+# En-têtes reconnus dans les relevés CSV (sans accents, en minuscules)
+ALIAS = {
+    "Date": ["date", "date operation", "date d'operation", "date de l'operation", "date comptable", "booking date"],
+    "Libellé": ["libelle", "libelle operation", "description", "label", "intitule", "nature de l'operation"],
+    "Montant": ["montant", "amount", "montant (eur)", "montant eur"],
+    "Débit": ["debit", "debit (eur)", "debit eur"],
+    "Crédit": ["credit", "credit (eur)", "credit eur"],
+    "Solde": ["solde", "balance", "solde (eur)"],
+    "Identifiant": ["reference", "id", "identifiant", "fitid"],
+}
+
+_cache = {}
+_verrou = threading.Lock()
+
+
+def _normaliser(texte):
+    texte = unicodedata.normalize("NFKD", str(texte)).encode("ascii", "ignore").decode()
+    return " ".join(texte.strip().lower().split())
+
+
+def _nombre(serie, decimale):
+    """Montants texte (« 1 234,56 », « -12.5 », « 12,00 € ») -> float."""
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.astype("float64")
+    texte = serie.astype("string").str.replace(r"[\s €]", "", regex=True)
+    if decimale == ",":
+        texte = texte.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    else:
+        texte = texte.str.replace(",", "", regex=False)
+    return pd.to_numeric(texte, errors="coerce").astype("float64")
+
+
+_DECIMALE_VIRGULE = re.compile(r"\d,\d{1,2}$")
+_DECIMALE_POINT = re.compile(r"\d\.\d{1,2}$")
+
+
+def _decimale(brut):
+    """Séparateur décimal lu dans les montants et soldes eux-mêmes (« -12,50 » ou « -12.50 »).
+
+    None si aucune valeur ne permet de trancher (montants entiers) : le
+    morceau suivant décidera.
+    """
+    virgules = points = 0
+    for colonne in ("Montant", "Débit", "Crédit", "Solde"):
+        if colonne in brut:
+            valeurs = brut[colonne].dropna().astype(str).str.replace(r"[\s €]", "", regex=True)
+            virgules += int(valeurs.str.contains(_DECIMALE_VIRGULE).sum())
+            points += int(valeurs.str.contains(_DECIMALE_POINT).sum())
+    if virgules == points:
+        return None
+    return "," if virgules > points else "."
+
+
+def _identifiants(morceau, compte, vus):
+    """Identifiant stable des lignes sans identifiant bancaire : empreinte du contenu et rang d'apparition."""
+    ids = []
+    for date, libelle, montant in zip(morceau["Date"].dt.strftime("%Y-%m-%d").tolist(),
+                                      morceau["Libellé"].tolist(), morceau["Montant"].tolist()):
+        cle = f"{compte}|{date}|{montant:.2f}|{libelle}"
+        vus[cle] = vus.get(cle, 0) + 1
+        ids.append(hashlib.sha1(f"{cle}|{vus[cle]}".encode("utf-8")).hexdigest()[:16])
+    return ids
+
+
+def _completer_identifiants(morceau, identifiants, compte, vus):
+    """Identifiants bancaires du relevé, ou empreinte (``_identifiants``) pour les lignes qui n'en ont pas."""
+    if identifiants is None:
+        return _identifiants(morceau, compte, vus)
+    identifiants = identifiants.reindex(morceau.index).fillna("").astype(str).str.strip()
+    vides = (identifiants == "").to_numpy()
+    if vides.any():
+        identifiants = identifiants.copy()
+        identifiants[vides] = _identifiants(morceau[vides], compte, vus)
+    return identifiants
+
+
+def lire_csv(fichier, compte, taille=TAILLE_MORCEAU, encodage="utf-8-sig"):
+    """Lit un relevé CSV (fichier binaire ou texte) par morceaux de lignes normalisées.
+
+    Le séparateur décimal est déduit des montants (« 12,50 » ou « 12.50 »), quel
+    que soit le séparateur de champs ; à défaut, la virgule sauf pour un CSV
+    séparé par des virgules.
+    """
+    if not isinstance(fichier, io.TextIOBase):
+        fichier = io.TextIOWrapper(fichier, encoding=encodage, newline="")
+    entete = fichier.readline()
+    separateur = csv.Sniffer().sniff(entete, delimiters=";,\t|").delimiter
+    decimale, defaut = None, "," if separateur != "," else "."
+    noms = next(csv.reader([entete], delimiter=separateur))
+    correspondance = {}
+    for nom in noms:
+        for cible, alias in ALIAS.items():
+            if _normaliser(nom) in alias and cible not in correspondance.values():
+                correspondance[nom] = cible
+    if "Date" not in correspondance.values() or not (
+        "Montant" in correspondance.values() or {"Débit", "Crédit"} & set(correspondance.values())
+    ):
+        raise ValueError(f"Colonnes de relevé non reconnues : {', '.join(noms)}")
+
+    vus = {}
+    lecteur = pd.read_csv(fichier, sep=separateur, names=noms, header=None, dtype=str,
+                          chunksize=taille, skipinitialspace=True)
+    for brut in lecteur:
+        brut = brut.rename(columns=correspondance)
+        decimale = decimale or _decimale(brut)
+        morceau = pd.DataFrame({
+            "Date": pd.to_datetime(brut["Date"], dayfirst=True, errors="coerce"),
+            "Compte": compte,
+            "Libellé": brut["Libellé"].fillna("") if "Libellé" in brut else "",
+        })
+        if "Montant" in brut:
+            morceau["Montant"] = _nombre(brut["Montant"], decimale or defaut)
+        else:
+            debit = _nombre(brut["Débit"], decimale or defaut).abs() if "Débit" in brut else 0.0
+            credit = _nombre(brut["Crédit"], decimale or defaut).abs() if "Crédit" in brut else 0.0
+            morceau["Montant"] = pd.Series(credit, index=brut.index).fillna(0.0) - \
+                pd.Series(debit, index=brut.index).fillna(0.0)
+        morceau["Solde"] = _nombre(brut["Solde"], decimale or defaut) if "Solde" in brut else float("nan")
+        morceau = morceau[morceau["Date"].notna() & morceau["Montant"].notna()]
+        morceau["Identifiant"] = _completer_identifiants(
+            morceau, brut.loc[morceau.index, "Identifiant"] if "Identifiant" in brut else None, compte, vus)
+        morceau["Fin de relevé"] = False
+        yield morceau.reset_index(drop=True)
+
+
+_BALISE = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+
+
+def _jetons_ofx(fichier, taille_bloc=65536):
+    """(fermante, balise, valeur) du fichier OFX (SGML ou XML), bloc par bloc."""
+    if not isinstance(fichier, io.TextIOBase):
+        fichier = codecs.getreader("latin-1")(fichier)
+    reste = ""
+    while True:
+        bloc = fichier.read(taille_bloc)
+        texte = reste + bloc
+        if not bloc:
+            coupure = len(texte)
+        else:
+            # On garde la dernière balise, peut-être incomplète, pour le bloc suivant
+            coupure = max(texte.rfind("<"), 0)
+        for fermante, balise, valeur in _BALISE.findall(texte[:coupure]):
+            yield fermante == "/", balise.upper(), valeur.strip()
+        reste = texte[coupure:]
+        if not bloc:
+            return
+
+
+def _date_ofx(valeur):
+    return pd.to_datetime(valeur[:8], format="%Y%m%d", errors="coerce")
+
+
+def lire_ofx(fichier, compte=None, taille=TAILLE_MORCEAU):
+    """Lit un relevé OFX par morceaux ; le compte est celui du fichier (ACCTID) si ``compte`` est vide.
+
+    Le solde comptable de fin de relevé (LEDGERBAL) est porté par une dernière
+    ligne sans montant, marquée ``Fin de relevé`` ; ce n'est pas un mouvement.
+    """
+    lignes, transaction, solde, dans_solde, vus = [], None, {}, False, {}
+    compte_fichier = compte
+    for fermante, balise, valeur in _jetons_ofx(fichier):
+        if balise == "ACCTID" and not compte:
+            compte_fichier = valeur
+        elif balise == "STMTTRN":
+            if fermante and transaction is not None:
+                lignes.append(transaction)
+                transaction = None
+            elif not fermante:
+                transaction = {}
+        elif balise == "LEDGERBAL":
+            dans_solde = not fermante
+        elif transaction is not None and valeur:
+            transaction[balise] = valeur
+        elif dans_solde and valeur:
+            solde[balise] = valeur
+        if len(lignes) >= taille:
+            yield _morceau_ofx(lignes, compte_fichier, vus)
+            lignes = []
+    if lignes:
+        yield _morceau_ofx(lignes, compte_fichier, vus)
+    if "BALAMT" in solde:
+        yield pd.DataFrame({
+            "Date": [_date_ofx(solde.get("DTASOF", ""))], "Compte": [compte_fichier or ""],
+            "Libellé": ["Solde comptable"], "Montant": [0.0], "Identifiant": [""],
+            "Solde": [float(solde["BALAMT"].replace(",", "."))], "Fin de relevé": [True],
+        })
+
+
+def _morceau_ofx(lignes, compte, vus):
+    brut = pd.DataFrame(lignes)
+    libelles = brut.get("NAME", pd.Series("", index=brut.index)).fillna("")
+    if "MEMO" in brut:
+        libelles = (libelles + " " + brut["MEMO"].fillna("")).str.strip()
+    morceau = pd.DataFrame({
+        "Date": _date_ofx(brut["DTPOSTED"].astype(str).str[:8]) if "DTPOSTED" in brut else pd.NaT,
+        "Compte": compte or "",
+        "Libellé": libelles,
+        "Montant": pd.to_numeric(brut["TRNAMT"].str.replace(",", "."), errors="coerce"),
+        "Solde": float("nan"),
+        "Fin de relevé": False,
+    })
+    morceau["Identifiant"] = _completer_identifiants(morceau, brut.get("FITID"), compte or "", vus)
+    return morceau
+
+
+def _par_jour(lignes):
+    """Flux net et premier / dernier solde du fichier par compte et par jour."""
+    jours = lignes["Date"].dt.normalize().rename("Jour")
+    return lignes.groupby([lignes["Compte"].astype(object), jours]).agg(
+        Montant=("Montant", "sum"), Premier=("Solde", "first"), Dernier=("Solde", "last"))
+
+
+def soldes_quotidiens(par_jour, solde_final=None):
+    """Solde de fin de journée par compte, à partir des flux par jour (``_par_jour``).
+
+    Les soldes donnés ligne à ligne par le relevé priment ; sinon, si le solde
+    de fin de relevé est connu (``solde_final`` : {compte: (date, solde)}), les
+    soldes antérieurs en sont déduits en retranchant les mouvements suivants.
+    """
+    solde_final = solde_final or {}
+    resultats = []
+    for compte, df in par_jour.groupby(level=0):
+        df = df.droplevel(0).sort_index()
+        if df["Solde"].notna().any():
+            soldes = df["Solde"].dropna()
+        elif compte in solde_final:
+            date_finale, solde = solde_final[compte]
+            flux = df["Montant"]
+            flux = flux[flux.index <= date_finale]
+            # Solde du jour j = solde final - mouvements postérieurs à j
+            posterieurs = flux[::-1].cumsum()[::-1].shift(-1, fill_value=0.0)
+            soldes = solde - posterieurs
+            soldes.loc[pd.Timestamp(date_finale).normalize()] = solde
+        else:
+            continue
+        resultats.append(pd.DataFrame({"Date": soldes.index, "Compte": compte, "Solde": soldes.to_numpy()}))
+    if not resultats:
+        return pd.DataFrame(columns=["Date", "Compte", "Solde"])
+    return pd.concat(resultats, ignore_index=True)
+
+
+def importer(fichier, nom_fichier, compte=None):
+    """Importe un relevé ; renvoie (lignes ajoutées, lignes déjà connues, soldes enregistrés)."""
+    if nom_fichier.lower().endswith((".ofx", ".qfx")):
+        morceaux = lire_ofx(fichier, compte)
+    else:
+        if not compte:
+            raise ValueError("Indiquer le compte du relevé CSV")
+        morceaux = lire_csv(fichier, compte)
+
+    connus = set(donnees.charger("releves_bancaires")["Identifiant"].dropna().astype(str))
+    ajoutees, doublons, flux, solde_final = 0, 0, [], {}
+    premiere = derniere = None  # dates de la première et de la dernière ligne du fichier
+    for morceau in morceaux:
+        fin = morceau["Fin de relevé"].to_numpy(dtype=bool)
+        mouvements = morceau[~fin]
+        dates = mouvements["Date"].dropna()
+        if not dates.empty:
+            premiere = dates.iloc[0] if premiere is None else premiere
+            derniere = dates.iloc[-1]
+        for ligne in morceau[fin].itertuples():
+            solde_final[ligne.Compte] = (ligne.Date, ligne.Solde)
+        # Test d'appartenance en Python : isin recopierait tout l'ensemble à chaque morceau
+        nouvelles = mouvements[np.array([i not in connus for i in mouvements["Identifiant"].tolist()], dtype=bool)]
+        doublons += len(mouvements) - len(nouvelles)
+        connus.update(nouvelles["Identifiant"])
+        donnees.ajouter_lignes("releves_bancaires", [
+            {"Date": date, "Compte": compte_ligne, "Libellé": libelle, "Montant": montant, "Identifiant": ident}
+            for date, compte_ligne, libelle, montant, ident in zip(
+                nouvelles["Date"].dt.strftime("%Y-%m-%d").tolist(), nouvelles["Compte"].tolist(),
+                nouvelles["Libellé"].tolist(), nouvelles["Montant"].tolist(), nouvelles["Identifiant"].tolist())
+        ])
+        ajoutees += len(nouvelles)
+        # Pour les soldes, on ne garde qu'une ligne par compte et par jour
+        if not mouvements.empty:
+            flux.append(_par_jour(mouvements))
+
+    if flux:
+        par_jour = pd.concat(flux).groupby(level=[0, 1]).agg(
+            {"Montant": "sum", "Premier": "first", "Dernier": "last"})
+        # Solde de fin de journée : la dernière ligne du jour dans un relevé chronologique,
+        # la première dans un relevé du plus récent au plus ancien
+        recents_d_abord = premiere > derniere
+        par_jour["Solde"] = par_jour["Premier" if recents_d_abord else "Dernier"]
+        soldes = soldes_quotidiens(par_jour, solde_final)
+    else:
+        soldes = pd.DataFrame(columns=["Date", "Compte", "Solde"])
+    donnees.ajouter_lignes("soldes_bancaires", [
+        {"Date": ligne["Date"].strftime("%Y-%m-%d"), "Compte": ligne["Compte"], "Solde": ligne["Solde"],
+         "Origine": "Relevé"}
+        for ligne in soldes.to_dict("records")
+    ])
+    return ajoutees, doublons, len(soldes)
+
+
+@profil.mesure("banque.series_soldes")
+def series_soldes(frequence=None):
+    """Soldes par compte en série temporelle (index = dates triées, une colonne par compte).
+
+    Une même date saisie plusieurs fois garde la dernière valeur. Avec
+    ``frequence`` ("ME" pour les fins de mois), le dernier solde connu de chaque période.
+    """
+    df = donnees.charger("soldes_bancaires")
+    df = df[df["Date"].notna()]
+    series = (df.assign(Compte=df["Compte"].astype(object))
+              .drop_duplicates(["Date", "Compte"], keep="last")
+              .pivot(index="Date", columns="Compte", values="Solde")
+              .sort_index())
+    if frequence is not None and not series.empty:
+        series = series.resample(frequence).last()
+    return series
+
+
+@profil.mesure("banque.pointer")
+def pointer(fenetre=FENETRE_JOURS):
+    """Associe chaque ligne de relevé à un mouvement de trésorerie (même montant, dates à ``fenetre`` jours près).
+
+    Chaque ligne et chaque mouvement ne sont pointés qu'une fois : les paires
+    possibles sont retenues de la plus proche en date à la plus éloignée (à
+    écart égal, dans l'ordre du relevé). Renvoie les lignes de relevé avec la position du mouvement
+    trouvé (``Mouvement``, -1 si aucun) ; gardé en cache tant que ni les relevés
+    ni la trésorerie ne changent.
+    """
+    cle = (donnees.version("releves_bancaires"), donnees.version("tresorerie"), fenetre)
+    with _verrou:
+        if cle in _cache:
+            return _cache[cle]
+
+    releves = donnees.charger("releves_bancaires")
+    treso = donnees.charger("tresorerie")
+    signe = treso["Type"].astype(object).map({"Entrée": 1, "Sortie": -1}).fillna(0).to_numpy()
+    centimes = (treso["Montant"].fillna(0.0).to_numpy() * 100).round().astype("int64") * signe
+    jours = treso["Date"].to_numpy().astype("datetime64[D]").astype("int64")
+    dates_valides = treso["Date"].notna().to_numpy()
+
+    # Index : montant en centimes -> (jours triés, positions dans la trésorerie)
+    index = {}
+    for position in np.argsort(jours, kind="stable"):
+        if not dates_valides[position]:
+            continue
+        entree = index.setdefault(centimes[position], ([], []))
+        entree[0].append(jours[position])
+        entree[1].append(position)
+
+    # Paires (écart en jours, ligne de relevé, mouvement) dans la fenêtre
+    paires = []
+    montants_releve = (releves["Montant"].fillna(0.0).to_numpy() * 100).round().astype("int64")
+    jours_releve = releves["Date"].to_numpy().astype("datetime64[D]").astype("int64")
+    for ligne, (montant, jour, valide) in enumerate(
+            zip(montants_releve, jours_releve, releves["Date"].notna().to_numpy())):
+        candidats = index.get(montant) if valide else None
+        if candidats is not None:
+            debut = bisect.bisect_left(candidats[0], jour - fenetre)
+            fin = bisect.bisect_right(candidats[0], jour + fenetre)
+            paires.extend((abs(candidats[0][i] - jour), ligne, candidats[1][i]) for i in range(debut, fin))
+    paires.sort()
+
+    pris = set()
+    resultats = [-1] * len(releves)
+    for _, ligne, position in paires:
+        if resultats[ligne] == -1 and position not in pris:
+            resultats[ligne] = position
+            pris.add(position)
+
+    pointage = releves.assign(Mouvement=resultats)
+    with _verrou:
+        _cache.clear()
+        _cache[cle] = pointage
+    return pointage
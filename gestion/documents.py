@@ -0,0 +1,213 @@
+"""Documents de configuration : plats, seuils de stock, recettes, employés, planning.
+
+Contrairement aux registres (lignes ajoutées au fil de l'eau, voir
+``gestion.donnees``), ce sont de petits dictionnaires imbriqués modifiés en
+entier ou clé par clé. Chacun est un fichier JSON dans le dossier des données
+(``plats.json``...), décrit par un schéma dans ``DOCUMENTS`` :
+
+- ``float``, ``str`` : valeur simple, convertie à l'écriture ;
+- ``{"champ": type, ...}`` : fiche aux champs nommés (tous facultatifs, les
+  champs inconnus sont conservés tels quels) ;
+- ``{str: type}`` : dictionnaire libre (nom -> valeur).
+
+Un document invalide n'est pas écrit (``DocumentInvalide``). La lecture est
+en cache par (mtime, taille) du fichier : le dict renvoyé par ``charger`` est
+partagé et ne doit pas être modifié sur place ; les modifications passent par
+``mettre``, ``supprimer``, ``modifier`` ou ``remplacer``, qui relisent le
+fichier sous son verrou (``gestion.verrous``) puis le réécrivent
+atomiquement. ``orjson`` est utilisé s'il est installé, sinon ``json``.
+"""
+import copy
+import json
+import os
+import threading
+
+from gestion import donnees, journal, profil, verrous
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FICHE_EMPLOYE = {
+    "contrat": str,
+    "taux_horaire": float,
+    "heures_semaine": float,
+    "heures_mois": float,
+    "heures_supp": float,
+    "prime": float,
+    "pointage": str,
+    "absences": str,
+}
+
+DOCUMENTS = {
+    # plat -> prix de vente
+    "plats": {"fichier": "plats.json", "schema": {str: float},
+              "defaut": {"Brioche perdue": 8.0, "Cookie pistache": 3.5}},
+    # ingrédient -> seuil d'alerte (les quantités viennent de gestion/stock.py)
+    "stock": {"fichier": "stock.json", "schema": {str: {"seuil": float}}},
+    "recettes": {"fichier": "recettes.json",
+                 "schema": {str: {"duree": str, "ingredients": {str: float}, "etapes": str}}},
+    "employes": {"fichier": "employes.json", "schema": {str: FICHE_EMPLOYE}},
+    # jour -> employé -> plage horaire (voir gestion/planning.py)
+    "planning": {"fichier": "planning.json", "schema": {str: {str: str}}},
+}
+
+_cache = {}
+_verrou = threading.Lock()
+_compteurs = {"hits": 0, "lectures": 0, "ecritures": 0}
+
+
+class DocumentInvalide(ValueError):
+    """Le contenu ne respecte pas le schéma du document."""
+
+
+def chemin(nom):
+    return os.path.join(donnees.DOSSIER, DOCUMENTS[nom]["fichier"])
+
+
+def _chemin_verrou(nom):
+    return os.path.splitext(chemin(nom))[0] + ".lock"
+
+
+# --- schémas -----------------------------------------------------------------
+
+def _est_dictionnaire_libre(schema):
+    return isinstance(schema, dict) and len(schema) == 1 and next(iter(schema)) is str
+
+
+def _valider(valeur, schema, ou):
+    if schema is float:
+        if isinstance(valeur, bool):
+            raise DocumentInvalide(f"{ou} : nombre attendu, {valeur!r} reçu")
+        try:
+            return float(valeur or 0)
+        except (TypeError, ValueError):
+            raise DocumentInvalide(f"{ou} : nombre attendu, {valeur!r} reçu") from None
+    if schema is str:
+        if isinstance(valeur, (dict, list)):
+            raise DocumentInvalide(f"{ou} : texte attendu, {type(valeur).__name__} reçu")
+        return "" if valeur is None else str(valeur)
+    if not isinstance(valeur, dict):
+        raise DocumentInvalide(f"{ou} : dictionnaire attendu, {type(valeur).__name__} reçu")
+    if _est_dictionnaire_libre(schema):
+        sous_schema = schema[str]
+        return {str(cle): _valider(v, sous_schema, f"{ou}[{cle!r}]") for cle, v in valeur.items()}
+    return {
+        cle: _valider(v, schema[cle], f"{ou}.{cle}") if cle in schema else v
+        for cle, v in valeur.items()
+    }
+
+
+def valider(nom, contenu):
+    """Contenu converti selon le schéma de ``nom`` ; ``DocumentInvalide`` sinon."""
+    return _valider(contenu, DOCUMENTS[nom]["schema"], nom)
+
+
+# --- lecture / écriture ------------------------------------------------------
+
+def _decoder(octets):
+    return orjson.loads(octets) if orjson is not None else json.loads(octets.decode("utf-8"))
+
+
+def _encoder(contenu):
+    if orjson is not None:
+        return orjson.dumps(contenu, option=orjson.OPT_INDENT_2)
+    return json.dumps(contenu, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def _cle(path):
+    try:
+        infos = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (infos.st_mtime_ns, infos.st_size)
+
+
+def _lire(nom):
+    path = chemin(nom)
+    cle = _cle(path)
+    with _verrou:
+        entree = _cache.get(nom)
+        if entree is not None and entree[0] == cle:
+            _compteurs["hits"] += 1
+            return entree[1]
+    if cle is None:
+        contenu = copy.deepcopy(DOCUMENTS[nom].get("defaut", {}))
+    else:
+        with open(path, "rb") as f:
+            octets = f.read()
+        profil.octets(nom, lus=len(octets))
+        contenu = valider(nom, _decoder(octets))
+    with _verrou:
+        _compteurs["lectures"] += 1
+        _cache[nom] = (cle, contenu)
+    return contenu
+
+
+def charger(nom):
+    """Document ``nom`` (dict partagé, à ne pas modifier sur place)."""
+    return _lire(nom)
+
+
+def version(nom):
+    """Empreinte du document sur disque (None s'il n'existe pas) : change à chaque écriture."""
+    return _cle(chemin(nom))
+
+
+def obtenir(nom, cle, defaut=None):
+    """Entrée ``cle`` du document ``nom`` (une recette, une fiche employé...)."""
+    return _lire(nom).get(cle, defaut)
+
+
+def _ecrire(nom, contenu):
+    octets = _encoder(contenu)
+
+    def ecrire(tmp):
+        with open(tmp, "wb") as f:
+            f.write(octets)
+    journal.remplacer_atomique(chemin(nom), ecrire)
+    profil.octets(nom, ecrits=len(octets))
+    with _verrou:
+        _compteurs["ecritures"] += 1
+        _cache[nom] = (_cle(chemin(nom)), contenu)
+
+
+def modifier(nom, fonction):
+    """Applique ``fonction(contenu)`` au document relu sous verrou, puis l'écrit.
+
+    ``fonction`` modifie la copie reçue sur place ou renvoie le nouveau
+    contenu. Deux sessions qui modifient le même document en même temps
+    s'enchaînent sans perdre la modification de l'autre.
+    """
+    with verrous.verrouiller(_chemin_verrou(nom)) as verrou:
+        contenu = copy.deepcopy(_lire(nom))
+        resultat = fonction(contenu)
+        contenu = valider(nom, contenu if resultat is None else resultat)
+        _ecrire(nom, contenu)
+        verrou.incrementer()
+    return contenu
+
+
+def mettre(nom, cle, valeur):
+    """Ajoute ou remplace l'entrée ``cle`` du document ``nom``."""
+    def fonction(contenu):
+        contenu[cle] = valeur
+    return modifier(nom, fonction)
+
+
+def supprimer(nom, cle):
+    """Retire l'entrée ``cle`` du document ``nom`` (sans erreur si elle n'existe pas)."""
+    def fonction(contenu):
+        contenu.pop(cle, None)
+    return modifier(nom, fonction)
+
+
+def remplacer(nom, contenu):
+    """Réécrit tout le document ``nom``."""
+    return modifier(nom, lambda _: contenu)
+
+
+def stats():
+    with _verrou:
+        return dict(_compteurs, documents=len(_cache))
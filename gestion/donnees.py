@@ -0,0 +1,391 @@
+"""Accès partagé aux registres (ventes, achats, trésorerie, stock, paie, banque).
+
+Chaque registre est lu et typé une seule fois par processus serveur. L'entrée
+du cache est indexée sur (chemin, mtime, taille) : tant que le fichier ne
+bouge pas, tous les modules reçoivent le même DataFrame sans retoucher le
+disque. Le DataFrame renvoyé est partagé, il ne faut donc pas le modifier sur
+place (faire un ``.copy()`` avant toute édition).
+
+Les nouvelles lignes sont ajoutées au journal du registre (``ventes.journal.csv``
+à côté de ``ventes.csv``) ; la lecture fusionne le fichier de base, gardé en
+cache, avec la fin du journal, lue de façon incrémentale.
+
+Le format du fichier de base (CSV ou Parquet) est fourni par
+``gestion.stockage`` ; les types (dates, nombres, catégories) sont décrits ici
+pour chaque registre et appliqués quel que soit le format. Avec
+``MAISON_SABA_STOCKAGE=sqlite``, les registres vivent dans une base SQLite
+(``gestion.registre_sql``) et il n'y a plus ni fichier de base ni journal.
+
+Toutes les écritures passent sous le verrou du registre (``gestion.verrous``)
+et incrémentent sa révision. ``ecrire`` accepte la révision lue avant la
+modification : si quelqu'un a écrit entre-temps, ``ConflitEcriture`` est
+levée au lieu d'écraser ses lignes.
+"""
+import os
+import threading
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from gestion import journal, profil, registre_sql, stockage, verrous
+from gestion.verrous import ConflitEcriture  # noqa: F401 (réexportée)
+
+# Dossier des fichiers de données (par défaut : dossier courant, comme avant)
+DOSSIER = os.environ.get("MAISON_SABA_DONNEES", ".")
+
+REGISTRES = {
+    "ventes": {
+        "fichier": "ventes.csv",
+        "colonnes": ["Date", "Produit", "Quantité", "Prix unitaire", "Total", "Mode de paiement"],
+        "numeriques": ["Quantité", "Prix unitaire", "Total"],
+        "categories": ["Produit", "Mode de paiement"],
+    },
+    "achats": {
+        "fichier": "achats.csv",
+        "colonnes": [
+            "Date", "Fournisseur", "Produit", "Quantité", "Unité",
+            "Prix unitaire", "Total", "Mode de paiement", "Catégorie"
+        ],
+        "numeriques": ["Quantité", "Prix unitaire", "Total"],
+        "categories": ["Fournisseur", "Unité", "Mode de paiement", "Catégorie"],
+    },
+    "tresorerie": {
+        "fichier": "tresorerie.csv",
+        # Référence : identifiant de la transaction d'origine pour les mouvements
+        # déduits des ventes, achats et paies (gestion/rapprochement.py), vide sinon
+        "colonnes": ["Date", "Libellé", "Type", "Montant", "Mode", "Catégorie", "Référence"],
+        "numeriques": ["Montant"],
+        "categories": ["Type", "Mode", "Catégorie"],
+    },
+    # Inventaires et ajustements manuels ; achats et ventes sont lus dans leurs propres registres
+    "mouvements_stock": {
+        "fichier": "mouvements_stock.csv",
+        "colonnes": ["Date", "Ingrédient", "Type", "Quantité", "Motif"],
+        "numeriques": ["Quantité"],
+        "categories": ["Ingrédient", "Type"],
+    },
+    # Paies validées, une ligne par employé et par mois (datée du dernier jour du mois)
+    "paie": {
+        "fichier": "paie.csv",
+        "colonnes": ["Date", "Employé", "Heures", "Heures supp", "Prime", "Brut", "Cotisation", "Net à payer"],
+        "numeriques": ["Heures", "Heures supp", "Prime", "Brut", "Cotisation", "Net à payer"],
+        "categories": ["Employé"],
+    },
+    # Lignes des relevés bancaires importés (gestion/banque.py) ; Montant signé
+    "releves_bancaires": {
+        "fichier": "releves_bancaires.csv",
+        "colonnes": ["Date", "Compte", "Libellé", "Montant", "Identifiant"],
+        "numeriques": ["Montant"],
+        "categories": ["Compte"],
+    },
+    # Soldes de fin de journée par compte, saisis ou déduits des relevés
+    "soldes_bancaires": {
+        "fichier": "soldes_bancaires.csv",
+        "colonnes": ["Date", "Compte", "Solde", "Origine"],
+        "numeriques": ["Solde"],
+        "categories": ["Compte", "Origine"],
+    },
+}
+
+FORMAT = stockage.depuis_env()
+SQL = None
+if os.environ.get("MAISON_SABA_STOCKAGE", "csv").lower() == "sqlite":
+    SQL = registre_sql.RegistreSQLite(os.path.join(DOSSIER, "maison_saba.db"), REGISTRES)
+
+_cache = {}
+_abonnes = []
+_verrou = threading.Lock()
+# Un verrou de chargement par registre : deux threads qui demandent le même registre
+# pas encore en cache (page, préchauffage, indicateurs) ne le lisent qu'une fois
+_chargements = {nom: threading.Lock() for nom in REGISTRES}
+_compteurs = {"hits": 0, "misses": 0, "lectures_base": 0, "lectures_journal": 0}
+
+
+def chemin_csv(nom):
+    return os.path.join(DOSSIER, REGISTRES[nom]["fichier"])
+
+
+def chemin(nom):
+    """Fichier de base du registre, dans le format de stockage actif."""
+    racine, _ = os.path.splitext(chemin_csv(nom))
+    return racine + FORMAT.extension
+
+
+def chemin_journal(nom):
+    racine, ext = os.path.splitext(chemin_csv(nom))
+    return f"{racine}.journal{ext}"
+
+
+def chemin_verrou(nom):
+    racine, _ = os.path.splitext(chemin_csv(nom))
+    return racine + ".lock"
+
+
+def _cle(path):
+    try:
+        infos = os.stat(path)
+    except FileNotFoundError:
+        return (path, None, None)
+    return (path, infos.st_mtime_ns, infos.st_size)
+
+
+def _typer(nom, df):
+    with profil.mesure(f"typage {nom}"):
+        return _typer_colonnes(nom, df)
+
+
+def _typer_colonnes(nom, df):
+    schema = REGISTRES[nom]
+    # Colonne ajoutée au schéma après coup : absente des anciens fichiers
+    for col in schema["colonnes"]:
+        if col not in df.columns:
+            df[col] = pd.Series(pd.NA, index=df.index, dtype="object")
+    df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
+    for col in schema["numeriques"]:
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+    for col in schema["categories"]:
+        if not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+    return df
+
+
+def _concat(avant, suite):
+    # pd.concat repasse en object les catégories qui diffèrent : on les fusionne
+    df = pd.concat([avant, suite], ignore_index=True)
+    for col in avant.columns:
+        if isinstance(avant[col].dtype, pd.CategoricalDtype):
+            try:
+                df[col] = union_categoricals([avant[col], suite[col]])
+            except TypeError:
+                # Catégories de types différents (colonne vide d'un côté...)
+                df[col] = df[col].astype("category")
+    return df
+
+
+def _lire(nom, path):
+    colonnes = REGISTRES[nom]["colonnes"]
+    if os.path.exists(path):
+        profil.octets(nom, lus=os.path.getsize(path))
+        with profil.mesure(f"lecture {nom}"):
+            df = FORMAT.lire(path)
+        return _typer(nom, df)
+    if FORMAT.nom != "csv" and os.path.exists(chemin_csv(nom)):
+        # Premier lancement avec un nouveau format : migration de l'ancien CSV
+        return stockage.migrer_csv(chemin_csv(nom), path, FORMAT, lambda df: _typer(nom, df))
+    return _typer(nom, pd.DataFrame(columns=colonnes))
+
+
+def _lire_journal(nom, precedent):
+    """Complète le journal déjà lu (``precedent`` = (df, position)) avec les nouvelles lignes."""
+    path = chemin_journal(nom)
+    colonnes = REGISTRES[nom]["colonnes"]
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=colonnes), 0
+    df_avant, position = precedent if precedent is not None else (None, 0)
+    if os.path.getsize(path) < position:
+        df_avant, position = None, 0
+    avant = position
+    with profil.mesure(f"lecture {nom}"):
+        suite, position = journal.lire_suite(path, colonnes, position)
+    profil.octets(nom, lus=position - avant)
+    suite = _typer(nom, suite)
+    if df_avant is None or df_avant.empty:
+        return suite, position
+    if suite.empty:
+        return df_avant, position
+    return _concat(df_avant, suite), position
+
+
+def charger(nom):
+    """Renvoie le DataFrame typé du registre ``nom`` (depuis le cache si possible)."""
+    with profil.mesure(f"charger {nom}"), _chargements[nom]:
+        if SQL is not None:
+            return _charger_sql(nom)
+        return _charger_fichiers(nom)
+
+
+def _charger_sql(nom):
+    cle = SQL.version(nom)
+    with _verrou:
+        fusion = _cache.get(nom, {}).get("fusion")
+        if fusion is not None and fusion[0] == cle:
+            _compteurs["hits"] += 1
+            return fusion[1]
+        _compteurs["misses"] += 1
+        _compteurs["lectures_base"] += 1
+    df = _typer(nom, SQL.lire(nom))
+    with _verrou:
+        _cache[nom] = {"fusion": (cle, df)}
+    return df
+
+
+def _migrer_vers_sql():
+    # Premier lancement en SQLite : reprise des CSV (base + journal) existants
+    for nom in REGISTRES:
+        fichiers = [p for p in (chemin(nom), chemin_journal(nom)) if os.path.exists(p)]
+        if not fichiers or SQL.version(nom) > 0:
+            continue
+        SQL.remplacer(nom, _charger_fichiers(nom))
+        for p in fichiers:
+            os.replace(p, p + ".bak")
+    invalider()
+
+
+def _charger_fichiers(nom):
+    cle = (_cle(chemin(nom)), _cle(chemin_journal(nom)))
+    with _verrou:
+        entree = _cache.get(nom, {})
+        fusion = entree.get("fusion")
+        if fusion is not None and fusion[0] == cle:
+            _compteurs["hits"] += 1
+            return fusion[1]
+        _compteurs["misses"] += 1
+        base = entree.get("base")
+        suite = entree.get("journal")
+
+    if base is None or base[0] != cle[0]:
+        # Base modifiée (compaction, y compris par un autre processus) : on relit tout
+        base = (cle[0], _lire(nom, chemin(nom)))
+        suite = None
+        with _verrou:
+            _compteurs["lectures_base"] += 1
+    if suite is None or suite[0] != cle[1]:
+        df_journal, position = _lire_journal(nom, suite[1] if suite is not None else None)
+        suite = (cle[1], (df_journal, position))
+        with _verrou:
+            _compteurs["lectures_journal"] += 1
+
+    df_base, df_journal = base[1], suite[1][0]
+    if df_journal.empty:
+        df = df_base
+    elif df_base.empty:
+        df = df_journal
+    else:
+        df = _concat(df_base, df_journal)
+    with _verrou:
+        _cache[nom] = {"base": base, "journal": suite, "fusion": (cle, df)}
+    return df
+
+
+def abonner(fonction):
+    """Enregistre ``fonction(nom)``, appelée après chaque écriture d'un registre."""
+    if fonction not in _abonnes:
+        _abonnes.append(fonction)
+
+
+def _notifier(nom):
+    for fonction in list(_abonnes):
+        fonction(nom)
+
+
+def version(nom):
+    """Empreinte du registre sur disque : change à chaque écriture, d'où qu'elle vienne."""
+    if SQL is not None:
+        return f"sql:{SQL.version(nom)}"
+    return "|".join(f"{mtime}-{taille}" for _, mtime, taille in (_cle(chemin(nom)), _cle(chemin_journal(nom))))
+
+
+def generation(nom):
+    """Change seulement quand le registre est réécrit (compaction) : tant qu'elle est
+    identique, les lignes déjà lues n'ont pas bougé et seules des lignes ont été ajoutées."""
+    if SQL is not None:
+        return f"sql:{SQL.generation(nom)}"
+    _, mtime, taille = _cle(chemin(nom))
+    return f"{mtime}-{taille}"
+
+
+def verrouiller(nom):
+    """Verrou exclusif du registre ``nom`` entre processus (bloc ``with``), pris par chaque écriture.
+
+    Le prendre autour de ``charger`` + ``ecrire`` garantit qu'aucune écriture ne
+    s'intercale ; le garder court, les autres sessions attendent.
+    """
+    return verrous.verrouiller(chemin_verrou(nom))
+
+
+def revision(nom):
+    """Compteur d'écritures du registre : à lire *avant* ``charger`` pour une modification."""
+    if SQL is not None:
+        return SQL.version(nom)
+    return verrous.revision(chemin_verrou(nom))
+
+
+def ajouter(nom, ligne):
+    """Ajoute une transaction (dict colonne -> valeur) au journal du registre ``nom``.
+
+    Coût constant : une ligne écrite et synchronisée, sans relire ni réécrire l'historique.
+    """
+    ajouter_lignes(nom, [ligne])
+
+
+def ajouter_lignes(nom, lignes):
+    """Ajoute plusieurs transactions d'un coup (une seule écriture synchronisée).
+
+    Renvoie la révision du registre après l'écriture.
+    """
+    if not lignes:
+        return revision(nom)
+    with verrouiller(nom) as verrou:
+        if SQL is not None:
+            nouvelle = SQL.ajouter_lignes(nom, lignes)
+        else:
+            taille = journal.ajouter_lignes(chemin_journal(nom), REGISTRES[nom]["colonnes"], lignes)
+            profil.octets(nom, ecrits=taille)
+            nouvelle = verrou.incrementer()
+    if SQL is None:
+        with _verrou:
+            _cache.get(nom, {}).pop("fusion", None)
+    _notifier(nom)
+    return nouvelle
+
+
+def ecrire(nom, df, revision_lue=None):
+    """Compacte le registre ``nom`` : réécrit la base avec ``df`` puis vide le journal.
+
+    À réserver aux modifications et suppressions ; ``df`` doit contenir tout le
+    registre (base + journal), tel que renvoyé par ``charger``. Avec
+    ``revision_lue`` (``revision(nom)`` lue avant ``charger``), lève
+    ``ConflitEcriture`` si le registre a changé depuis. Renvoie la nouvelle révision.
+    """
+    with verrouiller(nom) as verrou:
+        if SQL is not None:
+            nouvelle = SQL.remplacer(nom, df, revision_lue)
+        else:
+            if revision_lue is not None and verrou.revision != revision_lue:
+                raise ConflitEcriture(f"{nom} : révision {verrou.revision}, modification lue à la révision {revision_lue}")
+            FORMAT.remplacer(chemin(nom), _typer(nom, df.copy()))
+            profil.octets(nom, ecrits=os.path.getsize(chemin(nom)))
+            if os.path.exists(chemin_journal(nom)):
+                os.remove(chemin_journal(nom))
+            nouvelle = verrou.incrementer()
+    invalider(nom)
+    _notifier(nom)
+    return nouvelle
+
+
+def copie_modifiable(df):
+    """Copie de ``df`` où les catégories redeviennent du texte, pour l'éditer cellule par cellule."""
+    df = df.copy()
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(object)
+    return df
+
+
+def invalider(nom=None):
+    """Supprime l'entrée ``nom`` du cache (ou tout le cache si ``nom`` est None)."""
+    with _verrou:
+        if nom is None:
+            _cache.clear()
+        else:
+            _cache.pop(nom, None)
+
+
+def stats_cache():
+    """Compteurs hits/misses depuis le démarrage du processus."""
+    with _verrou:
+        return dict(_compteurs, entrees=len(_cache))
+
+
+if SQL is not None:
+    _migrer_vers_sql()
@@ -0,0 +1,100 @@
+"""Export des historiques (CSV, CSV gzip, Excel), généré seulement au clic.
+
+Les lignes sont lues par morceaux de ``TAILLE_MORCEAU`` (en SQL avec
+``LIMIT``/``OFFSET`` sur SQLite, par tranches du DataFrame en cache sinon) et
+écrites au fil de l'eau dans un fichier temporaire : la mémoire utilisée
+dépend de la taille d'un morceau, pas de celle de l'historique. Streamlit lit
+ensuite le fichier produit pour le servir (compressé avec ``csv.gz``).
+
+L'Excel demande openpyxl (classeur en écriture seule, ligne par ligne).
+"""
+import gzip
+import importlib.util
+import tempfile
+
+import pandas as pd
+
+from gestion import donnees, requetes
+from gestion.registre_sql import _q
+
+TAILLE_MORCEAU = 50_000
+
+FORMATS = {"csv": "text/csv", "csv.gz": "application/gzip"}
+if importlib.util.find_spec("openpyxl") is not None:
+    FORMATS["xlsx"] = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def morceaux(nom, debut=None, fin=None, colonnes=None, taille=TAILLE_MORCEAU):
+    """Lignes du registre ``nom`` sur ``[debut, fin[``, par DataFrames d'au plus ``taille`` lignes."""
+    colonnes = list(colonnes or donnees.REGISTRES[nom]["colonnes"])
+    if donnees.SQL is not None:
+        where, params = requetes._where(debut, fin)
+        # Reprise après le dernier rowid lu plutôt qu'un OFFSET, qui relirait tout le début
+        sql = (f"SELECT rowid, {', '.join(_q(c) for c in colonnes)} FROM {_q(nom)} "
+               f"{where} {'AND' if where else 'WHERE'} rowid > ? ORDER BY rowid LIMIT ?")
+        dernier = 0
+        while True:
+            morceau = pd.read_sql_query(sql, donnees.SQL.connexion(), params=[*params, dernier, taille])
+            if morceau.empty:
+                return
+            dernier = int(morceau["rowid"].iloc[-1])
+            yield morceau.drop(columns="rowid")
+    else:
+        df = donnees.charger(nom)
+        masque = pd.Series(True, index=df.index)
+        if debut is not None:
+            masque &= df["Date"] >= pd.Timestamp(debut)
+        if fin is not None:
+            masque &= df["Date"] < pd.Timestamp(fin)
+        positions = masque.to_numpy().nonzero()[0]
+        for i in range(0, len(positions), taille):
+            yield df.iloc[positions[i:i + taille]][colonnes]
+
+
+def lignes_csv(nom, debut=None, fin=None, colonnes=None, taille=TAILLE_MORCEAU):
+    """Le CSV (UTF-8) de l'export, morceau par morceau, en-tête compris."""
+    colonnes = list(colonnes or donnees.REGISTRES[nom]["colonnes"])
+    yield pd.DataFrame(columns=colonnes).to_csv(index=False).encode("utf-8")
+    for morceau in morceaux(nom, debut, fin, colonnes, taille):
+        if "Date" in morceau:
+            morceau = morceau.assign(Date=pd.to_datetime(morceau["Date"], errors="coerce").dt.strftime("%Y-%m-%d"))
+        yield morceau.to_csv(index=False, header=False).encode("utf-8")
+
+
+def _xlsx(nom, debut, fin, colonnes, taille, fichier):
+    from openpyxl import Workbook
+
+    classeur = Workbook(write_only=True)
+    feuille = classeur.create_sheet(nom)
+    feuille.append(colonnes)
+    for morceau in morceaux(nom, debut, fin, colonnes, taille):
+        if "Date" in morceau:
+            morceau = morceau.assign(Date=pd.to_datetime(morceau["Date"], errors="coerce").dt.date)
+        for ligne in morceau.astype(object).where(morceau.notna(), None).itertuples(index=False):
+            feuille.append(list(ligne))
+    classeur.save(fichier)
+
+
+def exporter(nom, format_export="csv", debut=None, fin=None, colonnes=None, taille=TAILLE_MORCEAU):
+    """Écrit l'export dans un fichier temporaire et le renvoie ouvert, prêt à être lu."""
+    colonnes = list(colonnes or donnees.REGISTRES[nom]["colonnes"])
+    fichier = tempfile.TemporaryFile()
+    if format_export == "xlsx":
+        _xlsx(nom, debut, fin, colonnes, taille, fichier)
+    elif format_export == "csv.gz":
+        with gzip.GzipFile(fileobj=fichier, mode="wb") as sortie:
+            for bloc in lignes_csv(nom, debut, fin, colonnes, taille):
+                sortie.write(bloc)
+    elif format_export == "csv":
+        for bloc in lignes_csv(nom, debut, fin, colonnes, taille):
+            fichier.write(bloc)
+    else:
+        raise ValueError(f"Format d'export inconnu : {format_export}")
+    fichier.seek(0)
+    return fichier
+
+
+def octets(nom, format_export="csv", debut=None, fin=None, colonnes=None):
+    """Contenu de l'export, à passer en callable à ``st.download_button`` pour ne le générer qu'au clic."""
+    with exporter(nom, format_export, debut, fin, colonnes) as fichier:
+        return fichier.read()
@@ -0,0 +1,79 @@
+"""Écritures sur disque des registres : journal en ajout seul et réécriture atomique.
+
+Une nouvelle transaction (vente, achat, mouvement) est ajoutée en une ligne à
+la fin du journal du registre, puis synchronisée sur disque (fsync). Le
+fichier de base n'est réécrit qu'au moment d'une compaction (modification ou
+suppression), via un fichier temporaire renommé atomiquement.
+"""
+import csv
+import io
+import os
+import tempfile
+
+import pandas as pd
+
+
+def _fsync_dossier(dossier):
+    # Rend le renommage durable ; pas disponible sous Windows
+    try:
+        fd = os.open(dossier, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def ajouter_lignes(path, colonnes, lignes):
+    """Ajoute les ``lignes`` (dicts) à la fin du journal ``path`` en une seule écriture (un seul fsync).
+
+    Renvoie le nombre d'octets écrits.
+    """
+    tampon = io.StringIO()
+    csv.writer(tampon, lineterminator="\n").writerows([ligne.get(c, "") for c in colonnes] for ligne in lignes)
+    octets = tampon.getvalue().encode("utf-8")
+    with open(path, "ab") as f:
+        f.write(octets)
+        f.flush()
+        os.fsync(f.fileno())
+    return len(octets)
+
+
+def lire_suite(path, colonnes, position):
+    """Lit les lignes complètes du journal à partir de l'octet ``position``.
+
+    Renvoie ``(df, nouvelle_position)``. Une dernière ligne incomplète (écriture
+    interrompue) est ignorée jusqu'à ce qu'elle soit terminée.
+    """
+    with open(path, "rb") as f:
+        f.seek(position)
+        brut = f.read()
+    fin = brut.rfind(b"\n") + 1
+    if fin == 0:
+        return pd.DataFrame(columns=colonnes), position
+    df = pd.read_csv(io.BytesIO(brut[:fin]), names=colonnes, header=None, encoding="utf-8")
+    return df, position + fin
+
+
+def remplacer_atomique(path, ecrire):
+    """Réécrit ``path`` via un fichier temporaire puis ``os.replace``.
+
+    ``ecrire(chemin_tmp)`` produit le contenu complet (CSV, Parquet...) dans le
+    fichier temporaire, qui n'est renommé qu'une fois synchronisé sur disque.
+    """
+    dossier = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=dossier, prefix=".tmp_", suffix=os.path.basename(path))
+    os.close(fd)
+    try:
+        ecrire(tmp)
+        with open(tmp, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    _fsync_dossier(dossier)
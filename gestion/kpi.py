@@ -0,0 +1,128 @@
+"""Instantané des indicateurs du Dashboard.
+
+L'instantané (CA, achats, marge, solde de trésorerie, alertes de stock, top
+produits sur le jour / la semaine / le mois / l'année) est calculé à partir des
+agrégats matérialisés et des niveaux de stock tenus à jour par
+``gestion.stock``, jamais des lignes : son coût ne dépend pas de la taille de
+l'historique. Un thread de fond, démarré une fois par processus, le
+reconstruit dès qu'un registre ou un document (recettes, seuils) change ; la
+page Dashboard lit le dernier instantané, même s'il a quelques secondes de
+retard, et ne le calcule elle-même que s'il n'y en a pas encore.
+"""
+import datetime
+import threading
+
+from gestion import agregats, documents, donnees, stock
+
+PERIODES = ["Jour", "Semaine", "Mois", "Année"]
+DOCUMENTS = ["recettes", "stock"]
+
+_snapshot = None
+_verrou = threading.Lock()
+_thread = None
+# Réveille le thread de fond dès qu'un registre est écrit dans ce processus
+_reveil = threading.Event()
+
+
+def _debuts(jour):
+    return {
+        "Jour": jour,
+        "Semaine": jour - datetime.timedelta(days=jour.weekday()),
+        "Mois": jour.replace(day=1),
+        "Année": jour.replace(month=1, day=1),
+    }
+
+
+def construire(jour=None, nb_top=5):
+    """Calcule l'instantané complet des indicateurs."""
+    jour = jour or datetime.date.today()
+    ventes = agregats.obtenir("ventes")
+    achats = agregats.obtenir("achats")
+    treso = agregats.obtenir("tresorerie")
+
+    periodes = {}
+    for periode, debut in _debuts(jour).items():
+        debut = debut.isoformat()
+        nb_ventes, ca = ventes.depuis("jour", debut)
+        _, total_achats = achats.depuis("jour", debut)
+        top = ventes.par_depuis("Produit", debut).head(nb_top)
+        periodes[periode] = {
+            "ventes": nb_ventes,
+            "ca": ca,
+            "achats": total_achats,
+            "marge": ca - total_achats,
+            "top_produits": list(top.items()),
+        }
+
+    types = treso.par("Type")
+    seuils = {nom: infos.get("seuil", 0) for nom, infos in documents.charger("stock").items()}
+    alertes = [
+        {"ingredient": nom, "quantite": round(infos["quantite"], 3), "seuil": infos["seuil"]}
+        for nom, infos in stock.alertes(stock.niveaux(documents.charger("recettes")), seuils).items()
+    ]
+    return {
+        "calcule_le": datetime.datetime.now().isoformat(timespec="seconds"),
+        "jour": jour.isoformat(),
+        "versions": _versions(),
+        "periodes": periodes,
+        "solde_tresorerie": types.get("Entrée", 0.0) - types.get("Sortie", 0.0),
+        "alertes_stock": alertes,
+    }
+
+
+def _versions():
+    versions = {nom: donnees.version(nom) for nom in donnees.REGISTRES}
+    versions.update({f"document {nom}": documents.version(nom) for nom in DOCUMENTS})
+    return versions
+
+
+def _a_jour(snapshot):
+    return (
+        snapshot is not None
+        and snapshot["jour"] == datetime.date.today().isoformat()
+        and snapshot["versions"] == _versions()
+    )
+
+
+def rafraichir(forcer=False):
+    """Reconstruit l'instantané si un registre a changé (ou si la date a changé)."""
+    global _snapshot
+    if forcer or not _a_jour(_snapshot):
+        snapshot = construire()
+        with _verrou:
+            _snapshot = snapshot
+    return _snapshot
+
+
+def instantane():
+    """Dernier instantané, tel quel ; calculé sur place seulement s'il n'y en a pas encore."""
+    with _verrou:
+        snapshot = _snapshot
+    return snapshot if snapshot is not None else rafraichir()
+
+
+def _boucle(intervalle):
+    while True:
+        try:
+            rafraichir()
+        except Exception:
+            # Registre en cours d'écriture ou illisible : on réessaie au tour suivant
+            pass
+        # Au plus ``intervalle`` secondes de retard (écritures d'autres processus, changement de date)
+        _reveil.wait(intervalle)
+        _reveil.clear()
+
+
+def _reveiller(nom):
+    _reveil.set()
+
+
+def demarrer(intervalle=5.0):
+    """Lance (une seule fois par processus) le thread de rafraîchissement en fond."""
+    global _thread
+    with _verrou:
+        if _thread is not None and _thread.is_alive():
+            return
+        donnees.abonner(_reveiller)
+        _thread = threading.Thread(target=_boucle, args=(intervalle,), name="kpi-rafraichissement", daemon=True)
+        _thread.start()
@@ -0,0 +1,194 @@
+"""Calcul de la paie d'un mois pour toute l'équipe, en colonnes.
+
+- heures : planning hebdomadaire de la page RH (``gestion.planning``), semaine
+  par semaine ; une semaine est payée avec le mois qui contient son dimanche.
+  Sans planning, les heures saisies sur la fiche (``heures_mois``,
+  ``heures_supp``) sont reprises ;
+- taux horaire par employé (``taux_horaire`` sur la fiche), sinon le taux par
+  défaut de la page ;
+- heures supplémentaires au-delà de la durée légale, par paliers
+  (8 premières heures à +25 %, au-delà +50 %) ;
+- cotisations salariales par ligne, selon la table de règles en vigueur pour
+  le mois.
+
+Les règles sont versionnées par date d'effet (``REGLES``, complétées ou
+remplacées par ``regles_paie.json`` dans le dossier des données) : un mois
+passé est toujours recalculé avec les règles de l'époque.
+
+Les entrées (fiches, planning de la semaine type, taux par défaut) sont
+figées par mois (``paie_instantanes.json``) : celles du mois en cours suivent
+la page RH, celles d'un mois passé restent celles de sa dernière utilisation,
+sauf mise à jour explicite (``calculer(..., rafraichir=True)``). Le résultat
+est gardé en cache par (mois, version des règles, empreinte de l'instantané).
+Une paie validée se relit dans le registre ``paie`` (``validee``).
+"""
+import datetime
+import hashlib
+import json
+import os
+import threading
+
+import pandas as pd
+
+from gestion import donnees, journal, planning, profil
+
+# Date d'effet (AAAA-MM) -> règles
+REGLES = {
+    "2020-01": {
+        "duree_legale": 35.0,
+        # [nombre d'heures du palier (None = sans limite), majoration]
+        "paliers_hs": [[8.0, 0.25], [None, 0.50]],
+        "cotisations": {"Cotisations salariales": 0.22},
+    },
+}
+
+_cache = {}
+_verrou = threading.Lock()
+_verrou_instantanes = threading.Lock()
+TAILLE_CACHE = 24
+
+
+def _empreinte(objet):
+    return hashlib.sha1(json.dumps(objet, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:10]
+
+
+def toutes_regles():
+    """Règles du code complétées par ``regles_paie.json`` s'il existe."""
+    regles = dict(REGLES)
+    try:
+        with open(os.path.join(donnees.DOSSIER, "regles_paie.json"), encoding="utf-8") as f:
+            regles.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+    return regles
+
+
+def regles(mois):
+    """(version, règles) applicables au mois ``mois`` (AAAA-MM)."""
+    toutes = toutes_regles()
+    en_vigueur = [effet for effet in toutes if effet <= mois] or [min(toutes)]
+    effet = max(en_vigueur)
+    return f"{effet}:{_empreinte(toutes[effet])}", toutes[effet]
+
+
+def semaines(mois):
+    """Lundis des semaines payées avec le mois (celles dont le dimanche tombe dans le mois)."""
+    periode = pd.Period(mois, freq="M")
+    dimanches = pd.date_range(periode.start_time, periode.end_time.normalize(), freq="W-SUN")
+    return dimanches - pd.Timedelta(days=6)
+
+
+def heures_hebdo(employes, planning_equipe, mois):
+    """Heures par employé (lignes) et semaine du mois (colonnes)."""
+    par_jour = planning.heures_par_jour(planning_equipe).reindex(list(employes), fill_value=0.0)
+    par_semaine = par_jour.sum(axis=1)
+    lundis = semaines(mois)
+    return pd.DataFrame({lundi.strftime("%Y-%m-%d"): par_semaine for lundi in lundis}, index=par_semaine.index)
+
+
+def _calculer(mois, employes, planning_equipe, taux_defaut, regle):
+    noms = list(employes)
+    fiches = pd.DataFrame({
+        "Taux h": [float(employes[n].get("taux_horaire") or taux_defaut) for n in noms],
+        "Prime": [float(employes[n].get("prime", 0) or 0) for n in noms],
+        "Heures fiche": [float(employes[n].get("heures_mois", 0) or 0) for n in noms],
+        "HS fiche": [float(employes[n].get("heures_supp", 0) or 0) for n in noms],
+    }, index=pd.Index(noms, name="Employé"))
+
+    hebdo = heures_hebdo(employes, planning_equipe, mois)
+    duree = regle["duree_legale"]
+    base = hebdo.clip(upper=duree).sum(axis=1)
+    reste = (hebdo - duree).clip(lower=0.0)
+    paliers = {}
+    for taille, majoration in regle["paliers_hs"]:
+        dans_palier = reste if taille is None else reste.clip(upper=taille)
+        paliers[f"HS {majoration:.0%}".replace("%", " %")] = (dans_palier.sum(axis=1), majoration)
+        reste = reste - dans_palier
+
+    # Sans planning : heures de la fiche, heures supp au premier palier
+    planifie = hebdo.sum(axis=1) > 0
+    resultat = pd.DataFrame(index=fiches.index)
+    resultat["Source"] = planifie.map({True: "Planning", False: "Fiche"})
+    resultat["Heures"] = base.where(planifie, fiches["Heures fiche"])
+    brut = resultat["Heures"] * fiches["Taux h"]
+    for i, (colonne, (heures, majoration)) in enumerate(paliers.items()):
+        heures = heures.where(planifie, fiches["HS fiche"] if i == 0 else 0.0)
+        resultat[colonne] = heures
+        brut = brut + heures * fiches["Taux h"] * (1 + majoration)
+    resultat["HS"] = resultat[list(paliers)].sum(axis=1)
+    resultat["Taux h"] = fiches["Taux h"]
+    resultat["Prime"] = fiches["Prime"]
+    resultat["Brut"] = brut + fiches["Prime"]
+    for ligne, taux in regle["cotisations"].items():
+        resultat[ligne] = resultat["Brut"] * taux
+    resultat["Cotisation"] = resultat[list(regle["cotisations"])].sum(axis=1)
+    resultat["Net à payer"] = resultat["Brut"] - resultat["Cotisation"]
+    return resultat.round(2).reset_index()
+
+
+def _chemin_instantanes():
+    return os.path.join(donnees.DOSSIER, "paie_instantanes.json")
+
+
+def _lire_instantanes():
+    try:
+        with open(_chemin_instantanes(), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def instantane(mois, employes, planning_equipe, taux_defaut, rafraichir=False):
+    """Entrées de la paie de ``mois`` : {"employes", "planning", "taux_defaut", "date"}.
+
+    Mois en cours ou à venir, mois jamais calculé ou ``rafraichir`` : les
+    entrées données sont enregistrées pour le mois. Mois passé : celles
+    enregistrées sont renvoyées telles quelles.
+    """
+    # Aller-retour JSON : l'instantané relu plus tard est identique à celui calculé maintenant
+    entrees = json.loads(json.dumps({"employes": employes, "planning": planning_equipe,
+                                     "taux_defaut": float(taux_defaut)}, default=str))
+    with _verrou_instantanes:
+        tous = _lire_instantanes()
+        actuel = tous.get(mois)
+        passe = mois < datetime.date.today().strftime("%Y-%m")
+        if actuel is not None and (passe and not rafraichir or {k: actuel[k] for k in entrees} == entrees):
+            return actuel
+        tous[mois] = dict(entrees, date=datetime.date.today().isoformat())
+        contenu = json.dumps(tous, ensure_ascii=False)
+
+        def ecrire(tmp):
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(contenu)
+        journal.remplacer_atomique(_chemin_instantanes(), ecrire)
+        return tous[mois]
+
+
+@profil.mesure("paie.calculer")
+def calculer(mois, employes, planning_equipe, taux_defaut, rafraichir=False):
+    """Paie de ``mois`` (AAAA-MM) pour tous les employés : un DataFrame, une ligne par employé.
+
+    Calculée sur l'instantané des entrées du mois (``instantane``) ;
+    ``resultat.attrs`` indique la version des règles et la date de l'instantané.
+    """
+    version, regle = regles(mois)
+    entrees = instantane(mois, employes, planning_equipe, taux_defaut, rafraichir)
+    cle = (mois, version, _empreinte([entrees["employes"], entrees["planning"], entrees["taux_defaut"]]))
+    with _verrou:
+        resultat = _cache.get(cle)
+    if resultat is None:
+        resultat = _calculer(mois, entrees["employes"], entrees["planning"], entrees["taux_defaut"], regle)
+        resultat.attrs["version_regles"] = version
+        resultat.attrs["date_entrees"] = entrees["date"]
+        with _verrou:
+            if len(_cache) >= TAILLE_CACHE:
+                _cache.pop(next(iter(_cache)))
+            _cache[cle] = resultat
+    return resultat
+
+
+def validee(mois):
+    """Dernière paie validée de ``mois`` (registre ``paie``), vide si le mois n'a pas été validé."""
+    df = donnees.charger("paie")
+    df = df[df["Date"].dt.strftime("%Y-%m") == mois]
+    return df.assign(Employé=df["Employé"].astype(object)).drop_duplicates("Employé", keep="last")
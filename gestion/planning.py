@@ -0,0 +1,203 @@
+"""Planning hebdomadaire de l'équipe (page RH) compilé en intervalles.
+
+Le planning est un dict ``{jour: {employé: plage}}`` où la plage est du texte
+libre : « 9h-17h », « 9h30-14h / 18h-22h », « 09:00-17:30 », vide ou
+« repos ». Une plage qui finit avant de commencer passe minuit.
+
+``compiler`` transforme ce texte en un tableau d'intervalles (minutes depuis
+le lundi 0 h), trié par employé puis par début : chevauchements, repos
+quotidien insuffisant et totaux hebdomadaires s'en déduisent en un tri
+(O(n log n)) puis des opérations en colonnes. Le résultat est gardé en cache
+par contenu du planning.
+"""
+import hashlib
+import json
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+from gestion import profil
+
+JOURS = ["Lundi", "Mardi", "Mercredi", "Jeudi", "Vendredi", "Samedi", "Dimanche"]
+MINUTES_JOUR = 24 * 60
+MINUTES_SEMAINE = 7 * MINUTES_JOUR
+# Repos quotidien minimal entre deux journées de travail, en heures
+REPOS_MIN = 11.0
+# Durée hebdomadaire au-delà de laquelle une semaine est signalée, en heures
+HEURES_MAX_SEMAINE = 48.0
+
+_HEURE = r"(\d{1,2})\s*(?:[h:.]\s*(\d{2})?)?"
+_PLAGE = re.compile(_HEURE + r"\s*(?:-|–|à)\s*" + _HEURE, re.IGNORECASE)
+_REPOS = {"", "repos", "off", "-", "absent", "congé", "conge"}
+COLONNES = ["Employé", "Jour", "Début", "Fin"]
+
+_cache = {}
+_verrou = threading.Lock()
+
+
+def plages(texte):
+    """Intervalles ``(début, fin)`` en minutes depuis minuit ; la fin peut dépasser 24 h."""
+    intervalles = []
+    for h1, m1, h2, m2 in _PLAGE.findall(str(texte or "")):
+        debut = int(h1) * 60 + int(m1 or 0)
+        fin = int(h2) * 60 + int(m2 or 0)
+        if fin <= debut:
+            fin += MINUTES_JOUR
+        intervalles.append((debut, fin))
+    return intervalles
+
+
+def _compiler(planning):
+    employes, jours, debuts, fins, illisibles = [], [], [], [], []
+    for jour, equipe in planning.items():
+        if jour not in JOURS:
+            continue
+        decalage = JOURS.index(jour) * MINUTES_JOUR
+        for nom, texte in equipe.items():
+            intervalles = plages(texte)
+            if not intervalles and str(texte or "").strip().lower() not in _REPOS:
+                illisibles.append({"Employé": nom, "Jour": jour, "Saisie": texte})
+            for debut, fin in intervalles:
+                employes.append(nom)
+                jours.append(jour)
+                debuts.append(decalage + debut)
+                fins.append(decalage + fin)
+    intervalles = pd.DataFrame({
+        "Employé": pd.Series(employes, dtype=object),
+        "Jour": pd.Categorical(jours, categories=JOURS, ordered=True),
+        "Début": np.array(debuts, dtype="int64"),
+        "Fin": np.array(fins, dtype="int64"),
+    }, columns=COLONNES)
+    intervalles = intervalles.sort_values(["Employé", "Début"], kind="mergesort", ignore_index=True)
+    return intervalles, pd.DataFrame(illisibles, columns=["Employé", "Jour", "Saisie"])
+
+
+@profil.mesure("planning.compiler")
+def compiler(planning):
+    """``(intervalles, illisibles)`` : intervalles triés par employé et début, saisies non reconnues."""
+    cle = hashlib.sha1(json.dumps(planning, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    with _verrou:
+        resultat = _cache.get(cle)
+    if resultat is None:
+        resultat = _compiler(planning)
+        with _verrou:
+            _cache.clear()
+            _cache[cle] = resultat
+    return resultat
+
+
+def _fin_precedente(intervalles):
+    # Fin la plus tardive des intervalles précédents du même employé (-1 pour le premier)
+    employes = intervalles["Employé"]
+    cumul = intervalles["Fin"].groupby(employes, sort=False).cummax()
+    return cumul.groupby(employes, sort=False).shift(1, fill_value=-1)
+
+
+def _minutes(intervalles):
+    # Durée effective de chaque intervalle, sans recompter une partie déjà couverte
+    return (intervalles["Fin"] - np.maximum(intervalles["Début"], _fin_precedente(intervalles))).clip(lower=0)
+
+
+def chevauchements(planning):
+    """Intervalles qui commencent avant la fin d'un intervalle précédent du même employé."""
+    intervalles, _ = compiler(planning)
+    precedente = _fin_precedente(intervalles)
+    conflits = intervalles[intervalles["Début"] < precedente]
+    return pd.DataFrame({
+        "Employé": conflits["Employé"],
+        "Jour": conflits["Jour"].astype(object),
+        "Plage": [_texte(d, f) for d, f in zip(conflits["Début"], conflits["Fin"])],
+        "Chevauche jusqu'à": [_heure(f) for f in precedente[conflits.index]],
+    }).reset_index(drop=True)
+
+
+def repos_insuffisants(planning, repos_min=REPOS_MIN):
+    """Enchaînements de journées avec moins de ``repos_min`` heures de repos.
+
+    Le planning se répète chaque semaine : le repos du dimanche soir se mesure
+    jusqu'au premier service du lundi suivant.
+    """
+    intervalles, _ = compiler(planning)
+    journees = intervalles.groupby(["Employé", "Jour"], observed=True, sort=False).agg(
+        Début=("Début", "min"), Fin=("Fin", "max")).reset_index()
+    journees = journees.sort_values(["Employé", "Début"], kind="mergesort", ignore_index=True)
+    groupes = journees.groupby("Employé", sort=False)
+    suivant = groupes["Début"].shift(-1)
+    suivant = suivant.fillna(groupes["Début"].transform("first") + MINUTES_SEMAINE)
+    jour_suivant = groupes["Jour"].shift(-1).astype(object).fillna(groupes["Jour"].transform("first").astype(object))
+    repos = (suivant - journees["Fin"]) / 60
+    # Un seul jour travaillé dans la semaine : pas d'enchaînement à contrôler
+    seul = groupes["Début"].transform("size") == 1
+    en_defaut = (repos < repos_min) & ~seul
+    return pd.DataFrame({
+        "Employé": journees.loc[en_defaut, "Employé"],
+        "Fin de service": [f"{j} {_heure(f)}" for j, f in zip(journees.loc[en_defaut, "Jour"], journees.loc[en_defaut, "Fin"])],
+        "Reprise": [f"{j} {_heure(d)}" for j, d in zip(jour_suivant[en_defaut], suivant[en_defaut])],
+        "Repos (h)": repos[en_defaut].round(2),
+    }).reset_index(drop=True)
+
+
+def heures_par_jour(planning):
+    """Heures prévues par employé (lignes) et jour de la semaine (colonnes Lundi..Dimanche).
+
+    Un service qui passe minuit compte pour le jour où il commence ; une
+    partie qui en chevauche une autre n'est comptée qu'une fois.
+    """
+    intervalles, _ = compiler(planning)
+    if intervalles.empty:
+        return pd.DataFrame(columns=JOURS, dtype="float64")
+    heures = (_minutes(intervalles) / 60).groupby([intervalles["Employé"], intervalles["Jour"]], observed=True).sum()
+    return heures.unstack(fill_value=0.0).reindex(columns=JOURS, fill_value=0.0).astype("float64")
+
+
+def heures_semaine(planning):
+    """Total d'heures prévues par employé sur une semaine type (Series)."""
+    return heures_par_jour(planning).sum(axis=1)
+
+
+def depassements(planning, heures_max=HEURES_MAX_SEMAINE):
+    """Employés dont la semaine type dépasse ``heures_max`` heures."""
+    semaine = heures_semaine(planning)
+    return semaine[semaine > heures_max].round(2).rename("Heures").rename_axis("Employé").reset_index()
+
+
+def mettre_a_jour_fiches(employes, planning, semaines_du_mois):
+    """Fiches ``employes`` avec ``heures_semaine`` et ``heures_mois`` déduites du planning.
+
+    ``semaines_du_mois`` : nombre de semaines payées sur le mois (voir
+    ``paie.semaines``). Renvoie un nouveau dict ; les employés absents du
+    planning gardent leurs valeurs.
+    """
+    semaine = heures_semaine(planning)
+    fiches = dict(employes)
+    for nom, heures in semaine.items():
+        if nom in fiches:
+            fiches[nom] = dict(fiches[nom], heures_semaine=round(float(heures), 2),
+                               heures_mois=round(float(heures) * semaines_du_mois, 2))
+    return fiches
+
+
+def grille(planning, employes):
+    """Planning en tableau employé × jour (texte), pour ``st.data_editor``."""
+    noms = list(dict.fromkeys(list(employes) + [n for equipe in planning.values() for n in equipe]))
+    return pd.DataFrame(
+        {jour: [str(planning.get(jour, {}).get(nom, "") or "") for nom in noms] for jour in JOURS},
+        index=pd.Index(noms, name="Employé"),
+    )
+
+
+def depuis_grille(df):
+    """Inverse de ``grille`` : tableau édité -> ``{jour: {employé: plage}}``."""
+    df = df.fillna("")
+    return {jour: {str(nom): str(texte).strip() for nom, texte in df[jour].items()} for jour in JOURS if jour in df}
+
+
+def _heure(minutes):
+    minutes = int(minutes) % MINUTES_JOUR
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def _texte(debut, fin):
+    return f"{_heure(debut)}-{_heure(fin)}"
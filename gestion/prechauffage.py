@@ -0,0 +1,80 @@
+"""Préchauffage du processus serveur, une seule fois, en tâche de fond.
+
+Au démarrage (ou au réveil d'un conteneur), chaque page ouverte pour la
+première fois payait la lecture et le typage de ses registres, et la page
+Achats l'import d'altair. L'application appelle ``demarrer`` après avoir
+affiché la première page, sans la ralentir ; un thread charge alors, pendant
+que l'utilisateur la lit :
+
+1. charge dans le cache de ``gestion.donnees`` chaque registre présent sur
+   disque, puis les documents JSON ;
+2. reconstruit ou relit les agrégats des ventes, achats et trésorerie, et
+   ajuste le modèle de prévision des ventes ;
+3. importe les dépendances lourdes utilisées par quelques pages seulement
+   (``DEPENDANCES``), si elles sont installées.
+
+Une page qui demande un registre en cours de chargement attend sa fin
+(``donnees.charger`` ne lit pas deux fois le même registre en même temps) ;
+un registre pas encore atteint, elle le lit elle-même, comme avant.
+"""
+import importlib
+import importlib.util
+import os
+import threading
+import time
+
+from gestion import agregats, documents, donnees, prevision
+
+DEPENDANCES = ["altair"]
+
+_thread = None
+_verrou = threading.Lock()
+_etat = {"debut": None, "fin": None, "registres": [], "erreurs": []}
+
+
+def _registres_presents():
+    if donnees.SQL is not None:
+        return list(donnees.REGISTRES)
+    return [nom for nom in donnees.REGISTRES
+            if os.path.exists(donnees.chemin(nom)) or os.path.exists(donnees.chemin_journal(nom))]
+
+
+def _etape(nom, fonction, *args):
+    try:
+        fonction(*args)
+    except Exception as e:
+        # Registre illisible ou en cours d'écriture : la page le relira elle-même
+        _etat["erreurs"].append(f"{nom} : {e}")
+
+
+def prechauffer():
+    """Charge registres, documents, agrégats et dépendances lourdes ; renvoie l'état."""
+    _etat["debut"] = time.time()
+    for nom in _registres_presents():
+        _etape(nom, donnees.charger, nom)
+        _etat["registres"].append(nom)
+    for nom in documents.DOCUMENTS:
+        _etape(nom, documents.charger, nom)
+    for nom in ("ventes", "achats", "tresorerie"):
+        _etape(f"agrégats {nom}", agregats.obtenir, nom)
+    _etape("prévisions", prevision.modele)
+    for module in DEPENDANCES:
+        if importlib.util.find_spec(module) is not None:
+            _etape(module, importlib.import_module, module)
+    _etat["fin"] = time.time()
+    return etat()
+
+
+def demarrer():
+    """Lance (une seule fois par processus) le préchauffage en fond."""
+    global _thread
+    with _verrou:
+        if _thread is not None:
+            return
+        _thread = threading.Thread(target=prechauffer, name="prechauffage", daemon=True)
+        _thread.start()
+
+
+def etat():
+    """Début, fin (``time.time()``, None tant que ce n'est pas fini), registres chargés et erreurs."""
+    return dict(_etat, registres=list(_etat["registres"]), erreurs=list(_etat["erreurs"]))
@@ -0,0 +1,213 @@
+"""Prévision des ventes par produit et quantités à produire.
+
+Les ventes sont ramenées à une série quotidienne par produit : une matrice
+jour x produit (quantités vendues, 0 les jours sans vente), construite en une
+passe vectorisée sur tout le registre.
+
+Chaque produit suit un lissage exponentiel avec effet du jour de la semaine
+(Holt-Winters additif, sans tendance) :
+
+- ``niveau`` : ventes d'un jour moyen, lissées (``ALPHA``) ; il suit aussi les
+  variations lentes (saison, nouveaux plats qui décollent) ;
+- ``saison`` : écart de chaque jour de la semaine au niveau (``GAMMA``) ;
+- ``ecart2`` : variance des erreurs de prévision d'un jour (``BETA``), pour la
+  marge de sécurité.
+
+Tous les produits sont mis à jour ensemble, un jour à la fois. Seuls les
+jours terminés (avant aujourd'hui) sont pris en compte. Le modèle est gardé
+en mémoire avec le nombre de lignes déjà lues : les ventes ajoutées depuis
+sont rejouées sur les jours non encore appris. Un recalcul complet n'a lieu
+que si le registre a été réécrit ou si une vente est datée d'un jour déjà
+appris.
+"""
+import datetime
+import threading
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from gestion import donnees, profil
+
+ALPHA = 0.1
+GAMMA = 0.2
+BETA = 0.05
+# Jours utilisés pour initialiser niveau et jours de la semaine
+DEMARRAGE = 28
+# Part des jours où la production doit couvrir les ventes
+SERVICE = 0.9
+
+_etat = None
+_verrou = threading.RLock()
+_compteurs = {"reconstructions": 0, "rejeux": 0}
+
+
+def _jour(date):
+    return pd.Timestamp(date).normalize()
+
+
+def _agrandir(etat, nb_jours, nb_produits):
+    """Ajoute des jours (lignes) et des produits (colonnes) vides à la série et au modèle."""
+    quantites = etat["quantites"]
+    jours, produits = quantites.shape
+    if nb_jours > jours or nb_produits > produits:
+        etat["quantites"] = np.pad(quantites, ((0, max(0, nb_jours - jours)), (0, max(0, nb_produits - produits))))
+    if nb_produits > len(etat["niveau"]):
+        ajout = nb_produits - len(etat["niveau"])
+        etat["niveau"] = np.pad(etat["niveau"], (0, ajout))
+        etat["ecart2"] = np.pad(etat["ecart2"], (0, ajout))
+        etat["saison"] = np.pad(etat["saison"], ((0, 0), (0, ajout)))
+
+
+def _cumuler(etat, jours, colonnes, quantites):
+    """Ajoute des ventes (jour, colonne produit, quantité) à la série quotidienne."""
+    nb_jours, nb_produits = etat["quantites"].shape
+    cases = np.bincount(jours * nb_produits + colonnes, weights=quantites, minlength=nb_jours * nb_produits)
+    etat["quantites"] += cases.reshape(nb_jours, nb_produits)
+
+
+def _initialiser(etat, fin):
+    """Niveau et effets des jours de la semaine sur les premiers jours de la série."""
+    fenetre = etat["quantites"][:min(DEMARRAGE, fin)]
+    if not len(fenetre):
+        return
+    etat["niveau"] = fenetre.mean(axis=0)
+    etat["ecart2"] = fenetre.var(axis=0)
+    semaine = (etat["origine"].dayofweek + np.arange(len(fenetre))) % 7
+    for j in range(7):
+        if (semaine == j).any():
+            etat["saison"][j] = fenetre[semaine == j].mean(axis=0) - etat["niveau"]
+
+
+def _apprendre(etat, fin):
+    """Met à jour le modèle avec les jours de ``etat["appris"]`` à ``fin`` (exclu)."""
+    niveau, saison, ecart2 = etat["niveau"], etat["saison"], etat["ecart2"]
+    j = (etat["origine"].dayofweek + etat["appris"]) % 7
+    for vendus in etat["quantites"][etat["appris"]:fin]:
+        erreur = vendus - niveau - saison[j]
+        ecart2 = (1 - BETA) * ecart2 + BETA * erreur * erreur
+        niveau_jour = ALPHA * (vendus - saison[j]) + (1 - ALPHA) * niveau
+        saison[j] = GAMMA * (vendus - niveau_jour) + (1 - GAMMA) * saison[j]
+        niveau = niveau_jour
+        j = (j + 1) % 7
+    etat["niveau"], etat["ecart2"] = niveau, ecart2
+    etat["appris"] = max(etat["appris"], fin)
+
+
+def _reconstruire(df, generation, aujourdhui):
+    df = df[df["Date"].notna() & df["Produit"].notna()]
+    codes, produits = pd.factorize(df["Produit"], sort=True)
+    origine = _jour(df["Date"].min()) if len(df) else aujourdhui
+    jours = ((df["Date"].dt.normalize() - origine) // pd.Timedelta(days=1)).to_numpy()
+    etat = {
+        "generation": generation,
+        "origine": origine,
+        "produits": pd.Index([str(p) for p in produits], name="Produit"),
+        "quantites": np.zeros((0, 0)),
+        "niveau": np.zeros(0),
+        "saison": np.zeros((7, 0)),
+        "ecart2": np.zeros(0),
+        "appris": 0,
+    }
+    fin = (aujourdhui - origine).days
+    _agrandir(etat, max(fin + 1, int(jours.max(initial=-1)) + 1), len(produits))
+    _cumuler(etat, jours, codes, df["Quantité"].fillna(0).to_numpy(dtype="float64"))
+    _initialiser(etat, fin)
+    _apprendre(etat, fin)
+    _compteurs["reconstructions"] += 1
+    return etat
+
+
+def _rejouer(etat, nouvelles):
+    """Ajoute les ventes ``nouvelles`` ; False si l'une d'elles tombe sur un jour déjà appris."""
+    nouvelles = nouvelles[nouvelles["Date"].notna() & nouvelles["Produit"].notna()]
+    if nouvelles.empty:
+        return True
+    jours = ((nouvelles["Date"].dt.normalize() - etat["origine"]) // pd.Timedelta(days=1)).to_numpy()
+    if jours.min() < etat["appris"]:
+        return False
+    produits = nouvelles["Produit"].astype(str)
+    inconnus = pd.Index(produits.unique()).difference(etat["produits"])
+    if len(inconnus):
+        etat["produits"] = etat["produits"].append(inconnus)
+    _agrandir(etat, int(jours.max()) + 1, len(etat["produits"]))
+    _cumuler(etat, jours, etat["produits"].get_indexer(produits),
+             nouvelles["Quantité"].fillna(0).to_numpy(dtype="float64"))
+    return True
+
+
+@profil.mesure("prevision.modele")
+def modele(aujourdhui=None):
+    """Modèle à jour (ventes jusqu'à la veille de ``aujourdhui``), recalculé seulement si nécessaire."""
+    global _etat
+    aujourdhui = _jour(aujourdhui or datetime.date.today())
+    generation = donnees.generation("ventes")
+    with _verrou:
+        df = donnees.charger("ventes")
+        etat = _etat
+        valide = (
+            etat is not None
+            and etat["generation"] == generation
+            and len(df) >= etat["lus"]
+            and aujourdhui >= etat["origine"] + pd.Timedelta(days=etat["appris"])
+        )
+        if valide and len(df) > etat["lus"]:
+            valide = _rejouer(etat, df.iloc[etat["lus"]:])
+            _compteurs["rejeux"] += valide
+        if not valide:
+            etat = _reconstruire(df, generation, aujourdhui)
+        fin = (aujourdhui - etat["origine"]).days
+        if fin > etat["appris"]:
+            _agrandir(etat, fin + 1, len(etat["produits"]))
+            _apprendre(etat, fin)
+        etat["lus"] = len(df)
+        _etat = etat
+        return etat
+
+
+def serie(debut=None, fin=None):
+    """Quantités vendues par jour (index) et par produit (colonnes), jours sans vente compris."""
+    with _verrou:
+        etat = modele()
+        jours = pd.date_range(etat["origine"], periods=len(etat["quantites"]), freq="D", name="Jour")
+        df = pd.DataFrame(etat["quantites"].copy(), index=jours, columns=etat["produits"][:etat["quantites"].shape[1]])
+    return df.loc[debut:fin]
+
+
+def prevoir(debut=None, jours=1):
+    """Ventes attendues de chaque produit (colonnes) pour ``jours`` jours à partir de ``debut`` (demain).
+
+    Seules les ventes d'avant ``debut`` sont prises en compte : pour un jour
+    passé, c'est la prévision qui aurait été faite la veille.
+    """
+    debut = _jour(debut or datetime.date.today() + datetime.timedelta(days=1))
+    dates = pd.date_range(debut, periods=jours, freq="D", name="Jour")
+    with _verrou:
+        etat = modele(min(debut, _jour(datetime.date.today())))
+        attendu = etat["niveau"][None, :] + etat["saison"][dates.dayofweek.to_numpy()]
+        return pd.DataFrame(np.clip(attendu, 0.0, None), index=dates, columns=etat["produits"])
+
+
+def recommandations(debut=None, jours=1, service=SERVICE):
+    """Quantité à produire par produit pour couvrir ``jours`` jours de ventes à partir de ``debut``.
+
+    Prévision + marge de sécurité : la production couvre les ventes ``service``
+    fois sur 1 (erreurs de prévision supposées normales et indépendantes d'un
+    jour à l'autre). Seuls les produits à produire sont renvoyés.
+    """
+    with _verrou:
+        attendu = prevoir(debut, jours).sum()
+        ecart = pd.Series(np.sqrt(_etat["ecart2"] * jours), index=_etat["produits"])
+    marge = NormalDist().inv_cdf(service) * ecart
+    df = pd.DataFrame({
+        "Prévision": attendu.round(1),
+        "Écart-type": ecart.round(1),
+        "À produire": np.floor(np.clip(attendu + marge, 0.0, None) + 0.5).astype(int),
+    })
+    df.index.name = "Produit"
+    return df[df["À produire"] > 0].sort_values("À produire", ascending=False, kind="stable")
+
+
+def stats():
+    with _verrou:
+        return dict(_compteurs)
@@ -0,0 +1,158 @@
+"""Profilage des reruns : où passe le temps de chaque page.
+
+Un rerun (la page entière ou un seul fragment) est suivi par ``rerun`` : tant
+qu'il dure, les blocs ``mesure("...")`` exécutés dans le même thread
+(chargement d'un registre, typage, agrégats, rendu d'un graphique...) y
+ajoutent leur durée, et les lectures / écritures de registres leurs octets
+(``octets``). Hors rerun (threads de fond), seuls les cumuls par registre
+sont tenus.
+
+Les derniers reruns de chaque zone (``MAISON_SABA_PROFIL_RERUNS``, 200 par
+défaut) sont gardés en mémoire pour le processus, toutes sessions
+confondues : ``resume`` et ``etapes`` en donnent les p50 / p95. Avec
+``MAISON_SABA_TRACE=chemin.jsonl``, chaque rerun est aussi ajouté au fichier,
+une ligne JSON par rerun.
+
+Les durées d'un bloc incluent celles des blocs imbriqués. En SQLite, les
+octets ne sont pas mesurés (pas de fichier par registre).
+"""
+import collections
+import datetime
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+NB_RERUNS = int(os.environ.get("MAISON_SABA_PROFIL_RERUNS", 200))
+TRACE = os.environ.get("MAISON_SABA_TRACE")
+
+_local = threading.local()
+_historique = {}
+_octets = collections.defaultdict(lambda: {"lus": 0, "ecrits": 0})
+_verrou = threading.Lock()
+
+
+def _courant():
+    return getattr(_local, "trace", None)
+
+
+@contextmanager
+def mesure(etape):
+    """Ajoute la durée du bloc à l'étape ``etape`` du rerun en cours (sans effet hors rerun)."""
+    trace = _courant()
+    if trace is None:
+        yield
+        return
+    debut = time.perf_counter()
+    try:
+        yield
+    finally:
+        cumul = trace["etapes"].setdefault(etape, {"ms": 0.0, "appels": 0})
+        cumul["ms"] += (time.perf_counter() - debut) * 1000
+        cumul["appels"] += 1
+
+
+def octets(registre, lus=0, ecrits=0):
+    """Compte des octets lus / écrits sur le disque pour ``registre``."""
+    with _verrou:
+        cumul = _octets[registre]
+        cumul["lus"] += lus
+        cumul["ecrits"] += ecrits
+    trace = _courant()
+    if trace is not None:
+        cumul = trace["octets"].setdefault(registre, {"lus": 0, "ecrits": 0})
+        cumul["lus"] += lus
+        cumul["ecrits"] += ecrits
+
+
+@contextmanager
+def rerun(zone):
+    """Suit le bloc comme un rerun de ``zone`` (« Ventes », « Ventes / saisie_vente »...).
+
+    Imbriqué dans un rerun déjà suivi (fragment exécuté pendant le rerun de
+    la page), le bloc n'est qu'une étape de celui-ci.
+    """
+    if _courant() is not None:
+        with mesure(zone):
+            yield
+        return
+    trace = {"zone": zone, "debut": datetime.datetime.now().isoformat(timespec="milliseconds"),
+             "etapes": {}, "octets": {}}
+    _local.trace = trace
+    debut = time.perf_counter()
+    try:
+        yield
+    finally:
+        _local.trace = None
+        trace["ms"] = (time.perf_counter() - debut) * 1000
+        _enregistrer(trace)
+
+
+def _enregistrer(trace):
+    with _verrou:
+        _historique.setdefault(trace["zone"], collections.deque(maxlen=NB_RERUNS)).append(trace)
+    if TRACE:
+        ligne = json.dumps(trace, ensure_ascii=False) + "\n"
+        with _verrou, open(TRACE, "a", encoding="utf-8") as f:
+            f.write(ligne)
+
+
+def _centiles(valeurs):
+    p50, p95 = np.percentile(valeurs, [50, 95])
+    return round(float(p50), 2), round(float(p95), 2)
+
+
+def _reruns(zone=None):
+    with _verrou:
+        if zone is not None:
+            return {zone: list(_historique.get(zone, ()))}
+        return {z: list(traces) for z, traces in _historique.items()}
+
+
+def resume():
+    """Une ligne par zone : nombre de reruns gardés, p50 / p95 / max de leur durée (ms)."""
+    lignes = []
+    for zone, traces in sorted(_reruns().items()):
+        durees = [t["ms"] for t in traces]
+        p50, p95 = _centiles(durees)
+        lues = sum(o["lus"] for t in traces for o in t["octets"].values())
+        lignes.append({"Zone": zone, "Reruns": len(traces), "p50 (ms)": p50, "p95 (ms)": p95,
+                       "Max (ms)": round(max(durees), 2), "Octets lus / rerun": lues // len(traces)})
+    return pd.DataFrame(lignes, columns=["Zone", "Reruns", "p50 (ms)", "p95 (ms)", "Max (ms)", "Octets lus / rerun"])
+
+
+def etapes(zone):
+    """Étapes des derniers reruns de ``zone`` : p50 / p95 de leur durée quand elles sont présentes."""
+    traces = _reruns(zone)[zone]
+    par_etape = collections.defaultdict(list)
+    appels = collections.Counter()
+    for trace in traces:
+        for etape, cumul in trace["etapes"].items():
+            par_etape[etape].append(cumul["ms"])
+            appels[etape] += cumul["appels"]
+    lignes = []
+    for etape, durees in par_etape.items():
+        p50, p95 = _centiles(durees)
+        lignes.append({"Étape": etape, "Reruns": len(durees), "Appels / rerun": round(appels[etape] / len(durees), 1),
+                       "p50 (ms)": p50, "p95 (ms)": p95})
+    df = pd.DataFrame(lignes, columns=["Étape", "Reruns", "Appels / rerun", "p50 (ms)", "p95 (ms)"])
+    return df.sort_values("p95 (ms)", ascending=False, ignore_index=True)
+
+
+def octets_par_registre():
+    """Octets lus et écrits par registre depuis le démarrage du processus."""
+    with _verrou:
+        cumuls = {registre: dict(cumul) for registre, cumul in _octets.items()}
+    df = pd.DataFrame.from_dict(cumuls, orient="index", columns=["lus", "ecrits"])
+    return df.rename(columns={"lus": "Octets lus", "ecrits": "Octets écrits"}).sort_index()
+
+
+def vider():
+    """Oublie les reruns et les compteurs d'octets gardés en mémoire."""
+    with _verrou:
+        _historique.clear()
+        _octets.clear()
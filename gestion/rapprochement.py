@@ -0,0 +1,291 @@
+"""Mouvements de trésorerie déduits des ventes, des achats et des paies.
+
+Chaque transaction d'origine correspond à un mouvement de trésorerie identifié
+par une référence stable (colonne ``Référence``) :
+
+- ``ventes:AAAA-MM-JJ:<mode>`` : recette du jour par mode de paiement ;
+- ``achats:AAAA-MM-JJ:<fournisseur>:<mode>`` : achats du jour chez un fournisseur ;
+- ``paie:AAAA-MM:<employé>`` : net versé pour le mois (la dernière paie validée compte).
+
+Seules les transactions datées à partir de la date de départ (``debut``)
+sont reportées : avant, les mouvements ont été saisis à la main. Elle vaut
+le jour de la première activation et se change avec ``definir_debut`` ;
+l'avancer ne retire rien de ce qui a déjà été passé, la reculer reporte les
+transactions de la période ajoutée.
+
+Le montant attendu de chaque référence est comparé au montant déjà passé en
+trésorerie sous cette référence ; seul l'écart est ajouté, en une ligne
+(« correction » s'il y avait déjà un montant). La trésorerie reste donc en
+ajout seul et relancer le rapprochement ne crée jamais de doublon. La lecture
+des montants passés, le calcul des écarts et leur ajout se font sous le verrou
+de fichier de la trésorerie : deux processus qui rapprochent en même temps ne
+passent pas deux fois le même écart.
+
+L'état (``rapprochement.json``) garde la date de départ et, par source, le nombre de lignes déjà
+traitées et la génération du registre : seules les nouvelles lignes sont
+lues, sauf après une modification ou suppression, où la source est recalculée.
+
+``ecarts_bancaires`` compare la variation mensuelle des soldes bancaires
+(saisis ou importés, voir ``gestion/banque.py``) aux flux de trésorerie hors
+espèces du même mois.
+"""
+import datetime
+import json
+import os
+import threading
+
+import pandas as pd
+
+from gestion import agregats, banque, donnees, journal, profil, travailleur
+
+SOURCES = ["ventes", "achats", "paie"]
+# À incrémenter si la structure de l'état change
+FORMAT = 2
+
+_etat = None
+_verrou = threading.RLock()
+# Travailleur propre au rapprochement : ses passes ne comptent pas dans l'état de la synchro Sheets
+_fond = None
+_compteurs = {"recalculs": 0, "increments": 0, "mouvements": 0}
+
+
+def _chemin():
+    return os.path.join(donnees.DOSSIER, "rapprochement.json")
+
+
+def _attendus(source, df, debut):
+    """Mouvements attendus pour les lignes ``df`` de ``source`` datées à partir de ``debut`` : {référence: mouvement}."""
+    df = df[df["Date"] >= pd.Timestamp(debut)]
+    if df.empty:
+        return {}
+    jours = df["Date"].dt.strftime("%Y-%m-%d")
+    if source == "ventes":
+        modes = df["Mode de paiement"].astype(object).fillna("Autre")
+        totaux = df["Total"].groupby([jours, modes]).sum()
+        return {
+            f"ventes:{jour}:{mode}": {
+                "Date": jour, "Montant": float(total), "Mode": mode, "Catégorie": "Vente",
+                "Libellé": f"Ventes du {jour} ({mode})",
+            }
+            for (jour, mode), total in totaux.items()
+        }
+    if source == "achats":
+        fournisseurs = df["Fournisseur"].astype(object).fillna("")
+        modes = df["Mode de paiement"].astype(object).fillna("Autre")
+        totaux = df["Total"].groupby([jours, fournisseurs, modes]).sum()
+        return {
+            f"achats:{jour}:{fournisseur}:{mode}": {
+                "Date": jour, "Montant": -float(total), "Mode": mode, "Catégorie": "Achat",
+                "Libellé": f"Achats {fournisseur} du {jour}",
+            }
+            for (jour, fournisseur, mode), total in totaux.items()
+        }
+    # Paie : une paie revalidée pour le même mois remplace la précédente
+    mois = df["Date"].dt.strftime("%Y-%m")
+    employes = df["Employé"].astype(object)
+    dernieres = df.assign(Mois=mois, Nom=employes).drop_duplicates(["Mois", "Nom"], keep="last")
+    return {
+        f"paie:{m}:{nom}": {
+            "Date": jour.strftime("%Y-%m-%d"), "Montant": -float(net), "Mode": "Virement",
+            "Catégorie": "Personnel", "Libellé": f"Salaire {nom} {m}",
+        }
+        for m, nom, jour, net in zip(dernieres["Mois"], dernieres["Nom"], dernieres["Date"], dernieres["Net à payer"])
+    }
+
+
+def _fusionner(source, attendus, nouveaux):
+    # Ventes et achats s'additionnent (nouvelles ventes du même jour) ; une paie remplace
+    for ref, mouvement in nouveaux.items():
+        if source != "paie" and ref in attendus:
+            attendus[ref]["Montant"] += mouvement["Montant"]
+        else:
+            attendus[ref] = mouvement
+    return list(nouveaux)
+
+
+def _passes(df):
+    """Montant signé (entrée +, sortie -) déjà passé en trésorerie par référence."""
+    df = df[df["Référence"].notna()]
+    signe = df["Type"].astype(object).map({"Entrée": 1.0, "Sortie": -1.0}).fillna(0.0)
+    return (df["Montant"] * signe).groupby(df["Référence"].astype(object)).sum().to_dict()
+
+
+def _avant_debut(ref, debut):
+    """La référence (``source:AAAA-MM-JJ:...`` ou ``paie:AAAA-MM:...``) date d'avant ``debut``."""
+    date = ref.split(":")[1]
+    return date < debut[:len(date)]
+
+
+def _etat_vide():
+    return {"format": FORMAT, "debut": datetime.date.today().isoformat(), "sources": {}, "attendus": {}, "tresorerie": {"generation": None, "lus": 0},
+            "passes": {}}
+
+
+def _charger_etat():
+    try:
+        with open(_chemin(), encoding="utf-8") as f:
+            etat = json.load(f)
+    except (OSError, ValueError):
+        return _etat_vide()
+    return etat if etat.get("format") == FORMAT else _etat_vide()
+
+
+def _sauvegarder(etat):
+    contenu = json.dumps(etat, ensure_ascii=False)
+
+    def ecrire(tmp):
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(contenu)
+    journal.remplacer_atomique(_chemin(), ecrire)
+
+
+@profil.mesure("rapprochement.synchroniser")
+def synchroniser():
+    """Passe en trésorerie les mouvements nouveaux ou modifiés ; renvoie le nombre de lignes ajoutées."""
+    global _etat
+    with _verrou:
+        etat = _etat if _etat is not None else _charger_etat()
+        avant = json.dumps(etat["sources"]), json.dumps(etat["tresorerie"])
+        a_verifier = set()
+        for source in SOURCES:
+            df = donnees.charger(source)
+            suivi = etat["sources"].get(source)
+            generation = donnees.generation(source)
+            if suivi is None or suivi["generation"] != generation or len(df) < suivi["lus"]:
+                # Registre réécrit : on recalcule toutes ses références
+                anciennes = [ref for ref in etat["attendus"] if ref.startswith(source + ":")]
+                for ref in anciennes:
+                    del etat["attendus"][ref]
+                a_verifier.update(anciennes)
+                a_verifier.update(_fusionner(source, etat["attendus"], _attendus(source, df, etat["debut"])))
+                _compteurs["recalculs"] += 1
+            elif len(df) > suivi["lus"]:
+                a_verifier.update(_fusionner(source, etat["attendus"],
+                                             _attendus(source, df.iloc[suivi["lus"]:], etat["debut"])))
+                _compteurs["increments"] += 1
+            etat["sources"][source] = {"generation": generation, "lus": len(df)}
+
+        # Lecture des montants passés, calcul des écarts et ajout sous le verrou de la trésorerie :
+        # un autre processus qui rapproche en même temps attend et voit nos corrections
+        with agregats.verrouiller("tresorerie"):
+            treso = donnees.charger("tresorerie")
+            suivi = etat["tresorerie"]
+            generation = donnees.generation("tresorerie")
+            if suivi["generation"] != generation or len(treso) < suivi["lus"]:
+                etat["passes"] = _passes(treso)
+                a_verifier.update(etat["attendus"])
+            elif len(treso) > suivi["lus"]:
+                for ref, montant in _passes(treso.iloc[suivi["lus"]:]).items():
+                    etat["passes"][ref] = etat["passes"].get(ref, 0.0) + montant
+                    a_verifier.add(ref)
+
+            lignes = []
+            for ref in sorted(a_verifier):
+                if _avant_debut(ref, etat["debut"]):
+                    # Période saisie à la main : rien n'est ajouté ni annulé
+                    continue
+                attendu = etat["attendus"].get(ref)
+                cible = attendu["Montant"] if attendu is not None else 0.0
+                ecart = round(cible - etat["passes"].get(ref, 0.0), 2)
+                if not ecart:
+                    continue
+                correction = ref in etat["passes"]
+                if attendu is None:
+                    # Transaction d'origine supprimée : on annule ce qui avait été passé
+                    attendu = {"Date": datetime.date.today().isoformat(), "Mode": "Autre", "Catégorie": "Autre",
+                               "Libellé": f"Annulation {ref}"}
+                lignes.append({
+                    "Date": attendu["Date"],
+                    "Libellé": attendu["Libellé"] + (" (correction)" if correction else ""),
+                    "Type": "Entrée" if ecart > 0 else "Sortie",
+                    "Montant": abs(ecart),
+                    "Mode": attendu["Mode"],
+                    "Catégorie": attendu["Catégorie"],
+                    "Référence": ref,
+                })
+            if lignes:
+                try:
+                    agregats.ajouter_lignes("tresorerie", lignes)
+                except BaseException:
+                    # L'état en mémoire a avancé sans que la trésorerie soit écrite : on repartira du disque
+                    _etat = None
+                    raise
+                for ligne in lignes:
+                    ecart = ligne["Montant"] if ligne["Type"] == "Entrée" else -ligne["Montant"]
+                    etat["passes"][ligne["Référence"]] = etat["passes"].get(ligne["Référence"], 0.0) + ecart
+            _compteurs["mouvements"] += len(lignes)
+            etat["tresorerie"] = {"generation": donnees.generation("tresorerie"), "lus": len(donnees.charger("tresorerie"))}
+            if (json.dumps(etat["sources"]), json.dumps(etat["tresorerie"])) != avant:
+                _sauvegarder(etat)
+        _etat = etat
+        return len(lignes)
+
+
+def debut():
+    """Date (ISO) à partir de laquelle les transactions sont reportées en trésorerie."""
+    with _verrou:
+        return (_etat if _etat is not None else _charger_etat())["debut"]
+
+
+def definir_debut(date):
+    """Change la date de départ ; le prochain ``synchroniser`` recalcule toutes les sources."""
+    global _etat
+    with _verrou:
+        etat = _etat if _etat is not None else _charger_etat()
+        etat["debut"] = pd.Timestamp(date).date().isoformat()
+        etat["sources"] = {}
+        _sauvegarder(etat)
+        _etat = etat
+
+
+@profil.mesure("rapprochement.ecarts_bancaires")
+def ecarts_bancaires(tolerance=1.0, modes_exclus=("Espèces",)):
+    """Variation des soldes bancaires de fin de mois comparée aux flux de trésorerie du mois.
+
+    Les soldes (tous comptes) viennent du registre ``soldes_bancaires``. Renvoie
+    un DataFrame par mois avec la colonne ``Écart`` et ``Anomalie`` (écart
+    supérieur à ``tolerance``).
+    """
+    colonnes = ["Solde banque", "Variation banque", "Flux trésorerie", "Écart", "Anomalie"]
+    fins_de_mois = banque.series_soldes("ME")
+    if fins_de_mois.empty:
+        return pd.DataFrame(columns=colonnes)
+    # Un compte sans solde saisi ce mois-là garde son dernier solde connu
+    banque_mois = fins_de_mois.ffill().sum(axis=1)
+    banque_mois.index = banque_mois.index.to_period("M")
+
+    treso = donnees.charger("tresorerie")
+    treso = treso[treso["Date"].notna() & ~treso["Mode"].astype(object).isin(modes_exclus)]
+    signe = treso["Type"].astype(object).map({"Entrée": 1.0, "Sortie": -1.0}).fillna(0.0)
+    flux = (treso["Montant"] * signe).groupby(treso["Date"].dt.to_period("M")).sum()
+
+    rapport = pd.DataFrame({"Solde banque": banque_mois, "Variation banque": banque_mois.diff()})
+    rapport["Flux trésorerie"] = flux.reindex(rapport.index, fill_value=0.0)
+    rapport["Écart"] = rapport["Variation banque"] - rapport["Flux trésorerie"]
+    rapport["Anomalie"] = rapport["Écart"].abs() > tolerance
+    rapport.index = rapport.index.astype(str)
+    rapport.index.name = "Mois"
+    return rapport[colonnes]
+
+
+def _travailleur():
+    global _fond
+    with _verrou:
+        if _fond is None:
+            _fond = travailleur.Travailleur(nb_threads=1)
+        return _fond
+
+
+def _sur_ecriture(nom):
+    if nom in SOURCES:
+        _travailleur().soumettre(("rapprochement",), synchroniser)
+
+
+def activer():
+    """Relance le rapprochement en fond après chaque écriture d'une source (une fois par processus)."""
+    donnees.abonner(_sur_ecriture)
+
+
+def stats():
+    with _verrou:
+        return dict(_compteurs)
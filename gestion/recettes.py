@@ -0,0 +1,132 @@
+"""Moteur de calcul des recettes : consommation d'ingrédients et coût matière.
+
+Les recettes (``{nom: {"ingredients": {ingrédient: quantité pour 1 portion}}}``)
+sont compilées une fois en une matrice creuse recette x ingrédient. Ensuite :
+
+- portions à produire (vecteur par recette) x matrice = quantités d'ingrédients ;
+- ventes par jour (matrice jour x recette) x matrice = consommation par jour ;
+- matrice x prix des ingrédients = coût matière par plat.
+
+Les quantités des recettes sont supposées dans la même unité que les achats
+de l'ingrédient (prix unitaire par kg si la recette est en kg, etc.).
+scipy est utilisé s'il est installé ; sinon la matrice est densifiée (quelques
+centaines de recettes et d'ingrédients tiennent sans problème en mémoire).
+"""
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+
+from gestion import profil
+
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+
+class MatriceRecettes:
+    def __init__(self, recettes):
+        self.recettes = pd.Index(list(recettes), name="Recette")
+        ingredients = sorted({i for r in recettes.values() for i in r.get("ingredients", {})})
+        self.ingredients = pd.Index(ingredients, name="Ingrédient")
+        lignes, colonnes, valeurs = [], [], []
+        for i, details in enumerate(recettes.values()):
+            for ingr, qte in details.get("ingredients", {}).items():
+                lignes.append(i)
+                colonnes.append(self.ingredients.get_loc(ingr))
+                valeurs.append(float(qte or 0))
+        forme = (len(self.recettes), len(self.ingredients))
+        if sparse is not None:
+            self.matrice = sparse.csr_matrix((valeurs, (lignes, colonnes)), shape=forme)
+        else:
+            self.matrice = np.zeros(forme)
+            np.add.at(self.matrice, (np.array(lignes, dtype=int), np.array(colonnes, dtype=int)), valeurs)
+
+    def _vecteur(self, portions):
+        """Aligne ``portions`` ({recette: n} ou Series) sur l'ordre des recettes ; les inconnues sont ignorées."""
+        return pd.Series(portions, dtype="float64").reindex(self.recettes, fill_value=0.0).to_numpy()
+
+    def consommation(self, portions):
+        """Quantité de chaque ingrédient pour produire ``portions`` ({recette: nombre})."""
+        besoins = self.matrice.T @ self._vecteur(portions)
+        return pd.Series(np.asarray(besoins).ravel(), index=self.ingredients, name="Quantité")
+
+    def consommation_par_jour(self, df_ventes):
+        """Consommation d'ingrédients par jour (DataFrame jour x ingrédient) à partir des ventes."""
+        if df_ventes.empty or not len(self.recettes):
+            return pd.DataFrame(columns=self.ingredients, dtype="float64")
+        jours = df_ventes["Date"].dt.normalize().rename("Jour")
+        ventes = (
+            df_ventes.groupby([jours, df_ventes["Produit"].astype(object)])["Quantité"].sum()
+            .unstack(fill_value=0.0)
+            .reindex(columns=self.recettes, fill_value=0.0)
+        )
+        conso = self.matrice.T @ ventes.to_numpy().T
+        return pd.DataFrame(np.asarray(conso).T, index=ventes.index, columns=self.ingredients)
+
+    def cout_par_plat(self, prix):
+        """Coût matière d'une portion de chaque recette, ``prix`` étant une Series par ingrédient."""
+        p = pd.Series(prix, dtype="float64").reindex(self.ingredients, fill_value=0.0).to_numpy()
+        return pd.Series(np.asarray(self.matrice @ p).ravel(), index=self.recettes, name="Coût matière (€)")
+
+
+def _derniers_achats(df_achats):
+    """Dernier achat de chaque produit, indexé par produit."""
+    derniers = df_achats.sort_values("Date", kind="stable").drop_duplicates("Produit", keep="last")
+    return derniers.set_index(derniers["Produit"].astype(object))
+
+
+def prix_ingredients(df_achats):
+    """Dernier prix unitaire payé pour chaque produit acheté."""
+    if df_achats.empty:
+        return pd.Series(dtype="float64", name="Prix unitaire")
+    return _derniers_achats(df_achats)["Prix unitaire"]
+
+
+def stock_projete(niveaux, consommation):
+    """Quantités en stock (Series par ingrédient) après ``consommation`` (Series par ingrédient)."""
+    actuel = pd.Series(niveaux, dtype="float64")
+    index = actuel.index.union(consommation.index)
+    return (actuel.reindex(index, fill_value=0.0) - consommation.reindex(index, fill_value=0.0)).rename("Stock projeté")
+
+
+def liste_courses(besoins, niveaux, df_achats):
+    """Ingrédients à acheter pour couvrir ``besoins`` (Series par ingrédient) avec le stock ``niveaux``.
+
+    Pour chaque ingrédient manquant : besoin, stock, quantité à acheter, dernier
+    fournisseur et dernier prix payé (registre des achats) et coût estimé.
+    """
+    besoins = besoins[besoins > 0]
+    en_stock = pd.Series(niveaux, dtype="float64").reindex(besoins.index, fill_value=0.0).clip(lower=0.0)
+    manque = besoins - en_stock
+    manque = manque[manque > 0]
+    derniers = _derniers_achats(df_achats).reindex(manque.index)
+    liste = pd.DataFrame({
+        "Besoin": besoins[manque.index],
+        "En stock": en_stock[manque.index],
+        "À acheter": manque,
+        "Fournisseur": derniers["Fournisseur"].astype(object),
+        "Prix unitaire": derniers["Prix unitaire"],
+        "Coût estimé (€)": (manque * derniers["Prix unitaire"]).round(2),
+    })
+    liste.index.name = "Ingrédient"
+    return liste
+
+
+_compilees = {}
+_verrou = threading.Lock()
+
+
+@profil.mesure("recettes.compiler")
+def compiler(recettes):
+    """Matrice des recettes, recompilée seulement quand leur contenu change."""
+    cle = json.dumps(recettes, sort_keys=True, default=str)
+    with _verrou:
+        matrice = _compilees.get(cle)
+        if matrice is None:
+            matrice = MatriceRecettes(recettes)
+            _compilees.clear()
+            _compilees[cle] = matrice
+        return matrice
@@ -0,0 +1,135 @@
+"""Registres stockés dans une base SQLite (``MAISON_SABA_STOCKAGE=sqlite``).
+
+Une table par registre, indexée sur (Date), (Produit, Date) et
+(Catégorie, Date) quand ces colonnes existent. Les filtres par période et les
+GROUP BY des tableaux de bord sont exécutés en SQL : seules les lignes ou les
+totaux affichés remontent dans pandas.
+
+La base est en mode WAL : les lectures ne bloquent pas et les écritures
+passent par ``BEGIN IMMEDIATE``, donc un seul écrivain à la fois, même avec
+plusieurs sessions Streamlit ou plusieurs processus. Chaque écriture
+incrémente la version du registre, utilisée comme clé de cache et comme
+révision pour détecter les modifications concurrentes ; seules les
+réécritures complètes (modification, suppression) changent sa génération.
+"""
+import sqlite3
+import threading
+
+import pandas as pd
+
+from gestion.verrous import ConflitEcriture
+
+
+def _q(nom):
+    # Les colonnes ont des espaces et des accents : toujours les citer
+    return '"' + nom.replace('"', '""') + '"'
+
+
+class RegistreSQLite:
+    nom = "sqlite"
+
+    def __init__(self, path, registres):
+        self.path = path
+        self.registres = registres
+        self._local = threading.local()
+        self._creer_schema()
+
+    def connexion(self):
+        # sqlite3 n'aime pas partager une connexion entre threads (une session Streamlit = un thread)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _creer_schema(self):
+        conn = self.connexion()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS versions "
+            "(registre TEXT PRIMARY KEY, version INTEGER NOT NULL, generation INTEGER NOT NULL DEFAULT 0)"
+        )
+        colonnes_versions = [ligne[1] for ligne in conn.execute("PRAGMA table_info(versions)")]
+        if "generation" not in colonnes_versions:
+            conn.execute("ALTER TABLE versions ADD COLUMN generation INTEGER NOT NULL DEFAULT 0")
+        for nom, schema in self.registres.items():
+            colonnes = []
+            for col in schema["colonnes"]:
+                type_sql = "REAL" if col in schema["numeriques"] else "TEXT"
+                colonnes.append(f"{_q(col)} {type_sql}")
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {_q(nom)} ({', '.join(colonnes)})")
+            existantes = [ligne[1] for ligne in conn.execute(f"PRAGMA table_info({_q(nom)})")]
+            for col, definition in zip(schema["colonnes"], colonnes):
+                if col not in existantes:
+                    conn.execute(f"ALTER TABLE {_q(nom)} ADD COLUMN {definition}")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {_q(f'idx_{nom}_date')} ON {_q(nom)} ({_q('Date')})")
+            for col in ("Produit", "Catégorie"):
+                if col in schema["colonnes"]:
+                    conn.execute(
+                        f"CREATE INDEX IF NOT EXISTS {_q(f'idx_{nom}_{col}_date')} "
+                        f"ON {_q(nom)} ({_q(col)}, {_q('Date')})"
+                    )
+            conn.execute("INSERT OR IGNORE INTO versions (registre, version) VALUES (?, 0)", (nom,))
+
+    # --- lecture -------------------------------------------------------------
+
+    def version(self, nom):
+        ligne = self.connexion().execute("SELECT version FROM versions WHERE registre = ?", (nom,)).fetchone()
+        return ligne[0] if ligne else 0
+
+    def generation(self, nom):
+        ligne = self.connexion().execute("SELECT generation FROM versions WHERE registre = ?", (nom,)).fetchone()
+        return ligne[0] if ligne else 0
+
+    def lire(self, nom, where="", params=()):
+        colonnes = ", ".join(_q(c) for c in self.registres[nom]["colonnes"])
+        sql = f"SELECT {colonnes} FROM {_q(nom)} {where} ORDER BY rowid"
+        return pd.read_sql_query(sql, self.connexion(), params=params)
+
+    def requete(self, sql, params=()):
+        return self.connexion().execute(sql, params).fetchall()
+
+    # --- écriture ------------------------------------------------------------
+
+    def _transaction(self, nom, ecrire, reecriture=False, version_lue=None):
+        conn = self.connexion()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = self.version(nom)
+            if version_lue is not None and version != version_lue:
+                raise ConflitEcriture(f"{nom} : version {version}, modification lue à la version {version_lue}")
+            ecrire(conn)
+            conn.execute(
+                "UPDATE versions SET version = version + 1, generation = generation + ? WHERE registre = ?",
+                (1 if reecriture else 0, nom),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return version + 1
+
+    def _valeurs(self, nom, lignes):
+        colonnes = self.registres[nom]["colonnes"]
+        return [tuple(None if pd.isna(l.get(c)) else l.get(c) for c in colonnes) for l in lignes]
+
+    def _insert(self, nom):
+        colonnes = self.registres[nom]["colonnes"]
+        return (f"INSERT INTO {_q(nom)} ({', '.join(_q(c) for c in colonnes)}) "
+                f"VALUES ({', '.join('?' for _ in colonnes)})")
+
+    def ajouter_lignes(self, nom, lignes):
+        valeurs = self._valeurs(nom, lignes)
+        return self._transaction(nom, lambda conn: conn.executemany(self._insert(nom), valeurs))
+
+    def remplacer(self, nom, df, version_lue=None):
+        df = df.copy()
+        df["Date"] = pd.to_datetime(df["Date"], errors="coerce").dt.strftime("%Y-%m-%d")
+        valeurs = self._valeurs(nom, df.astype(object).to_dict("records"))
+
+        def ecrire(conn):
+            conn.execute(f"DELETE FROM {_q(nom)}")
+            conn.executemany(self._insert(nom), valeurs)
+        return self._transaction(nom, ecrire, reecriture=True, version_lue=version_lue)
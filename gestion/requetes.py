@@ -0,0 +1,121 @@
+"""Requêtes des historiques : filtres par période et par modalité, tri et pagination.
+
+Avec le stockage SQLite, filtres et tris sont exécutés en SQL et profitent
+des index sur (Date), (Produit, Date) et (Catégorie, Date). Avec les fichiers
+CSV/Parquet, le même résultat est calculé sur le DataFrame en cache.
+
+Les historiques sont paginés (``page``) : filtres et tri sont appliqués dans
+la couche de données et seule la page affichée est construite en DataFrame.
+
+Les périodes sont des intervalles semi-ouverts ``[debut, fin[`` de dates.
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from gestion import donnees, profil
+from gestion.registre_sql import _q
+
+
+def _where(debut, fin, valeurs=None):
+    conditions, params = [], []
+    for colonne, choix in (valeurs or {}).items():
+        if choix:
+            conditions.append(f"{_q(colonne)} IN ({', '.join('?' for _ in choix)})")
+            params.extend(choix)
+    if debut is not None:
+        conditions.append(f"{_q('Date')} >= ?")
+        params.append(debut.isoformat())
+    if fin is not None:
+        conditions.append(f"{_q('Date')} < ?")
+        params.append(fin.isoformat())
+    return ("WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+
+def _filtrer(df, debut, fin):
+    if debut is not None:
+        df = df[df["Date"] >= pd.Timestamp(debut)]
+    if fin is not None:
+        df = df[df["Date"] < pd.Timestamp(fin)]
+    return df
+
+
+def lignes(nom, debut=None, fin=None):
+    """Lignes du registre ``nom`` sur la période."""
+    if donnees.SQL is not None:
+        where, params = _where(debut, fin)
+        return donnees._typer(nom, donnees.SQL.lire(nom, where, params))
+    return _filtrer(donnees.charger(nom), debut, fin)
+
+
+@profil.mesure("requetes.modalites")
+def modalites(nom, colonne):
+    """Valeurs distinctes de ``colonne`` (pour les filtres des historiques), triées."""
+    if donnees.SQL is not None:
+        res = donnees.SQL.requete(f"SELECT DISTINCT {_q(colonne)} FROM {_q(nom)} WHERE {_q(colonne)} IS NOT NULL")
+        return sorted(str(v) for (v,) in res)
+    serie = donnees.charger(nom)[colonne]
+    valeurs = serie.cat.categories if isinstance(serie.dtype, pd.CategoricalDtype) else serie.dropna().unique()
+    return sorted(str(v) for v in valeurs)
+
+
+# Ordre de tri de chaque registre, gardé tant que le registre ne change pas :
+# (nom, colonne) -> (version, positions triées par ordre croissant)
+_ordres = {}
+_verrou = threading.Lock()
+
+
+def _ordre(nom, df, colonne):
+    version = donnees.version(nom)
+    with _verrou:
+        entree = _ordres.get((nom, colonne))
+        if entree is not None and entree[0] == version and len(entree[1]) == len(df):
+            return entree[1]
+    serie = df[colonne]
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        serie = serie.astype(object)
+    # Tri stable : à valeur égale, l'ordre de saisie est conservé
+    ordre = np.argsort(serie.to_numpy(), kind="stable") if not serie.isna().any() \
+        else serie.reset_index(drop=True).sort_values(kind="stable", na_position="first").index.to_numpy()
+    with _verrou:
+        _ordres[(nom, colonne)] = (version, ordre)
+    return ordre
+
+
+@profil.mesure("requetes.page")
+def page(nom, numero=0, taille=50, debut=None, fin=None, valeurs=None, tri="Date", descendant=True):
+    """Une page de l'historique du registre ``nom`` et le nombre total de lignes filtrées.
+
+    ``valeurs`` restreint des colonnes à une liste de modalités
+    (``{"Produit": ["Café"]}``). Les lignes sont triées sur ``tri`` ; à valeur
+    égale, la plus récemment saisie vient en premier si ``descendant``.
+    """
+    sens = "DESC" if descendant else "ASC"
+    if donnees.SQL is not None:
+        where, params = _where(debut, fin, valeurs)
+        total = donnees.SQL.requete(f"SELECT COUNT(*) FROM {_q(nom)} {where}", params)[0][0]
+        colonnes = ", ".join(_q(c) for c in donnees.REGISTRES[nom]["colonnes"])
+        lignes_page = pd.read_sql_query(
+            f"SELECT {colonnes} FROM {_q(nom)} {where} ORDER BY {_q(tri)} {sens}, rowid {sens} LIMIT ? OFFSET ?",
+            donnees.SQL.connexion(), params=[*params, taille, numero * taille],
+        )
+        return donnees._typer(nom, lignes_page), total
+
+    df = donnees.charger(nom)
+    ordre = _ordre(nom, df, tri)
+    if descendant:
+        ordre = ordre[::-1]
+    if debut is None and fin is None and not any((valeurs or {}).values()):
+        # Sans filtre, pas besoin de parcourir le registre
+        return df.iloc[ordre[numero * taille:(numero + 1) * taille]], len(df)
+    masque = np.ones(len(df), dtype=bool)
+    if debut is not None:
+        masque &= (df["Date"] >= pd.Timestamp(debut)).to_numpy()
+    if fin is not None:
+        masque &= (df["Date"] < pd.Timestamp(fin)).to_numpy()
+    for colonne, choix in (valeurs or {}).items():
+        if choix:
+            masque &= df[colonne].isin(choix).to_numpy()
+    retenues = ordre[masque[ordre]]
+    return df.iloc[retenues[numero * taille:(numero + 1) * taille]], len(retenues)
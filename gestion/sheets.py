@@ -0,0 +1,273 @@
+"""Client Google Sheets (API v4) et synchronisation incrémentale des registres.
+
+- une seule ``requests.Session`` par client, avec pool de connexions et timeout ;
+- plusieurs plages lues en un aller-retour avec ``values:batchGet`` ;
+- réponses gardées en cache pendant ``ttl`` secondes, puis revalidées par
+  ETag (``If-None-Match``) quand le serveur en fournit un ;
+- attente exponentielle (et ``Retry-After``) sur les réponses 429 et 5xx ;
+- ``SyncRegistre`` ne pousse que les lignes ajoutées, modifiées ou
+  supprimées depuis le dernier envoi, à leur place dans l'onglet.
+
+La lecture d'une feuille publique se fait avec une clé d'API ; l'écriture
+demande un jeton OAuth (``jeton``) ou des identifiants google-auth
+(``identifiants``, par exemple un compte de service), rafraîchis au besoin.
+"""
+import json
+import os
+import random
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from gestion import donnees, journal
+
+URL_API = "https://sheets.googleapis.com/v4"
+
+
+class ErreurSheets(Exception):
+    def __init__(self, statut, message):
+        super().__init__(f"Erreur {statut}: {message}")
+        self.statut = statut
+
+
+class ClientSheets:
+    def __init__(self, api_key=None, jeton=None, url=URL_API, ttl=60.0, timeout=10.0,
+                 tentatives=5, attente_base=0.5, taille_pool=10, identifiants=None):
+        self.api_key = api_key
+        self.jeton = jeton
+        self.identifiants = identifiants
+        self.url = url.rstrip("/")
+        self.ttl = ttl
+        self.timeout = timeout
+        self.tentatives = tentatives
+        self.attente_base = attente_base
+        # Import au premier client : la plupart des processus ne synchronisent jamais
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        self.session = requests.Session()
+        # urllib3 ne réessaie que les erreurs de connexion ; 429 / 5xx sont gérés dans _envoyer
+        reessais = Retry(total=2, read=0, status=0, respect_retry_after_header=False)
+        adaptateur = HTTPAdapter(pool_connections=taille_pool, pool_maxsize=taille_pool, max_retries=reessais)
+        self.session.mount("https://", adaptateur)
+        self.session.mount("http://", adaptateur)
+        self._cache = {}  # cle -> (horodatage, etag, json)
+        self._verrou = threading.Lock()
+        self.compteurs = {"requetes": 0, "cache": 0, "revalidations": 0, "attentes_429": 0}
+
+    def _params(self, params):
+        params = list(params)
+        if self.api_key:
+            params.append(("key", self.api_key))
+        return params
+
+    def _entetes(self):
+        if self.identifiants is not None:
+            if not self.identifiants.valid:
+                from google.auth.transport.requests import Request
+                self.identifiants.refresh(Request(self.session))
+            return {"Authorization": f"Bearer {self.identifiants.token}"}
+        return {"Authorization": f"Bearer {self.jeton}"} if self.jeton else {}
+
+    def _envoyer(self, methode, chemin, params=(), json_corps=None, entetes=None, idempotent=False):
+        url = f"{self.url}/{chemin}"
+        entetes = dict(self._entetes(), **(entetes or {}))
+        for tentative in range(self.tentatives):
+            self.compteurs["requetes"] += 1
+            reponse = self.session.request(methode, url, params=self._params(params), json=json_corps,
+                                           headers=entetes, timeout=self.timeout)
+            if reponse.status_code != 429 and reponse.status_code < 500:
+                return reponse
+            if reponse.status_code != 429 and methode != "GET" and not idempotent:
+                # Un POST en 5xx a pu être appliqué : le rejouer risquerait un doublon
+                return reponse
+            if reponse.status_code == 429:
+                self.compteurs["attentes_429"] += 1
+            if tentative == self.tentatives - 1:
+                break
+            attente = reponse.headers.get("Retry-After")
+            try:
+                attente = float(attente)
+            except (TypeError, ValueError):
+                attente = self.attente_base * 2 ** tentative + random.uniform(0, self.attente_base)
+            time.sleep(attente)
+        raise ErreurSheets(reponse.status_code, reponse.text)
+
+    def _get_cache(self, chemin, params):
+        cle = (chemin, tuple(params))
+        with self._verrou:
+            entree = self._cache.get(cle)
+        if entree is not None and time.monotonic() - entree[0] < self.ttl:
+            self.compteurs["cache"] += 1
+            return entree[2]
+        entetes = {"If-None-Match": entree[1]} if entree is not None and entree[1] else None
+        reponse = self._envoyer("GET", chemin, params, entetes=entetes)
+        if reponse.status_code == 304 and entree is not None:
+            self.compteurs["revalidations"] += 1
+            contenu = entree[2]
+        elif reponse.status_code == 200:
+            contenu = reponse.json()
+        else:
+            raise ErreurSheets(reponse.status_code, reponse.text)
+        with self._verrou:
+            self._cache[cle] = (time.monotonic(), reponse.headers.get("ETag") or (entree[1] if entree else None), contenu)
+        return contenu
+
+    def vider_cache(self):
+        with self._verrou:
+            self._cache.clear()
+
+    # --- lecture -------------------------------------------------------------
+
+    def lire_plages(self, sheet_id, plages):
+        """Valeurs de plusieurs plages en une requête ``values:batchGet`` : {plage: lignes}."""
+        params = [("ranges", p) for p in plages]
+        contenu = self._get_cache(f"spreadsheets/{sheet_id}/values:batchGet", params)
+        valeurs = [vr.get("values", []) for vr in contenu.get("valueRanges", [])]
+        return dict(zip(plages, valeurs))
+
+    def lire_plage(self, sheet_id, plage):
+        return self.lire_plages(sheet_id, [plage])[plage]
+
+    # --- écriture ------------------------------------------------------------
+
+    def ecrire_plages(self, sheet_id, plages):
+        """Écrit ``{plage: lignes}`` à ces positions exactes (``values:batchUpdate``, rejouable)."""
+        reponse = self._envoyer(
+            "POST", f"spreadsheets/{sheet_id}/values:batchUpdate",
+            json_corps={"valueInputOption": "USER_ENTERED",
+                        "data": [{"range": plage, "values": lignes} for plage, lignes in plages.items()]},
+            idempotent=True,
+        )
+        if reponse.status_code != 200:
+            raise ErreurSheets(reponse.status_code, reponse.text)
+        self.vider_cache()
+        return reponse.json()
+
+    def effacer_plages(self, sheet_id, plages):
+        """Vide les cellules de ``plages`` (``values:batchClear``, rejouable)."""
+        reponse = self._envoyer("POST", f"spreadsheets/{sheet_id}/values:batchClear",
+                                json_corps={"ranges": list(plages)}, idempotent=True)
+        if reponse.status_code != 200:
+            raise ErreurSheets(reponse.status_code, reponse.text)
+        self.vider_cache()
+        return reponse.json()
+
+
+def identifiants_compte_service(path):
+    """Identifiants google-auth d'un compte de service (fichier JSON) pour écrire dans Sheets."""
+    from google.oauth2.service_account import Credentials
+    return Credentials.from_service_account_file(
+        path, scopes=["https://www.googleapis.com/auth/spreadsheets"]
+    )
+
+
+_clients = {}
+_verrou_clients = threading.Lock()
+
+
+def client(api_key=None, jeton=None):
+    """Client partagé (une session et un pool par clé) pour tout le processus."""
+    with _verrou_clients:
+        cle = (api_key, jeton)
+        if cle not in _clients:
+            _clients[cle] = ClientSheets(api_key=api_key, jeton=jeton)
+        return _clients[cle]
+
+
+class SyncRegistre:
+    """Copie d'un registre local dans un onglet Google Sheets, mise à jour par différence.
+
+    L'onglet contient une ligne d'en-tête puis la ligne ``i`` du registre en
+    ligne ``i + 2``. Le point de synchronisation garde une empreinte de chaque
+    ligne envoyée (``sync_<registre>.npy``) et la génération du registre à ce
+    moment (``sync_<registre>.json``) :
+
+    - registre seulement complété depuis (même génération) : seules les
+      nouvelles lignes sont lues et envoyées ;
+    - registre réécrit (modification, suppression) : les empreintes de toutes
+      les lignes sont recalculées et seules celles qui diffèrent sont
+      réécrites ; les lignes en trop dans l'onglet sont vidées.
+
+    Les envois écrivent des plages fixes : les rejouer après une erreur ne
+    crée jamais de doublon.
+    """
+    # Lignes par requête batchUpdate
+    TAILLE_ENVOI = 10_000
+
+    def __init__(self, client_sheets, sheet_id, onglet, registre):
+        self.client = client_sheets
+        self.sheet_id = sheet_id
+        self.onglet = onglet
+        self.registre = registre
+        self.colonnes = donnees.REGISTRES[registre]["colonnes"]
+        self.path = os.path.join(donnees.DOSSIER, f"sync_{registre}.json")
+        self.path_empreintes = os.path.join(donnees.DOSSIER, f"sync_{registre}.npy")
+
+    def repere(self):
+        """Génération du registre et empreintes des lignes au dernier envoi."""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                generation = json.load(f).get("generation")
+            empreintes = np.load(self.path_empreintes)
+        except (OSError, ValueError):
+            return None, np.zeros(0, dtype="uint64")
+        return generation, empreintes
+
+    def _enregistrer(self, generation, empreintes):
+        def ecrire_empreintes(tmp):
+            with open(tmp, "wb") as f:
+                np.save(f, empreintes)
+        journal.remplacer_atomique(self.path_empreintes, ecrire_empreintes)
+
+        contenu = json.dumps({"generation": generation, "lignes": len(empreintes)})
+
+        def ecrire(tmp):
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(contenu)
+        journal.remplacer_atomique(self.path, ecrire)
+
+    def _derniere_colonne(self):
+        return chr(ord("A") + len(self.colonnes) - 1)
+
+    def _valeurs(self, df):
+        valeurs = df[self.colonnes].astype(object).where(df[self.colonnes].notna(), "")
+        valeurs["Date"] = [d.strftime("%Y-%m-%d") if hasattr(d, "strftime") else d for d in valeurs["Date"]]
+        return valeurs
+
+    def _plage(self, premiere, derniere):
+        """Plage de l'onglet des lignes ``premiere`` à ``derniere`` (incluses) du registre."""
+        return f"{self.onglet}!A{premiere + 2}:{self._derniere_colonne()}{derniere + 2}"
+
+    def pousser(self):
+        """Envoie les lignes ajoutées ou modifiées depuis le dernier envoi ; renvoie leur nombre."""
+        generation = donnees.generation(self.registre)
+        df = donnees.charger(self.registre)
+        generation_envoyee, anciennes = self.repere()
+        # Même génération : les lignes déjà envoyées n'ont pas bougé, seules les suivantes sont lues
+        debut = len(anciennes) if generation_envoyee == generation and len(anciennes) <= len(df) else 0
+        valeurs = self._valeurs(df.iloc[debut:])
+        empreintes = np.concatenate([anciennes[:debut],
+                                     pd.util.hash_pandas_object(valeurs, index=False).to_numpy(dtype="uint64")])
+        communes = min(len(anciennes), len(empreintes))
+        a_ecrire = np.concatenate([np.flatnonzero(anciennes[:communes] != empreintes[:communes]),
+                                   np.arange(communes, len(empreintes))])
+        plages = {}
+        if not len(anciennes):
+            plages[f"{self.onglet}!A1:{self._derniere_colonne()}1"] = [self.colonnes]
+        # Blocs de lignes consécutives, découpés en requêtes de TAILLE_ENVOI lignes au plus
+        for bloc in np.split(a_ecrire, np.flatnonzero(np.diff(a_ecrire) != 1) + 1):
+            for i in range(0, len(bloc), self.TAILLE_ENVOI):
+                morceau = bloc[i:i + self.TAILLE_ENVOI]
+                plages[self._plage(morceau[0], morceau[-1])] = valeurs.iloc[morceau - debut].values.tolist()
+                if sum(len(lignes) for lignes in plages.values()) >= self.TAILLE_ENVOI:
+                    self.client.ecrire_plages(self.sheet_id, plages)
+                    plages = {}
+        if plages:
+            self.client.ecrire_plages(self.sheet_id, plages)
+        if len(anciennes) > len(empreintes):
+            self.client.effacer_plages(self.sheet_id, [self._plage(len(empreintes), len(anciennes) - 1)])
+        self._enregistrer(generation, empreintes)
+        return len(a_ecrire)
@@ -0,0 +1,184 @@
+"""Niveaux de stock calculés à partir des mouvements (event sourcing).
+
+Le stock n'est plus saisi à la main : il se déduit des événements.
+
+- chaque achat ajoute sa quantité à l'ingrédient acheté (registre ``achats``) ;
+- chaque vente retire les ingrédients de la recette du plat vendu
+  (registre ``ventes`` x matrice des recettes) ;
+- un inventaire (registre ``mouvements_stock``, type "Inventaire") fixe le niveau
+  compté en fin de journée : les achats et les ventes du jour de l'inventaire
+  sont dans le compte, seuls ceux datés après comptent ensuite ;
+- un ajustement (type "Ajustement") ajoute ou retire une quantité (perte,
+  production hors vente...). Le jour d'un inventaire, il compte s'il a été
+  saisi après l'inventaire (rang dans ``mouvements_stock``) : une déduction
+  faite juste après le comptage n'est pas perdue.
+
+L'état (niveaux, dates d'inventaire, nombre de lignes déjà lues par registre)
+est gardé en instantané (``stock_instantane.json``). À chaque appel, seules les
+lignes ajoutées depuis sont rejouées ; un recalcul complet, vectorisé, n'a lieu
+que si un registre a été réécrit, si les recettes changent ou si un inventaire
+arrive.
+"""
+import datetime
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from gestion import donnees, journal, profil
+from gestion import recettes as moteur_recettes
+
+SOURCES = ["achats", "ventes", "mouvements_stock"]
+# À incrémenter si la structure de l'instantané change
+FORMAT = 2
+
+_etat = None
+_verrou = threading.RLock()
+_compteurs = {"reconstructions": 0, "rejeux": 0}
+
+
+def _chemin():
+    return os.path.join(donnees.DOSSIER, "stock_instantane.json")
+
+
+def _cle_recettes(recettes):
+    return json.dumps(recettes, sort_keys=True, default=str)
+
+
+def _dates_inventaire(etat, ingredients):
+    dates = pd.Series(etat["inventaires"], dtype="object").reindex(ingredients)
+    # Sans inventaire, tous les événements comptent
+    return pd.to_datetime(dates).fillna(pd.Timestamp("1900-01-01"))
+
+
+def _appliquer(etat, matrice, achats, ventes, ajustements):
+    """Ajoute aux niveaux les événements postérieurs à l'inventaire de chaque ingrédient."""
+    niveaux = pd.Series(etat["niveaux"], dtype="float64")
+
+    if not achats.empty:
+        produits = achats["Produit"].astype(object)
+        apres = achats["Date"] > _dates_inventaire(etat, produits).to_numpy()
+        niveaux = niveaux.add(achats.loc[apres, "Quantité"].groupby(produits[apres]).sum(), fill_value=0.0)
+
+    if not ventes.empty and len(matrice.ingredients):
+        conso = matrice.consommation_par_jour(ventes)
+        limites = _dates_inventaire(etat, conso.columns).to_numpy()
+        apres = conso.index.to_numpy()[:, None] > limites[None, :]
+        niveaux = niveaux.sub(pd.Series(np.where(apres, conso.to_numpy(), 0.0).sum(axis=0), index=conso.columns),
+                              fill_value=0.0)
+
+    if not ajustements.empty:
+        # Le jour de l'inventaire, l'ordre de saisie départage (index = rang dans mouvements_stock)
+        ingredients = ajustements["Ingrédient"].astype(object)
+        limites = _dates_inventaire(etat, ingredients).to_numpy()
+        rangs = pd.Series(etat["rangs"], dtype="float64").reindex(ingredients).fillna(-1.0).to_numpy()
+        apres = (ajustements["Date"] > limites) | (
+            (ajustements["Date"] == limites) & (ajustements.index.to_numpy() > rangs))
+        niveaux = niveaux.add(ajustements.loc[apres, "Quantité"].groupby(ingredients[apres]).sum(), fill_value=0.0)
+
+    etat["niveaux"] = {k: float(v) for k, v in niveaux.items()}
+
+
+def _reconstruire(recettes, matrice, generations):
+    mouvements = donnees.charger("mouvements_stock")
+    inventaires = mouvements[mouvements["Type"] == "Inventaire"]
+    # Dernier inventaire de chaque ingrédient (à date égale, le dernier saisi)
+    derniers = inventaires.sort_values("Date", kind="stable").drop_duplicates("Ingrédient", keep="last")
+    etat = {
+        "format": FORMAT,
+        "niveaux": {str(i): float(q) for i, q in zip(derniers["Ingrédient"], derniers["Quantité"])},
+        "inventaires": {str(i): d.isoformat() for i, d in zip(derniers["Ingrédient"], derniers["Date"])},
+        "rangs": {str(i): int(r) for i, r in zip(derniers["Ingrédient"], derniers.index)},
+        "lus": {},
+        "generations": generations,
+        "recettes": _cle_recettes(recettes),
+    }
+    frames = {nom: donnees.charger(nom) for nom in SOURCES}
+    _appliquer(etat, matrice, frames["achats"], frames["ventes"],
+               mouvements[mouvements["Type"] == "Ajustement"])
+    etat["lus"] = {nom: len(df) for nom, df in frames.items()}
+    _compteurs["reconstructions"] += 1
+    return etat
+
+
+def _sauvegarder(etat):
+    contenu = json.dumps(etat, ensure_ascii=False)
+
+    def ecrire(tmp):
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(contenu)
+    journal.remplacer_atomique(_chemin(), ecrire)
+
+
+def _depuis_disque():
+    try:
+        with open(_chemin(), encoding="utf-8") as f:
+            etat = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return etat if etat.get("format") == FORMAT else None
+
+
+@profil.mesure("stock.niveaux")
+def niveaux(recettes):
+    """Niveau de stock actuel de chaque ingrédient (Series), mis à jour par rejeu incrémental."""
+    global _etat
+    matrice = moteur_recettes.compiler(recettes)
+    generations = {nom: donnees.generation(nom) for nom in SOURCES}
+    with _verrou:
+        etat = _etat if _etat is not None else _depuis_disque()
+        frames = {nom: donnees.charger(nom) for nom in SOURCES}
+        valide = (
+            etat is not None
+            and etat["generations"] == generations
+            and etat["recettes"] == _cle_recettes(recettes)
+            and all(len(frames[nom]) >= etat["lus"].get(nom, 0) for nom in SOURCES)
+        )
+        nouveaux_mvts = frames["mouvements_stock"].iloc[etat["lus"]["mouvements_stock"]:] if valide else None
+        if not valide or (nouveaux_mvts["Type"] == "Inventaire").any():
+            etat = _reconstruire(recettes, matrice, generations)
+            _sauvegarder(etat)
+        elif any(len(frames[nom]) > etat["lus"][nom] for nom in SOURCES):
+            nouveaux = {nom: frames[nom].iloc[etat["lus"][nom]:] for nom in SOURCES}
+            _appliquer(etat, matrice, nouveaux["achats"], nouveaux["ventes"],
+                       nouveaux["mouvements_stock"][nouveaux["mouvements_stock"]["Type"] == "Ajustement"])
+            etat["lus"] = {nom: len(df) for nom, df in frames.items()}
+            _compteurs["rejeux"] += 1
+            _sauvegarder(etat)
+        _etat = etat
+        return pd.Series(etat["niveaux"], dtype="float64", name="Quantité").sort_index()
+
+
+def enregistrer_inventaire(ingredient, quantite, date=None, motif="Inventaire"):
+    """Niveau compté pour ``ingredient`` (remplace le niveau calculé)."""
+    donnees.ajouter("mouvements_stock", {
+        "Date": str(date or datetime.date.today()),
+        "Ingrédient": ingredient,
+        "Type": "Inventaire",
+        "Quantité": quantite,
+        "Motif": motif,
+    })
+
+
+def ajuster(quantites, motif, date=None):
+    """Ajoute (quantité > 0) ou retire (< 0) les ``quantites`` ({ingrédient: qté}) du stock, en une écriture."""
+    jour = str(date or datetime.date.today())
+    donnees.ajouter_lignes("mouvements_stock", [
+        {"Date": jour, "Ingrédient": ingredient, "Type": "Ajustement", "Quantité": float(quantite), "Motif": motif}
+        for ingredient, quantite in quantites.items() if quantite
+    ])
+
+
+def alertes(niveaux_actuels, seuils):
+    """Ingrédients dont le niveau est <= au seuil d'alerte : {nom: {"quantite", "seuil"}}."""
+    seuils = pd.Series(seuils, dtype="float64")
+    actuels = niveaux_actuels.reindex(seuils.index, fill_value=0.0)
+    sous_seuil = actuels <= seuils
+    return {nom: {"quantite": float(actuels[nom]), "seuil": float(seuils[nom])} for nom in seuils.index[sous_seuil]}
+
+
+def stats():
+    with _verrou:
+        return dict(_compteurs)
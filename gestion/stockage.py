@@ -0,0 +1,73 @@
+"""Formats de stockage du fichier de base des registres.
+
+Le format est choisi par la variable d'environnement ``MAISON_SABA_STOCKAGE``
+(``csv`` par défaut, ``parquet``). Le journal des nouvelles lignes reste
+toujours en CSV ; seul le fichier de base change de format.
+
+Avec Parquet, les colonnes sont stockées typées : dates en timestamps natifs,
+catégories (mode de paiement, catégorie...) encodées en dictionnaire. Rien
+n'est donc ré-inféré au chargement.
+"""
+import os
+import warnings
+
+import pandas as pd
+
+from gestion import journal
+
+
+class StockageCSV:
+    nom = "csv"
+    extension = ".csv"
+
+    def lire(self, path):
+        return pd.read_csv(path)
+
+    def remplacer(self, path, df):
+        journal.remplacer_atomique(path, lambda tmp: df.to_csv(tmp, index=False))
+
+
+class StockageParquet:
+    nom = "parquet"
+    extension = ".parquet"
+
+    def lire(self, path):
+        return pd.read_parquet(path)
+
+    def remplacer(self, path, df):
+        journal.remplacer_atomique(path, lambda tmp: df.to_parquet(tmp, index=False))
+
+
+FORMATS = {
+    "csv": StockageCSV,
+    "parquet": StockageParquet,
+}
+
+
+def depuis_env():
+    """Instancie le format demandé par ``MAISON_SABA_STOCKAGE``."""
+    nom = os.environ.get("MAISON_SABA_STOCKAGE", "csv").lower()
+    if nom == "sqlite":
+        # Registres en base (gestion.registre_sql) : le CSV ne sert plus qu'à la migration
+        return StockageCSV()
+    if nom not in FORMATS:
+        warnings.warn(f"Format de stockage inconnu '{nom}', utilisation du CSV.")
+        return StockageCSV()
+    if nom == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            warnings.warn("pyarrow n'est pas installé, utilisation du CSV.")
+            return StockageCSV()
+    return FORMATS[nom]()
+
+
+def migrer_csv(path_csv, path, format_cible, typer):
+    """Convertit l'ancien fichier CSV ``path_csv`` vers ``path`` au format cible.
+
+    Le CSV d'origine est conservé sous ``<fichier>.csv.bak``.
+    """
+    df = typer(pd.read_csv(path_csv))
+    format_cible.remplacer(path, df)
+    os.replace(path_csv, path_csv + ".bak")
+    return df
@@ -0,0 +1,172 @@
+"""Travailleur de fond : toutes les entrées/sorties lentes hors du rerun Streamlit.
+
+Un travailleur par processus serveur pour Google Sheets (``travailleur()``),
+avec un petit pool de threads ; son état alimente l'indicateur de synchro de
+la barre latérale. Les autres tâches de fond ont leur propre ``Travailleur``
+(rapprochement de la trésorerie). Chaque tâche porte une clé :
+
+- une tâche soumise alors qu'une tâche de même clé attend encore est fusionnée
+  avec elle (dix ventes d'affilée = un seul envoi vers Google Sheets) ;
+- deux tâches de même clé ne tournent jamais en même temps : soumise pendant
+  que la clé tourne, la tâche attend et repart une fois, juste après ;
+- une tâche en échec est relancée avec une attente croissante (les envois
+  vers Sheets écrivent à des positions fixes et se rejouent sans doublon) ;
+- le résultat est publié dans ``resultats`` : les pages lisent la dernière
+  valeur connue sans jamais attendre le réseau.
+
+Synchronisation des registres vers Google Sheets (désactivée par défaut) :
+
+- ``MAISON_SABA_SHEET_ID`` : identifiant du classeur ;
+- ``MAISON_SABA_COMPTE_SERVICE`` : fichier JSON du compte de service (écriture) ;
+- ``MAISON_SABA_ONGLETS`` : ``ventes=Ventes,achats=Achats,...`` (par défaut les noms ci-dessous).
+"""
+import datetime
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from gestion import donnees, sheets
+
+ONGLETS = {"ventes": "Ventes", "achats": "Achats", "tresorerie": "Trésorerie"}
+
+
+class Travailleur:
+    def __init__(self, nb_threads=2, tentatives=3, attente=2.0):
+        self.tentatives = tentatives
+        self.attente = attente
+        self._pool = ThreadPoolExecutor(max_workers=nb_threads, thread_name_prefix="travailleur")
+        self._verrou = threading.Lock()
+        self._en_attente = {}  # cle -> (Future, fonction, args, kwargs) pas encore démarrée
+        self._en_cours = set()  # clés dont une passe est en file ou tourne
+        self.resultats = {}  # cle -> (horodatage, valeur)
+        self.erreurs = {}  # cle -> (horodatage, message)
+        self.derniere_reussite = None
+        self.compteurs = {"soumises": 0, "fusionnees": 0, "reessais": 0, "echecs": 0}
+
+    def soumettre(self, cle, fonction, *args, **kwargs):
+        """Met ``fonction(*args, **kwargs)`` en file, fusionnée avec une tâche de même clé en attente."""
+        with self._verrou:
+            self.compteurs["soumises"] += 1
+            if cle in self._en_attente:
+                self.compteurs["fusionnees"] += 1
+                return self._en_attente[cle][0]
+            future = Future()
+            self._en_attente[cle] = (future, fonction, args, kwargs)
+            # Clé déjà en cours : la passe en cours enchaînera sur celle-ci
+            if cle not in self._en_cours:
+                self._en_cours.add(cle)
+                self._pool.submit(self._executer, cle)
+            return future
+
+    def _executer(self, cle):
+        # Une seule passe par clé à la fois : ce thread exécute aussi les soumissions arrivées pendant la passe
+        while True:
+            with self._verrou:
+                entree = self._en_attente.pop(cle, None)
+                if entree is None:
+                    self._en_cours.discard(cle)
+                    return
+            future, fonction, args, kwargs = entree
+            if future.set_running_or_notify_cancel():
+                future.set_result(self._tenter(cle, fonction, args, kwargs))
+
+    def _tenter(self, cle, fonction, args, kwargs):
+        for tentative in range(self.tentatives):
+            try:
+                valeur = fonction(*args, **kwargs)
+            except Exception as e:
+                derniere = tentative == self.tentatives - 1
+                with self._verrou:
+                    self.erreurs[cle] = (datetime.datetime.now(), str(e))
+                    self.compteurs["echecs" if derniere else "reessais"] += 1
+                if derniere:
+                    return None
+                time.sleep(self.attente * 2 ** tentative)
+                continue
+            maintenant = datetime.datetime.now()
+            with self._verrou:
+                self.resultats[cle] = (maintenant, valeur)
+                self.erreurs.pop(cle, None)
+                self.derniere_reussite = maintenant
+            return valeur
+
+    def resultat(self, cle, defaut=None):
+        with self._verrou:
+            entree = self.resultats.get(cle)
+        return entree[1] if entree is not None else defaut
+
+    def etat(self):
+        with self._verrou:
+            return {
+                "en_attente": len(self._en_cours),
+                "derniere_reussite": self.derniere_reussite,
+                "erreurs": {cle: msg for cle, (_, msg) in self.erreurs.items()},
+                **self.compteurs,
+            }
+
+
+_instance = None
+_verrou_instance = threading.Lock()
+
+
+def travailleur():
+    """Le travailleur du processus, créé (et branché sur les registres) au premier appel."""
+    global _instance
+    with _verrou_instance:
+        if _instance is None:
+            _instance = Travailleur()
+            if sync_active():
+                donnees.abonner(pousser_registre)
+        return _instance
+
+
+# --- lectures distantes ------------------------------------------------------
+
+def lire_plage(sheet_id, plage, api_key):
+    """Dernière valeur connue de la plage (None au premier appel) ; la relecture part en fond."""
+    t = travailleur()
+    cle = ("lire", sheet_id, plage)
+    t.soumettre(cle, sheets.client(api_key).lire_plage, sheet_id, plage)
+    return t.resultat(cle)
+
+
+def erreur(cle):
+    return travailleur().etat()["erreurs"].get(cle)
+
+
+# --- envoi des registres vers Google Sheets -----------------------------------
+
+def sync_active():
+    return bool(os.environ.get("MAISON_SABA_SHEET_ID"))
+
+
+def _onglets():
+    onglets = dict(ONGLETS)
+    for paire in filter(None, os.environ.get("MAISON_SABA_ONGLETS", "").split(",")):
+        nom, _, onglet = paire.partition("=")
+        onglets[nom.strip()] = onglet.strip()
+    return onglets
+
+
+_client_sync = None
+
+
+def _client():
+    global _client_sync
+    if _client_sync is None:
+        path = os.environ.get("MAISON_SABA_COMPTE_SERVICE")
+        identifiants = sheets.identifiants_compte_service(path) if path else None
+        _client_sync = sheets.ClientSheets(identifiants=identifiants)
+    return _client_sync
+
+
+def _pousser(nom):
+    sync = sheets.SyncRegistre(_client(), os.environ["MAISON_SABA_SHEET_ID"], _onglets()[nom], nom)
+    return sync.pousser()
+
+
+def pousser_registre(nom):
+    """Met en file l'envoi des nouvelles lignes du registre ``nom`` (abonné aux écritures)."""
+    if nom in _onglets():
+        travailleur().soumettre(("pousser", nom), _pousser, nom)
@@ -0,0 +1,129 @@
+"""Analyse de la trésorerie : flux par jour / semaine / mois, solde et prévision.
+
+Tout est vectorisé sur le registre ``tresorerie`` :
+
+- flux nets par jour (entrées - sorties), sur un calendrier continu qui va au
+  moins jusqu'à aujourd'hui (les jours sans mouvement comptent pour 0) ;
+- solde cumulé (``cumsum``) et flux nets glissants sur 7 et 30 jours, lus à la
+  date du jour : un mouvement daté plus tard (paie de fin de mois) n'en fait
+  pas partie ;
+- regroupements par semaine / mois / année avec ``dt.to_period`` ;
+- prévision saisonnière simple des semaines à venir : moyenne du flux net par
+  jour de la semaine sur les dernières semaines, plus l'écart moyen par jour du
+  mois sur les derniers mois (loyer, salaires...), cumulée à partir du solde
+  actuel.
+
+Le résultat est gardé en cache tant que la version du registre et le jour ne
+changent pas.
+"""
+import datetime
+import threading
+
+import numpy as np
+import pandas as pd
+
+from gestion import donnees, profil
+
+# Historique utilisé par la prévision
+SEMAINES_PROFIL = 12
+MOIS_PROFIL = 6
+
+_cache = {}  # (version, jour, jours_prevision) -> analyse
+_verrou = threading.Lock()
+
+
+def _jour(date):
+    return pd.Timestamp(date or datetime.date.today()).normalize()
+
+
+def flux_journaliers(df, jour=None):
+    """Entrées, sorties, net, solde et nets glissants 7 / 30 jours, un jour par ligne (sans trou).
+
+    Le calendrier va au moins jusqu'à ``jour`` (aujourd'hui), même sans
+    mouvement récent, pour que les nets glissants y soient lisibles.
+    """
+    colonnes = ["Entrées", "Sorties", "Net", "Solde", "Net 7 j", "Net 30 j"]
+    df = df[df["Date"].notna()]
+    if df.empty:
+        return pd.DataFrame(columns=colonnes, index=pd.DatetimeIndex([], name="Date"), dtype="float64")
+    jours = df["Date"].dt.normalize()
+    types = df["Type"].astype(object)
+    montants = df["Montant"].fillna(0.0)
+    quotidien = pd.DataFrame({
+        "Entrées": montants.where(types == "Entrée", 0.0),
+        "Sorties": montants.where(types == "Sortie", 0.0),
+    }).groupby(jours).sum()
+    calendrier = pd.date_range(quotidien.index[0], max(quotidien.index[-1], _jour(jour)), freq="D", name="Date")
+    quotidien = quotidien.reindex(calendrier, fill_value=0.0)
+    quotidien["Net"] = quotidien["Entrées"] - quotidien["Sorties"]
+    quotidien["Solde"] = quotidien["Net"].cumsum()
+    quotidien["Net 7 j"] = quotidien["Net"].rolling(7, min_periods=1).sum()
+    quotidien["Net 30 j"] = quotidien["Net"].rolling(30, min_periods=1).sum()
+    return quotidien[colonnes]
+
+
+def nets_au(quotidien, jour=None):
+    """Flux nets des 7 et 30 jours se terminant à ``jour`` (aujourd'hui) : ``(net_7, net_30)``."""
+    jour = _jour(jour)
+    if jour not in quotidien.index:
+        return 0.0, 0.0
+    ligne = quotidien.loc[jour]
+    return float(ligne["Net 7 j"]), float(ligne["Net 30 j"])
+
+
+def par_periode(quotidien, frequence="M"):
+    """Entrées, sorties, net et solde de fin de période (``frequence`` : "W", "M", "Y"...)."""
+    periodes = quotidien.index.to_period(frequence)
+    regroupe = quotidien.groupby(periodes).agg(
+        {"Entrées": "sum", "Sorties": "sum", "Net": "sum", "Solde": "last"}
+    )
+    regroupe.index.name = "Période"
+    return regroupe
+
+
+def prevision(quotidien, jours=56):
+    """Solde prévu pour les ``jours`` suivant le calendrier (aujourd'hui ou le dernier mouvement daté plus tard)."""
+    colonnes = ["Net prévu", "Solde prévu", "Solde bas", "Solde haut"]
+    if quotidien.empty:
+        return pd.DataFrame(columns=colonnes, dtype="float64")
+    net = quotidien["Net"]
+    fin = net.index[-1]
+    recent = net[net.index > fin - pd.Timedelta(weeks=SEMAINES_PROFIL)]
+    profil_semaine = recent.groupby(recent.index.dayofweek).mean().reindex(range(7), fill_value=0.0)
+
+    historique = net[net.index > fin - pd.DateOffset(months=MOIS_PROFIL)]
+    residus = historique - profil_semaine.to_numpy()[historique.index.dayofweek]
+    profil_mois = residus.groupby(residus.index.day).mean().reindex(range(1, 32), fill_value=0.0)
+
+    futur = pd.date_range(fin + pd.Timedelta(days=1), periods=jours, freq="D", name="Date")
+    net_prevu = profil_semaine.to_numpy()[futur.dayofweek] + profil_mois.to_numpy()[futur.day - 1]
+    solde_prevu = quotidien["Solde"].iloc[-1] + np.cumsum(net_prevu)
+    # Fourchette : dispersion des écarts journaliers au modèle, qui s'élargit avec l'horizon
+    ecart = float(residus.sub(profil_mois.to_numpy()[residus.index.day - 1]).std(ddof=0) or 0.0)
+    marge = ecart * np.sqrt(np.arange(1, jours + 1))
+    return pd.DataFrame({
+        "Net prévu": net_prevu,
+        "Solde prévu": solde_prevu,
+        "Solde bas": solde_prevu - marge,
+        "Solde haut": solde_prevu + marge,
+    }, index=futur)
+
+
+@profil.mesure("tresorerie.analyse")
+def analyse(jours_prevision=56):
+    """Flux journaliers, hebdomadaires, mensuels et prévision, calculés une fois par version du registre et par jour."""
+    cle = (donnees.version("tresorerie"), _jour(None), jours_prevision)
+    with _verrou:
+        resultat = _cache.get(cle)
+    if resultat is None:
+        quotidien = flux_journaliers(donnees.charger("tresorerie"), cle[1])
+        resultat = {
+            "quotidien": quotidien,
+            "hebdomadaire": par_periode(quotidien, "W"),
+            "mensuel": par_periode(quotidien, "M"),
+            "prevision": prevision(quotidien, jours_prevision),
+        }
+        with _verrou:
+            _cache.clear()
+            _cache[cle] = resultat
+    return resultat
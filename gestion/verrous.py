@@ -0,0 +1,120 @@
+"""Verrous consultatifs entre processus et compteurs de révision des registres.
+
+Plusieurs sessions (caisse, cuisine, bureau), éventuellement dans plusieurs
+processus, écrivent dans les mêmes fichiers. Chaque registre a un fichier
+verrou (``ventes.lock`` à côté de ``ventes.csv``) :
+
+- ``verrouiller(path)`` le prend en exclusif (``flock`` ; ``msvcrt`` sous
+  Windows) le temps d'une écriture. Le verrou est réentrant dans un même
+  thread et sérialise aussi les threads du processus ;
+- le fichier contient la révision du registre, un entier incrémenté à chaque
+  écriture sous verrou. Une modification lue à la révision ``r`` n'est
+  écrite que si le registre est toujours à ``r`` ; sinon ``ConflitEcriture``.
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class ConflitEcriture(Exception):
+    """Le registre a été modifié par quelqu'un d'autre depuis sa lecture."""
+
+
+_etats = {}
+_verrou_etats = threading.Lock()
+
+
+def _etat(path):
+    with _verrou_etats:
+        return _etats.setdefault(path, {"rlock": threading.RLock(), "fd": None, "profondeur": 0})
+
+
+def _bloquer(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return
+    os.lseek(fd, 0, os.SEEK_SET)
+    while True:
+        try:
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            # LK_LOCK abandonne après 10 s : on réessaie
+            continue
+
+
+def _liberer(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+def _lire_revision(fd):
+    os.lseek(fd, 0, os.SEEK_SET)
+    contenu = os.read(fd, 32)
+    try:
+        return int(contenu or 0)
+    except ValueError:
+        return 0
+
+
+class Verrou:
+    """Verrou détenu sur un registre ; donne accès à sa révision."""
+
+    def __init__(self, fd):
+        self._fd = fd
+
+    @property
+    def revision(self):
+        return _lire_revision(self._fd)
+
+    def incrementer(self):
+        """Passe à la révision suivante (à appeler après l'écriture) et la renvoie."""
+        revision = _lire_revision(self._fd) + 1
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        os.write(self._fd, str(revision).encode("ascii"))
+        os.ftruncate(self._fd, len(str(revision)))
+        return revision
+
+
+@contextmanager
+def verrouiller(path):
+    """Prend le verrou exclusif ``path`` (créé au besoin) pour la durée du bloc."""
+    etat = _etat(path)
+    with etat["rlock"]:
+        if etat["profondeur"] == 0:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                _bloquer(fd)
+            except BaseException:
+                os.close(fd)
+                raise
+            etat["fd"] = fd
+        etat["profondeur"] += 1
+        try:
+            yield Verrou(etat["fd"])
+        finally:
+            etat["profondeur"] -= 1
+            if etat["profondeur"] == 0:
+                fd, etat["fd"] = etat["fd"], None
+                try:
+                    _liberer(fd)
+                finally:
+                    os.close(fd)
+
+
+def revision(path):
+    """Révision enregistrée dans ``path``, sans prendre le verrou (0 si absent)."""
+    try:
+        with open(path, "rb") as f:
+            return int(f.read(32) or 0)
+    except (OSError, ValueError):
+        return 0
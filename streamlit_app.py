@@ -1,18 +1,48 @@
-import requests
 import streamlit as st
 import pandas as pd
-import gspread
-from google.oauth2.service_account import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 import datetime
-import csv
+import functools
 import os
-import re
-import io
-import altair as alt
+import time
+
+# Dépendances lourdes (altair, clients Google) importées seulement par la page ou le module qui s'en sert
+from gestion import agregats, banque, documents, donnees, export, kpi, paie, planning, prechauffage, prevision, profil, recettes as moteur_recettes, rapprochement, requetes, stock, travailleur, tresorerie
 
 st.set_page_config(page_title="Maison Saba - App de gestion", layout="wide")
+debut_rerun = time.perf_counter()
+
+
+# Durée des reruns, complets ("app") ou limités à un fragment : voir benchmarks/bench_reruns.py
+def mesurer(zone, debut):
+    mesures = st.session_state.setdefault("mesures_reruns", [])
+    mesures.append({"zone": zone, "ms": (time.perf_counter() - debut) * 1000})
+    del mesures[:-200]
+
+
+# Un widget dans un fragment ne relance que le fragment, pas toute la page
+def fragment(fonction):
+    @st.fragment
+    @functools.wraps(fonction)
+    def execution(*args, **kwargs):
+        debut = time.perf_counter()
+        try:
+            with profil.rerun(f"{module_actif} / {fonction.__name__}"):
+                return fonction(*args, **kwargs)
+        finally:
+            mesurer(fonction.__name__, debut)
+    return execution
+
+
+# Après une écriture, toute la page est relancée (les autres blocs affichent les données à jour) ;
+# le message est gardé pour le rerun suivant
+def annoncer(message, niveau="success"):
+    st.session_state.setdefault("messages", []).append((niveau, message))
+    st.rerun()
+
+
+def afficher_messages():
+    for niveau, message in st.session_state.pop("messages", []):
+        getattr(st, niveau)(message)
 
 
 # Navigation
@@ -27,163 +57,252 @@ modules = [
     "Trésorerie",
     "Comptes bancaires"
 ]
+# Page de profilage cachée : ?admin=1 dans l'URL, ou MAISON_SABA_ADMIN=1 sur le serveur
+if st.query_params.get("admin") == "1" or os.environ.get("MAISON_SABA_ADMIN") == "1":
+    modules.append("Profilage")
 
 st.sidebar.title("Maison Saba Gestion")
 module_actif = st.sidebar.radio("Aller à :", modules)
 st.title(f"Module : {module_actif}")
+afficher_messages()
+
+# Rafraîchissement des indicateurs du Dashboard en tâche de fond (une fois par processus)
+kpi.demarrer()
+# Ventes, achats et paies passés en trésorerie après chaque écriture (gestion/rapprochement.py)
+rapprochement.activer()
+
+# Entrées/sorties distantes : jamais dans le rerun, voir gestion/travailleur.py
+etat_sync = travailleur.travailleur().etat()
+if travailleur.sync_active() or etat_sync["soumises"]:
+    derniere = etat_sync["derniere_reussite"]
+    st.sidebar.caption(
+        f"Dernière synchro : {derniere.strftime('%H:%M:%S') if derniere else 'jamais'}"
+        f" · en attente : {etat_sync['en_attente']}"
+    )
+    if etat_sync["erreurs"]:
+        st.sidebar.caption(f"⚠️ {len(etat_sync['erreurs'])} envoi(s) en échec, nouvel essai à la prochaine écriture")
 
 # Fonction pour se connecter à Google Sheets
 def get_public_google_sheet(sheet_id, range_name, api_key):
-    url = f"https://sheets.googleapis.com/v4/spreadsheets/{sheet_id}/values/{range_name}?key={api_key}"
-    response = requests.get(url)
-    if response.status_code == 200:
-        data = response.json()
-        return data['values']
-    else:
-        st.error(f"Erreur {response.status_code}: {response.text}")
-        return None
+    # Lecture faite par le travailleur de fond : renvoie la dernière valeur connue
+    # (None tant que la première lecture n'est pas arrivée), sans bloquer la page
+    valeurs = travailleur.lire_plage(sheet_id, range_name, api_key)
+    erreur = travailleur.erreur(("lire", sheet_id, range_name))
+    if erreur:
+        st.error(erreur)
+    return valeurs
 
 
-# Module Ventes
-#----------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-if module_actif == "Ventes":
+# Historique paginé : filtres et tri passent par gestion/requetes.py, seule la page affichée est envoyée au navigateur ;
+# fragment : paginer ou filtrer ne relance pas la page
+@fragment
+def afficher_historique(nom, filtres=(), taille_defaut=50):
+    colonnes = donnees.REGISTRES[nom]["colonnes"]
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        periode = st.date_input("Période", value=(), key=f"{nom}_hist_periode")
+    with col2:
+        tri = st.selectbox("Trier par", colonnes, key=f"{nom}_hist_tri")
+    with col3:
+        descendant = st.radio("Ordre", ["Décroissant", "Croissant"], horizontal=True, key=f"{nom}_hist_ordre") == "Décroissant"
+    with col4:
+        taille = st.selectbox("Lignes par page", [25, 50, 100, 250], index=[25, 50, 100, 250].index(taille_defaut), key=f"{nom}_hist_taille")
+    valeurs = {}
+    if filtres:
+        for colonne, col in zip(filtres, st.columns(len(filtres))):
+            with col:
+                valeurs[colonne] = st.multiselect(colonne, requetes.modalites(nom, colonne), key=f"{nom}_hist_{colonne}")
+    debut = periode[0] if len(periode) > 0 else None
+    fin = periode[1] + datetime.timedelta(days=1) if len(periode) > 1 else None
 
-    st.subheader("Enregistrement des ventes")
-    ventes_file = "ventes.csv"
-    plats_file = "plats.csv"
+    cle_page = f"{nom}_hist_page"
+    numero = st.session_state.get(cle_page, 1)
+    lignes_page, total = requetes.page(nom, numero - 1, taille, debut, fin, valeurs, tri, descendant)
+    nb_pages = max(1, -(-total // taille))
+    if numero > nb_pages:
+        # Les filtres ont réduit le nombre de pages : revenir à la dernière
+        numero = nb_pages
+        lignes_page, total = requetes.page(nom, numero - 1, taille, debut, fin, valeurs, tri, descendant)
+    st.session_state[cle_page] = numero
+    with profil.mesure("rendu historique"):
+        st.dataframe(lignes_page, use_container_width=True, hide_index=True)
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        st.number_input("Page", min_value=1, max_value=nb_pages, step=1, key=cle_page)
+    with col2:
+        premiere = (numero - 1) * taille
+        st.caption(f"Lignes {min(premiere + 1, total)}–{premiere + len(lignes_page)} sur {total}")
 
-    if os.path.exists(plats_file):
-        with open(plats_file, "r") as f:
-            liste_plats = csv.load(f)
+
+# Export généré seulement au clic (gestion/export.py), par morceaux, jamais à chaque rerun
+@fragment
+def bouton_export(nom, nom_fichier):
+    colonnes_registre = donnees.REGISTRES[nom]["colonnes"]
+    with st.expander("Exporter l'historique"):
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            periode = st.date_input("Période", value=(), key=f"{nom}_export_periode")
+        with col2:
+            colonnes = st.multiselect("Colonnes", colonnes_registre, default=colonnes_registre, key=f"{nom}_export_colonnes")
+        with col3:
+            format_export = st.radio("Format", list(export.FORMATS), horizontal=True, key=f"{nom}_export_format")
+        debut = periode[0] if len(periode) > 0 else None
+        fin = periode[1] + datetime.timedelta(days=1) if len(periode) > 1 else None
+        st.download_button(
+            "Télécharger",
+            data=lambda: export.octets(nom, format_export, debut, fin, colonnes or colonnes_registre),
+            file_name=f"{nom_fichier}.{format_export}",
+            mime=export.FORMATS[format_export],
+            on_click="ignore",
+            key=f"{nom}_export",
+        )
+
+
+# Module Dashboard
+@fragment
+def indicateurs_periode(snapshot):
+    periode = st.radio("Période", kpi.PERIODES, index=2, horizontal=True)
+    indicateurs = snapshot["periodes"][periode]
+
+    col1, col2, col3, col4, col5 = st.columns(5)
+    col1.metric("CA (€)", f"{indicateurs['ca']:.2f}")
+    col2.metric("Achats (€)", f"{indicateurs['achats']:.2f}")
+    col3.metric("Marge (€)", f"{indicateurs['marge']:.2f}")
+    col4.metric("Solde trésorerie (€)", f"{snapshot['solde_tresorerie']:.2f}")
+    col5.metric("Alertes stock", len(snapshot["alertes_stock"]))
+
+    st.markdown("### Top produits")
+    if indicateurs["top_produits"]:
+        with profil.mesure("rendu top produits"):
+            st.bar_chart(pd.Series(dict(indicateurs["top_produits"]), name="CA (€)"))
     else:
-        liste_plats = {
-            "Brioche perdue": 8.0,
-            "Cookie pistache": 3.5
-        }
+        st.info("Aucune vente sur la période.")
+
+
+def module_dashboard():
+    snapshot = kpi.instantane()
+    indicateurs_periode(snapshot)
+
+    st.markdown("### Alertes de stock")
+    if snapshot["alertes_stock"]:
+        for alerte in snapshot["alertes_stock"]:
+            st.error(f"{alerte['ingredient']} : {alerte['quantite']} (seuil {alerte['seuil']}) — à réapprovisionner")
+    else:
+        st.write("Aucun ingrédient sous son seuil d'alerte.")
+    st.caption(f"Indicateurs calculés le {snapshot['calcule_le']}")
+
+# Module Ventes
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+@fragment
+def gerer_plats(liste_plats):
     with st.expander("Gérer la liste des plats"):
         st.write("Plats disponibles :")
         for plat, prix in liste_plats.items():
-            st.write(f"- {plat} : {prix} €") 
+            st.write(f"- {plat} : {prix} €")
         col1, col2 = st.columns(2)
         with col1:
             new_plat = st.text_input("Ajouter un nouveau plat")
         with col2:
-            new_prix = st.number_input("Prix (€)", min_value=0.0, step=0.5, key="new_prix") 
+            new_prix = st.number_input("Prix (€)", min_value=0.0, step=0.5, key="new_prix")
 
         if st.button("Ajouter à la liste"):
             if new_plat and new_plat not in liste_plats:
-                liste_plats[new_plat] = new_prix
-                with open(plats_file, "w") as f:
-                    csv.dump(liste_plats, f)
-                st.success(f"{new_plat} ajouté à la liste des plats.")
-
-    if os.path.exists(ventes_file):
-        df_ventes = pd.read_csv(ventes_file)
-        df_ventes["Date"] = pd.to_datetime(df_ventes["Date"])
-    else:
-        df_ventes = pd.DataFrame(columns=["Date", "Produit", "Quantité", "Prix unitaire", "Total", "Mode de paiement"])
+                documents.mettre("plats", new_plat, new_prix)
+                annoncer(f"{new_plat} ajouté à la liste des plats.")
+
+
+@fragment
+def saisie_vente(liste_plats):
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        date_vente = st.date_input("Date", value=datetime.date.today(), key="vente_date")
+    with col2:
+        produit = st.selectbox("Produit vendu", list(liste_plats.keys()), key="vente_produit")
+    with col3:
+        quantite = st.number_input("Quantité", min_value=1, value=1, key="vente_quantite")
+
+    # Un prix par produit : changer de produit reprend son prix de la carte
+    prix_defaut = liste_plats.get(produit, 0.0)
+    prix_unitaire = st.number_input("Prix unitaire (€)", min_value=0.0, step=0.5, value=prix_defaut, key=f"vente_prix_{produit}")
+    mode_paiement = st.selectbox("Mode de paiement", ["Espèces", "Carte bancaire", "Ticket restaurant", "Autre"], key="vente_mode")
+    total = quantite * prix_unitaire
+    st.write(f"**Total : {total:.2f} €**")
+    if st.button("Ajouter la vente"):
+        nouvelle_vente = {
+            "Date": str(date_vente),
+            "Produit": produit,
+            "Quantité": quantite,
+            "Prix unitaire": prix_unitaire,
+            "Total": total,
+            "Mode de paiement": mode_paiement
+        }
+        agregats.ajouter("ventes", nouvelle_vente)
+        annoncer("Vente ajoutée avec succès !")
+
+
+def module_ventes():
+    st.subheader("Enregistrement des ventes")
+    liste_plats = documents.charger("plats")
+    gerer_plats(liste_plats)
 
     # Dashboard Ventes
     st.markdown("---")
     st.subheader("Statistiques des ventes")
-    if not df_ventes.empty:
-        ventes_total = len(df_ventes)
-        ca_total = df_ventes["Total"].sum()
-        mois_actuel = datetime.date.today().month
-        ventes_mois = df_ventes[df_ventes["Date"].dt.month == mois_actuel]
-        nb_mois = len(ventes_mois)
-        ca_mois = ventes_mois["Total"].sum()
+    agregats_ventes = agregats.obtenir("ventes")
+    ventes_total, ca_total = agregats_ventes.total()
+    if ventes_total:
+        nb_mois, ca_mois = agregats_ventes.periode("mois", datetime.date.today().strftime("%Y-%m"))
         col1, col2, col3, col4 = st.columns(4)
         col1.metric("Ventes totales", ventes_total)
         col2.metric("CA total (€)", f"{ca_total:.2f}")
         col3.metric("Ventes ce mois", nb_mois)
         col4.metric("CA ce mois (€)", f"{ca_mois:.2f}")
         st.markdown("### Répartition par mode de paiement")
-        mode_totaux = df_ventes.groupby("Mode de paiement")["Total"].sum().sort_values(ascending=False)
-        st.bar_chart(mode_totaux)
+        mode_totaux = agregats_ventes.par("Mode de paiement")
+        with profil.mesure("rendu modes de paiement"):
+            st.bar_chart(mode_totaux)
     else:
         st.info("Aucune vente enregistrée pour générer des statistiques.")
     st.markdown("---")
     st.subheader("Historique des ventes")
 
-    if not df_ventes.empty:
-        st.dataframe(df_ventes, use_container_width=True)
+    # Nombre de lignes lu dans les agrégats : le registre n'est jamais chargé en entier ici
+    if ventes_total:
+        afficher_historique("ventes", filtres=("Produit", "Mode de paiement"))
         st.markdown("### Export")
-        csv = df_ventes.to_csv(index=False).encode('utf-8')
-        st.download_button(
-            label="Télécharger l'historique (CSV)",
-            data=csv,
-            file_name='historique_ventes.csv',
-            mime='text/csv'
-        )
+        bouton_export("ventes", "historique_ventes")
     else:
         st.info("Aucune vente enregistrée pour le moment.")
     # Saisie d'une nouvelle vente
     st.markdown("---")
     st.subheader("Ajouter une nouvelle vente")
+    saisie_vente(liste_plats)
 
-    with st.form("ajout_vente"):
-        col1, col2, col3 = st.columns(3)
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Module Achats
+MODES_ACHAT = ["Carte bancaire", "Virement", "Chèque", "Espèces", "Autre"]
+CATEGORIES_ACHAT = ["Matières premières", "Emballages", "Boissons", "Décoration", "Autre"]
+
+
+@fragment
+def saisie_achat():
+    col1, col2, col3 = st.columns(3)
     with col1:
-            date_vente = st.date_input("Date", value=datetime.date.today())
+        date_achat = st.date_input("Date", value=datetime.date.today(), key="date_achat")
+        fournisseur = st.text_input("Fournisseur", key="fournisseur")
     with col2:
-            produit = st.selectbox("Produit vendu", list(liste_plats.keys()))
+        produit = st.text_input("Produit ou ingrédient", key="produit")
+        quantite = st.number_input("Quantité", min_value=0.0, step=0.1, key="quantite")
     with col3:
-            quantite = st.number_input("Quantité", min_value=1, value=1)
-
-    prix_defaut = liste_plats.get(produit, 0.0)
-    prix_unitaire = st.number_input("Prix unitaire (€)", min_value=0.0, step=0.5, value=prix_defaut)
-    mode_paiement = st.selectbox("Mode de paiement", ["Espèces", "Carte bancaire", "Ticket restaurant", "Autre"])
+        unite = st.text_input("Unité (g, kg, L...)", key="unite")
+        prix_unitaire = st.number_input("Prix unitaire (€)", min_value=0.0, step=0.1, key="prix_unitaire")
+    mode_paiement = st.selectbox("Mode de paiement", MODES_ACHAT, key="mode_paiement")
+    categorie = st.selectbox("Catégorie", CATEGORIES_ACHAT, key="categorie")
     total = quantite * prix_unitaire
-    st.write(f"**Total : {total:.2f} €**")
-    submit_vente = st.form_submit_button("Ajouter la vente")
-    if submit_vente:
-            nouvelle_vente = {
-                "Date": str(date_vente),
-                "Produit": produit,
-                "Quantité": quantite,
-                "Prix unitaire": prix_unitaire,
-                "Total": total,
-                "Mode de paiement": mode_paiement
-            }
-            df_ventes = pd.concat([df_ventes, pd.DataFrame([nouvelle_vente])], ignore_index=True)
-            df_ventes.to_csv(ventes_file, index=False)
-            st.success("Vente ajoutée avec succès !")
-        
-#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-# Module Achats
-if module_actif == "Achats":
-    st.subheader("Enregistrement des achats")
-    achats_file = "achats.csv"
-    if os.path.exists(achats_file):
-        df_achats = pd.read_csv(achats_file)
-        df_achats["Date"] = pd.to_datetime(df_achats["Date"], errors="coerce")
-    else:
-        df_achats = pd.DataFrame(columns=[
-            "Date", "Fournisseur", "Produit", "Quantité", "Unité",
-            "Prix unitaire", "Total", "Mode de paiement", "Catégorie"
-        ])
-    
-    # Formulaire pour ajouter un achat
-    with st.form("form_achat"):
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            date_achat = st.date_input("Date", value=datetime.date.today(), key="date_achat")
-            fournisseur = st.text_input("Fournisseur", key="fournisseur")
-        with col2:
-            produit = st.text_input("Produit ou ingrédient", key="produit")
-            quantite = st.number_input("Quantité", min_value=0.0, step=0.1, key="quantite")
-        with col3:
-            unite = st.text_input("Unité (g, kg, L...)", key="unite")
-            prix_unitaire = st.number_input("Prix unitaire (€)", min_value=0.0, step=0.1, key="prix_unitaire")
-        mode_paiement = st.selectbox("Mode de paiement", ["Carte bancaire", "Virement", "Chèque", "Espèces", "Autre"], key="mode_paiement")
-        categorie = st.selectbox("Catégorie", ["Matières premières", "Emballages", "Boissons", "Décoration", "Autre"], key="categorie")
-        total = quantite * prix_unitaire
-        st.write(f"**Montant total : {total:.2f} €**")
-        submit = st.form_submit_button("Ajouter l'achat")
-
-    if submit:
-        if not fournisseur or not produit or quantite == 0 or not unite ou prix_unitaire == 0:
+    st.write(f"**Montant total : {total:.2f} €**")
+
+    if st.button("Ajouter l'achat"):
+        if not fournisseur or not produit or quantite == 0 or not unite or prix_unitaire == 0:
             st.error("Tous les champs doivent être remplis pour ajouter un achat.")
         else:
             nouvel_achat = {
@@ -197,29 +316,96 @@ if module_actif == "Achats":
                 "Mode de paiement": mode_paiement,
                 "Catégorie": categorie
             }
-            df_achats = pd.concat([df_achats, pd.DataFrame([nouvel_achat])], ignore_index=True)
-            df_achats.to_csv(achats_file, index=False)
-            st.success("Achat ajouté avec succès !")
-    
+            agregats.ajouter("achats", nouvel_achat)
+            annoncer("Achat ajouté avec succès !")
+
+
+@fragment
+def modifier_achat():
+    df_achats = donnees.charger("achats")
+    if df_achats.empty:
+        st.info("Aucun achat enregistré pour le moment.")
+        return
+    achat_selectionne = st.selectbox("Sélectionner un achat à modifier ou supprimer", df_achats.index, format_func=lambda x: f"{df_achats.at[x, 'Date']} - {df_achats.at[x, 'Produit']} - {df_achats.at[x, 'Fournisseur']}")
+
+    # Ligne telle qu'affichée à l'ouverture du formulaire : c'est celle que l'utilisateur modifie,
+    # même si une autre session a écrit dans les achats depuis
+    edition = (achat_selectionne, st.session_state.get("achat_edition", 0))
+    vue = st.session_state.get("achat_affiche")
+    if vue is None or vue[0] != edition:
+        vue = (edition, df_achats.loc[achat_selectionne])
+        st.session_state["achat_affiche"] = vue
+    achat = vue[1]
+    suffixe = f"{edition[0]}_{edition[1]}"
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        date_achat = st.date_input("Date", value=achat["Date"], key=f"mod_date_achat_{suffixe}")
+        fournisseur = st.text_input("Fournisseur", value=achat["Fournisseur"], key=f"mod_fournisseur_{suffixe}")
+    with col2:
+        produit = st.text_input("Produit ou ingrédient", value=achat["Produit"], key=f"mod_produit_{suffixe}")
+        quantite = st.number_input("Quantité", min_value=0.0, step=0.1, value=achat["Quantité"], key=f"mod_quantite_{suffixe}")
+    with col3:
+        unite = st.text_input("Unité (g, kg, L...)", value=achat["Unité"], key=f"mod_unite_{suffixe}")
+        prix_unitaire = st.number_input("Prix unitaire (€)", min_value=0.0, step=0.1, value=achat["Prix unitaire"], key=f"mod_prix_unitaire_{suffixe}")
+    mode_paiement = st.selectbox("Mode de paiement", MODES_ACHAT, index=MODES_ACHAT.index(achat["Mode de paiement"]), key=f"mod_mode_paiement_{suffixe}")
+    categorie = st.selectbox("Catégorie", CATEGORIES_ACHAT, index=CATEGORIES_ACHAT.index(achat["Catégorie"]), key=f"mod_categorie_{suffixe}")
+    total = quantite * prix_unitaire
+    st.write(f"**Montant total : {total:.2f} €**")
+    col1, col2 = st.columns(2)
+    submit_modification = col1.button("Modifier l'achat")
+    submit_suppression = col2.button("Supprimer l'achat")
+    if not (submit_modification or submit_suppression):
+        return
+
+    # Formulaire suivant : nouvelle édition, champs repris des données à jour
+    st.session_state["achat_edition"] = edition[1] + 1
+    try:
+        if submit_modification:
+            agregats.modifier_ligne("achats", achat_selectionne, achat, {
+                "Date": pd.Timestamp(date_achat),
+                "Fournisseur": fournisseur,
+                "Produit": produit,
+                "Quantité": quantite,
+                "Unité": unite,
+                "Prix unitaire": prix_unitaire,
+                "Total": total,
+                "Mode de paiement": mode_paiement,
+                "Catégorie": categorie,
+            })
+            annoncer("Achat modifié avec succès !")
+        else:
+            agregats.modifier_ligne("achats", achat_selectionne, achat)
+            annoncer("Achat supprimé avec succès !")
+    except donnees.ConflitEcriture:
+        annoncer("Cet achat vient d'être modifié ou supprimé par une autre session : "
+                 "vérifiez la sélection puis recommencez.", "error")
+
+
+def module_achats():
+    st.subheader("Enregistrement des achats")
+
+    # Formulaire pour ajouter un achat
+    saisie_achat()
+
     st.markdown("---")
     st.subheader("Historique des achats")
 
-    if not df_achats.empty:
-        df_achats["Date"] = pd.to_datetime(df_achats["Date"])
-        total_achats = df_achats["Total"].sum()
+    agregats_achats = agregats.obtenir("achats")
+    nb_achats, total_achats = agregats_achats.total()
+    if nb_achats:
 
         st.markdown(f"**Montant total des achats :** {total_achats:.2f} €")
-        st.dataframe(df_achats, use_container_width=True)
-
-        csv_export = df_achats.to_csv(index=False).encode('utf-8')
-        st.download_button("Télécharger l'historique (CSV)", data=csv_export, file_name="achats_maison_saba.csv", mime="text/csv")
+        afficher_historique("achats", filtres=("Produit", "Fournisseur", "Catégorie"))
+        bouton_export("achats", "achats_maison_saba")
 
         # Vue par catégorie
         st.markdown("---")
         st.subheader("Vue par catégorie")
-        total_par_categorie = df_achats.groupby("Catégorie")["Total"].sum().reset_index()
+        total_par_categorie = agregats_achats.par("Catégorie").reset_index()
 
         # Create a bar chart with totals displayed on top of each bar using altair
+        import altair as alt
         chart = alt.Chart(total_par_categorie).mark_bar(color='sandybrown').encode(
             x=alt.X('Catégorie', sort=None),
             y='Total',
@@ -234,93 +420,137 @@ if module_actif == "Achats":
             text='Total:Q'
         )
 
-        st.altair_chart(chart, use_container_width=True)
+        with profil.mesure("rendu vue par catégorie"):
+            st.altair_chart(chart, use_container_width=True)
     else:
         st.info("Aucun achat enregistré pour le moment.")
 
     st.markdown("---")
     st.subheader("Modifier ou supprimer un achat")
+    modifier_achat()
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Module Stock & Inventaire
+@fragment
+def inventaire_ingredient():
+    # Même règle que gestion/stock.py
+    st.caption("Quantité comptée en fin de journée : les achats et ventes du jour sont déjà dans le compte. "
+               "Les déductions et ajustements saisis après l'inventaire s'y appliquent.")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        ingredient = st.text_input("Nom de l'ingrédient", key="inventaire_ingredient")
+    with col2:
+        quantite = st.number_input("Quantité comptée", min_value=0.0, step=0.1, key="inventaire_quantite")
+    with col3:
+        seuil = st.number_input("Seuil d'alerte", min_value=0.0, step=0.1, key="inventaire_seuil")
+    if st.button("Enregistrer") and ingredient:
+        stock.enregistrer_inventaire(ingredient, quantite)
+        documents.mettre("stock", ingredient, {"seuil": seuil})
+        annoncer("Stock mis à jour avec succès")
 
-    if not df_achats.empty:
-        achat_selectionne = st.selectbox("Sélectionner un achat à modifier ou supprimer", df_achats.index, format_func=lambda x: f"{df_achats.at[x, 'Date']} - {df_achats.at[x, 'Produit']} - {df_achats.at[x, 'Fournisseur']}")
 
-        achat = df_achats.loc[achat_selectionne]
+def afficher_liste_courses(besoins, niveaux_stock, nom_fichier):
+    liste = moteur_recettes.liste_courses(besoins, niveaux_stock, donnees.charger("achats"))
+    if liste.empty:
+        st.success("Le stock actuel couvre tous les ingrédients nécessaires.")
+        return
+    st.dataframe(liste, use_container_width=True)
+    st.markdown(f"**Coût estimé :** {liste['Coût estimé (€)'].sum():.2f} €")
+    st.download_button("Télécharger la liste de courses", data=liste.to_csv().encode("utf-8"),
+                       file_name=f"{nom_fichier}.csv", mime="text/csv", key=f"telecharger_{nom_fichier}")
 
-        with st.form("modifier_supprimer_achat"):
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                date_achat = st.date_input("Date", value=achat["Date"], key="mod_date_achat")
-                fournisseur = st.text_input("Fournisseur", value=achat["Fournisseur"], key="mod_fournisseur")
-            with col2:
-                produit = st.text_input("Produit ou ingrédient", value=achat["Produit"], key="mod_produit")
-                quantite = st.number_input("Quantité", min_value=0.0, step=0.1, value=achat["Quantité"], key="mod_quantite")
-            with col3:
-                unite = st.text_input("Unité (g, kg, L...)", value=achat["Unité"], key="mod_unite")
-                prix_unitaire = st.number_input("Prix unitaire (€)", min_value=0.0, step=0.1, value=achat["Prix unitaire"], key="mod_prix_unitaire")
-            mode_paiement = st.selectbox("Mode de paiement", ["Carte bancaire", "Virement", "Chèque", "Espèces", "Autre"], index=["Carte bancaire", "Virement", "Chèque", "Espèces", "Autre"].index(achat["Mode de paiement"]), key="mod_mode_paiement")
-            categorie = st.selectbox("Catégorie", ["Matières premières", "Emballages", "Boissons", "Décoration", "Autre"], index=["Matières premières", "Emballages", "Boissons", "Décoration", "Autre"].index(achat["Catégorie"]), key="mod_categorie")
-            total = quantite * prix_unitaire
-            st.write(f"**Montant total : {total:.2f} €**")
-            submit_modification = st.form_submit_button("Modifier l'achat")
-            submit_suppression = st.form_submit_button("Supprimer l'achat")
-
-            if submit_modification:
-                df_achats.at[achat_selectionne, "Date"] = str(date_achat)
-                df_achats.at[achat_selectionne, "Fournisseur"] = fournisseur
-                df_achats.at[achat_selectionne, "Produit"] = produit
-                df_achats.at[achat_selectionne, "Quantité"] = quantite
-                df_achats.at[achat_selectionne, "Unité"] = unite
-                df_achats.at[achat_selectionne, "Prix unitaire"] = prix_unitaire
-                df_achats.at[achat_selectionne, "Total"] = total
-                df_achats.at[achat_selectionne, "Mode de paiement"] = mode_paiement
-                df_achats.at[achat_selectionne, "Catégorie"] = categorie
-                df_achats.to_csv(achats_file, index=False)
-                st.success("Achat modifié avec succès !")               
-
-            if submit_suppression:
-                df_achats = df_achats.drop(achat_selectionne)
-                df_achats.to_csv(achats_file, index=False)
-                st.success("Achat supprimé avec succès !")
-    else:
-        st.info("Aucun achat enregistré pour le moment.")
-#--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-# Module Stock & Inventaire
-if module_actif == "Stock & Inventaire":
-    ventes_file ="ventes.csv"
-    if os.path.exists(ventes_file):
-          df_ventes = pd.read_csv(ventes_file)
-          df_ventes["Date"] = pd.to_datetime(df_ventes["Date"])
-    else:
-          df_ventes = pd.DataFrame(columns=["Date","Produit","Quantité","Prix unitaire","Total","Mode de paiement"])                                  
-    stock_file = "stock.csv"
-    if os.path.exists(stock_file):
-        with open(stock_file, "r") as f:
-            stock_data = csv.load(f)
-    else:
-        stock_data = {}
+
+def afficher_besoins(besoins, niveaux_stock):
+    # Stock projeté : stock actuel moins les ingrédients de cette production (négatif = manque)
+    besoins = besoins[besoins > 0]
+    st.dataframe(pd.DataFrame({
+        "Besoin": besoins,
+        "Stock actuel": niveaux_stock.reindex(besoins.index, fill_value=0.0),
+        "Stock projeté": moteur_recettes.stock_projete(niveaux_stock, besoins).reindex(besoins.index),
+    }), use_container_width=True)
+
+
+@fragment
+def calculateur_recette(recettes, niveaux_stock):
+    matrice = moteur_recettes.compiler(recettes)
+    nom_recette = st.selectbox("Choisir une recette", list(recettes.keys()))
+    nb_portions = st.number_input("Nombre de portions", min_value=1, value=1)
+    st.markdown("### Ingrédients nécessaires")
+    besoins = matrice.consommation({nom_recette: nb_portions})
+    besoins = besoins[besoins > 0]
+    afficher_besoins(besoins, niveaux_stock)
+
+    mode_utilisation = st.radio("Action", ["Juste calculer", "Déduire du stock", "Créer une liste de courses"])
+    if mode_utilisation == "Déduire du stock":
+        # Les ventes sont déjà déduites automatiquement : ceci sert à la production hors vente
+        # (pertes, repas du personnel...). Un bouton, pour ne déduire qu'une fois par clic.
+        if st.button("Confirmer la déduction"):
+            stock.ajuster((-besoins).to_dict(), motif=f"{nom_recette} x {nb_portions}")
+            annoncer("Ingrédients déduits du stock.")
+    elif mode_utilisation == "Créer une liste de courses":
+        st.markdown("### Liste de courses")
+        afficher_liste_courses(besoins, niveaux_stock, f"courses_{nom_recette}_{nb_portions}")
+
+
+@fragment
+def consommation_du_jour(recettes, niveaux_stock):
+    matrice = moteur_recettes.compiler(recettes)
+    jour_conso = st.date_input("Journée de ventes", value=datetime.date.today(), key="jour_conso")
+    ventes_jour = requetes.lignes("ventes", jour_conso, jour_conso + datetime.timedelta(days=1))
+    conso_jour = matrice.consommation(ventes_jour.groupby(ventes_jour["Produit"].astype(object))["Quantité"].sum())
+    prix = moteur_recettes.prix_ingredients(donnees.charger("achats"))
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("**Ingrédients consommés et stock actuel**")
+        st.dataframe(pd.concat([conso_jour.rename("Consommé"), niveaux_stock.rename("Stock actuel")], axis=1).fillna(0), use_container_width=True)
+    with col2:
+        st.markdown("**Coût matière par portion**")
+        st.dataframe(matrice.cout_par_plat(prix), use_container_width=True)
+
+
+@fragment
+def production_recommandee(recettes, niveaux_stock):
+    # Prévision par produit à partir de l'historique des ventes (gestion/prevision.py)
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        jour = st.date_input("Production pour le", value=datetime.date.today() + datetime.timedelta(days=1),
+                             key="production_jour")
+    with col2:
+        nb_jours = st.number_input("Nombre de jours", min_value=1, max_value=14, value=1, key="production_nb_jours")
+    with col3:
+        service = st.slider("Ventes couvertes", min_value=0.5, max_value=0.99, value=prevision.SERVICE, step=0.01,
+                            key="production_service", help="Part des jours où la production suffit à toutes les ventes")
+    reco = prevision.recommandations(jour, nb_jours, service)
+    if reco.empty:
+        st.info("Pas encore assez de ventes pour proposer des quantités.")
+        return
+    st.dataframe(reco, use_container_width=True)
+    besoins = moteur_recettes.compiler(recettes).consommation(reco["À produire"])
+    st.markdown("**Ingrédients et stock projeté après cette production**")
+    afficher_besoins(besoins, niveaux_stock)
+    st.markdown("**Liste de courses pour cette production**")
+    afficher_liste_courses(besoins, niveaux_stock, f"courses_{jour}_{nb_jours}j")
+
+
+def module_stock():
+    stock_data = documents.charger("stock")
+    recettes = documents.charger("recettes")
+
+    # Niveaux calculés depuis les achats, les ventes et les inventaires (gestion/stock.py) ;
+    # stock_data ne garde que les seuils d'alerte
+    niveaux_stock = stock.niveaux(recettes)
+    seuils = {nom: infos.get("seuil", 0) for nom, infos in stock_data.items()}
     st.subheader("Gestion du stock & inventaire")
-    st.markdown("### Ajouter ou modifier un ingrédient")
-    with st.form("ajout_stock"):
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            ingredient = st.text_input("Nom de l'ingrédient")
-        with col2:
-            quantite = st.number_input("Quantité disponible", min_value=0.0, step=0.1)
-        with col3:
-            seuil = st.number_input("Seuil d'alerte", min_value=0.0, step=0.1)
-        submit_stock = st.form_submit_button("Enregistrer")
-        if submit_stock and ingredient:
-            stock_data[ingredient] = {"quantite": quantite, "seuil": seuil}
-            with open(stock_file, "w") as f:
-                csv.dump(stock_data, f)
-            st.success("Stock mis à jour avec succès")
+    st.markdown("### Inventaire d'un ingrédient")
+    inventaire_ingredient()
     st.markdown("---")
     st.subheader("Inventaire actuel")
-    if stock_data:
-        for nom, infos in stock_data.items():
-            qte = infos.get("quantite", 0)
-            seuil = infos.get("seuil", 0)
-            if qte <= seuil:
+    noms_stock = sorted(set(niveaux_stock.index) | set(seuils))
+    if noms_stock:
+        alertes_stock = stock.alertes(niveaux_stock, seuils)
+        for nom in noms_stock:
+            qte = round(float(niveaux_stock.get(nom, 0.0)), 3)
+            seuil = seuils.get(nom, 0)
+            if nom in alertes_stock:
                 st.error(f"{nom} : {qte} (seuil {seuil}) — à réapprovisionner")
             else:
                 st.write(f"{nom} : {qte} (seuil {seuil})")
@@ -329,72 +559,57 @@ if module_actif == "Stock & Inventaire":
     st.markdown("---")
     st.subheader("Calculateur de recette")
 
+    if recettes:
+        calculateur_recette(recettes, niveaux_stock)
+
+        # Consommation réelle à partir des ventes d'une journée
+        st.markdown("---")
+        st.subheader("Consommation et coût matière du jour")
+        consommation_du_jour(recettes, niveaux_stock)
 
-    recette_file = "recettes.csv"
-    if os.path.exists(recette_file):
-        with open(recette_file, "r") as f:
-            recettes = csv.load(f)
+        # Quantités à préparer d'après les ventes prévues, et ingrédients à acheter
+        st.markdown("---")
+        st.subheader("Production recommandée")
+        production_recommandee(recettes, niveaux_stock)
     else:
-        recettes = {}
-    if recettes:
-        nom_recette = st.selectbox("Choisir une recette", list(recettes.keys()))
-        nb_portions = st.number_input("Nombre de portions", min_value=1, value=1)
-        st.markdown("### Ingrédients nécessaires")
-        for ingr, qte in recettes[nom_recette]["ingredients"].items():
-            total = qte * nb_portions
-            st.write(f"{ingr} : {total}")
-
-        mode_utilisation = st.radio("Action", ["Juste calculer", "Déduire du stock", "Créer une liste de courses"])
-        if mode_utilisation == "Déduire du stock":
-            for ingr, qte in recettes[nom_recette]["ingredients"].items():
-                if ingr in stock_data:
-                    stock_data[ingr]["quantite"] -= qte * nb_portions
-            with open(stock_file, "w") as f:
-                csv.dump(stock_data, f)
-            st.success("Ingrédients déduits du stock.")
-        else:
-            st.info("Aucune recette enregistrée.")
- 
+        st.info("Aucune recette enregistrée.")
+
 # Module Recettes
-if module_actif == "Recettes":
+@fragment
+def ajout_recette():
+    nom = st.text_input("Nom de la recette", key="recette_nom")
+    duree = st.text_input("Durée de conservation", key="recette_duree")
+    ingredients = {}
+    nb_ingredients = st.number_input("Nombre d'ingrédients", min_value=1, max_value=20, value=3, key="recette_nb_ingredients")
+    for i in range(nb_ingredients):
+        col1, col2 = st.columns(2)
+        with col1:
+            ingr = st.text_input(f"Ingrédient {i+1}", key=f"ingr_{i}")
+        with col2:
+            qte = st.number_input(f"Quantité pour 1 portion", min_value=0.0, key=f"qte_{i}")
+        if ingr:
+            ingredients[ingr] = qte
+
+    etapes = st.text_area("Étapes de préparation (utiles pour la formation)", key="recette_etapes")
+    if st.button("Ajouter la recette") and nom:
+        documents.mettre("recettes", nom, {
+            "duree": duree,
+            "ingredients": ingredients,
+            "etapes": etapes
+        })
+        annoncer("Recette ajoutée avec succès !")
+
+
+def module_recettes():
     st.subheader("Fiches de production des recettes")
-    recette_file = "recettes.csv"
-    if os.path.exists(recette_file):
-        with open(recette_file, "r") as f:
-            recettes = csv.load(f)
-    else:
-        recettes = {}
+    recettes = documents.charger("recettes")
 
     st.markdown("### Ajouter une nouvelle recette")
-    with st.form("ajout_recette"):
-        nom = st.text_input("Nom de la recette")
-        duree = st.text_input("Durée de conservation")
-        ingredients = {}
-        nb_ingredients = st.number_input("Nombre d'ingrédients", min_value=1, max_value=20, value=3)
-        for i in range(nb_ingredients):
-            col1, col2 = st.columns(2)
-            with col1:
-                ingr = st.text_input(f"Ingrédient {i+1}", key=f"ingr_{i}")
-            with col2:
-                qte = st.number_input(f"Quantité pour 1 portion", min_value=0.0, key=f"qte_{i}")
-            if ingr:
-                ingredients[ingr] = qte
- 
-        etapes = st.text_area("Étapes de préparation (utiles pour la formation)")
-        submit_recette = st.form_submit_button("Ajouter la recette")
-        if submit_recette and nom:
-            recettes[nom] = {
-                "duree": duree,
-                "ingredients": ingredients,
-                "etapes": etapes
-            }
-            with open(recette_file, "w") as f:
-                csv.dump(recettes, f)
-            st.success("Recette ajoutée avec succès !")
- 
+    ajout_recette()
+
     st.markdown("---")
     st.subheader("Recettes existantes")
- 
+
     if recettes:
         for nom, details in recettes.items():
             with st.expander(nom):
@@ -406,25 +621,61 @@ if module_actif == "Recettes":
                 st.write(details["etapes"])
     else:
         st.info("Aucune recette enregistrée pour le moment.")
- 
+
 # Module RH
-if module_actif == "RH":
+@fragment
+def fiche_employe():
+    with st.expander("Ajouter ou modifier une fiche employé"):
+        fiches = documents.charger("employes")
+        choix = st.selectbox("Fiche", ["Nouvel employé"] + list(fiches), key="fiche_choix")
+        existant = choix != "Nouvel employé"
+        fiche = fiches.get(choix, {}) if existant else {}
+        # Un jeu de champs par fiche : changer de fiche reprend ses valeurs enregistrées
+        col1, col2 = st.columns(2)
+        with col1:
+            if existant:
+                nom_employe = choix
+                st.text_input("Nom", value=choix, disabled=True, key=f"fiche_nom_{choix}")
+            else:
+                nom_employe = st.text_input("Nom", key="fiche_nom")
+            contrat = st.text_input("Contrat (CDI 35 h, extra...)", value=fiche.get("contrat", ""), key=f"fiche_contrat_{choix}")
+        with col2:
+            taux_horaire = st.number_input("Taux horaire (€)", min_value=0.0, step=0.5,
+                                           value=float(fiche.get("taux_horaire", 0.0)), key=f"fiche_taux_{choix}")
+            prime = st.number_input("Prime du mois (€)", min_value=0.0, step=10.0,
+                                    value=float(fiche.get("prime", 0.0)), key=f"fiche_prime_{choix}")
+        absences = st.text_input("Absences", value=fiche.get("absences", ""), key=f"fiche_absences_{choix}")
+        if st.button("Enregistrer la fiche") and nom_employe:
+            fiche = dict(documents.obtenir("employes", nom_employe, {}))
+            fiche.update({"contrat": contrat, "taux_horaire": taux_horaire, "prime": prime, "absences": absences})
+            documents.mettre("employes", nom_employe, fiche)
+            annoncer(f"Fiche de {nom_employe} enregistrée.")
+
+
+@fragment
+def grille_planning(planning_equipe, employes, semaines_du_mois):
+    # Formulaire : les cases modifiées ne déclenchent rien avant l'enregistrement
+    with st.form("form_planning"):
+        grille = st.data_editor(planning.grille(planning_equipe, employes), use_container_width=True,
+                                key="grille_planning")
+        submit_planning = st.form_submit_button("Enregistrer le planning")
+    if submit_planning:
+        nouveau = documents.remplacer("planning", planning.depuis_grille(grille))
+        documents.modifier("employes", lambda fiches: planning.mettre_a_jour_fiches(
+            fiches, nouveau, semaines_du_mois))
+        annoncer("Planning enregistré avec succès")
+
+
+def module_rh():
     st.subheader("Gestion des ressources humaines")
-    employes_file = "employes.csv"
-    planning_file = "planning.csv"
- 
-    if os.path.exists(employes_file):
-        with open(employes_file, "r") as f:
-            employes = csv.load(f)
-    else:
-        employes = {}
- 
-    if os.path.exists(planning_file):
-        with open(planning_file, "r") as f:
-            planning = csv.load(f)
-    else:
-        planning = {}
- 
+    planning_equipe = documents.charger("planning")
+
+    # Heures déduites du planning (semaine type) : voir gestion/planning.py
+    semaines_du_mois = len(paie.semaines(datetime.date.today().strftime("%Y-%m")))
+    employes = planning.mettre_a_jour_fiches(documents.charger("employes"), planning_equipe, semaines_du_mois)
+
+    fiche_employe()
+
     st.markdown("### Fiche employé")
     for nom in employes:
         with st.expander(nom):
@@ -432,176 +683,343 @@ if module_actif == "RH":
             st.write(f"**Heures travaillées ce mois** : {employes[nom].get('heures_mois', 0)}h")
             st.write(f"**Heures cette semaine** : {employes[nom].get('heures_semaine', 0)}h")
             st.write(f"**Pointage :** {employes[nom].get('pointage', '')}")
- 
+
     st.markdown("---")
     st.subheader("Planning de l'équipe")
- 
-    jours_semaine = ["Lundi", "Mardi", "Mercredi", "Jeudi", "Vendredi", "Samedi", "Dimanche"]
- 
-    planning_saisi = {}
-    with st.form("form_planning"):
-        for jour in jours_semaine:
-            st.markdown(f"**{jour}**")
-            for nom in employes:
-                plage = st.text_input(f"{nom} ({jour})", value=planning.get(jour, {}).get(nom, ""), key=f"{jour}_{nom}")
-                if jour not in planning_saisi:
-                    planning_saisi[jour] = {}
-                planning_saisi[jour][nom] = plage
- 
-        submit_planning = st.form_submit_button("Enregistrer le planning")
-        if submit_planning:
-            planning.update(planning_saisi)
-            with open(planning_file, "w") as f:
-                csv.dump(planning, f)
-            st.success("Planning enregistré avec succès")
- 
+    st.caption("Une case par employé et par jour : « 9h-17h », « 9h30-14h / 18h-22h », vide ou « repos ».")
+    grille_planning(planning_equipe, employes, semaines_du_mois)
+
+    _, illisibles = planning.compiler(planning_equipe)
+    if not illisibles.empty:
+        st.warning("Plages non reconnues (comptées comme repos) :")
+        st.dataframe(illisibles, use_container_width=True, hide_index=True)
+    conflits = planning.chevauchements(planning_equipe)
+    if not conflits.empty:
+        st.error("Services qui se chevauchent :")
+        st.dataframe(conflits, use_container_width=True, hide_index=True)
+    repos = planning.repos_insuffisants(planning_equipe)
+    if not repos.empty:
+        st.warning(f"Repos quotidien inférieur à {planning.REPOS_MIN:g} h :")
+        st.dataframe(repos, use_container_width=True, hide_index=True)
+    trop = planning.depassements(planning_equipe)
+    if not trop.empty:
+        st.warning(f"Semaines de plus de {planning.HEURES_MAX_SEMAINE:g} h :")
+        st.dataframe(trop, use_container_width=True, hide_index=True)
+
+    heures = planning.heures_par_jour(planning_equipe)
+    if not heures.empty:
+        st.markdown("### Heures prévues par semaine")
+        st.dataframe(heures.assign(Total=heures.sum(axis=1)).round(2), use_container_width=True)
+
     st.markdown("### Calendrier des absences")
     for nom in employes:
         st.write(f"{nom} : {employes[nom].get('absences', 'Aucune absence renseignée')}")
- 
+
 # Module Paie
-if module_actif == "Paie":
+@fragment
+def module_paie():
+    # Toute la page dépend du mois et du taux choisis : un seul fragment
     st.subheader("Tableau de paie mensuel")
- 
-    employes_file = "employes.csv"
-    if os.path.exists(employes_file):
-        with open(employes_file, "r") as f:
-            employes = csv.load(f)
-    else:
-        employes = {}
- 
+
+    employes = documents.charger("employes")
+    planning_equipe = documents.charger("planning")
+
     st.markdown("### Paramètres généraux")
-    taux_horaire_base = st.number_input("Taux horaire (€)", min_value=0.0, step=0.5, value=12.0)
-    taux_h_sup = st.number_input("Taux heure supp (€)", min_value=0.0, step=0.5, value=18.0)
- 
-    paie_data = []
-    for nom in employes:
-        heures = employes[nom].get("heures_mois", 0)
-        supp = employes[nom].get("heures_supp", 0)
-        prime = employes[nom].get("prime", 0)
-        brut = heures * taux_horaire_base + supp * taux_h_sup + prime
-        cotisation = brut * 0.22  # à adapter
-        net = brut - cotisation
-        paie_data.append({
-            "Employé": nom,
-            "Heures": heures,
-            "HS": supp,
-            "Taux h": taux_horaire_base,
-            "Taux HS": taux_h_sup,
-            "Brut": brut,
-            "Prime": prime,
-            "Cotisation": cotisation,
-            "Net à payer": net
-        })
-    df_paie = pd.DataFrame(paie_data)
-    st.dataframe(df_paie, use_container_width=True)
+    col1, col2 = st.columns(2)
+    with col1:
+        debut_mois = datetime.date.today().replace(day=1)
+        mois_possibles = [(debut_mois - pd.DateOffset(months=i)).strftime("%Y-%m") for i in range(24)]
+        mois_paie = st.selectbox("Mois de paie", mois_possibles)
+    with col2:
+        taux_horaire_base = st.number_input("Taux horaire par défaut (€)", min_value=0.0, step=0.5, value=12.0,
+                                            help="Utilisé pour les employés sans taux horaire sur leur fiche")
+
+    # Paie validée : les montants versés, relus dans le registre, jamais recalculés
+    deja_validee = paie.validee(mois_paie)
+    if not deja_validee.empty:
+        st.success(f"Paie de {mois_paie} validée : montants enregistrés.")
+        st.dataframe(deja_validee, use_container_width=True, hide_index=True)
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Masse salariale brute (€)", f"{deja_validee['Brut'].sum():.2f}")
+        col2.metric("Cotisations (€)", f"{deja_validee['Cotisation'].sum():.2f}")
+        col3.metric("Net à payer (€)", f"{deja_validee['Net à payer'].sum():.2f}")
+        recalcul = st.expander("Recalculer et valider à nouveau")
+    else:
+        recalcul = st.container()
+
+    with recalcul:
+        # Calcul vectorisé sur les entrées figées du mois, en cache : voir gestion/paie.py
+        df_paie = paie.calculer(mois_paie, employes, planning_equipe, taux_horaire_base)
+        with profil.mesure("rendu paie"):
+            st.dataframe(df_paie, use_container_width=True, hide_index=True)
+        if not df_paie.empty:
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Masse salariale brute (€)", f"{df_paie['Brut'].sum():.2f}")
+            col2.metric("Cotisations (€)", f"{df_paie['Cotisation'].sum():.2f}")
+            col3.metric("Net à payer (€)", f"{df_paie['Net à payer'].sum():.2f}")
+        st.caption(f"Règles de paie : version {df_paie.attrs['version_regles']} — heures supplémentaires au-delà de la "
+                   "durée légale hebdomadaire, par paliers ; semaines payées avec le mois de leur dimanche.")
+        if mois_paie < datetime.date.today().strftime("%Y-%m"):
+            date_entrees = datetime.date.fromisoformat(df_paie.attrs["date_entrees"])
+            st.caption(f"Mois passé : planning, fiches et taux par défaut tels qu'au {date_entrees.strftime('%d/%m/%Y')}.")
+            if st.button("Reprendre le planning, les fiches et le taux actuels"):
+                paie.calculer(mois_paie, employes, planning_equipe, taux_horaire_base, rafraichir=True)
+                annoncer(f"Paie de {mois_paie} recalculée avec les données actuelles.")
+
+        # Paie validée = versée : enregistrée puis reportée en trésorerie (une revalidation remplace la précédente)
+        if not df_paie.empty and st.button(f"Valider la paie de {mois_paie}"):
+            fin_mois = pd.Period(mois_paie, freq="M").end_time.date()
+            donnees.ajouter_lignes("paie", [{
+                "Date": str(fin_mois),
+                "Employé": ligne["Employé"],
+                "Heures": ligne["Heures"],
+                "Heures supp": ligne["HS"],
+                "Prime": ligne["Prime"],
+                "Brut": ligne["Brut"],
+                "Cotisation": ligne["Cotisation"],
+                "Net à payer": ligne["Net à payer"],
+            } for ligne in df_paie.to_dict("records")])
+            annoncer(f"Paie de {mois_paie} enregistrée.")
 
 # Module Trésorerie
-if module_actif == "Trésorerie":
+@fragment
+def flux_tresorerie(analyse_treso):
+    granularite = st.radio("Regrouper par", ["Semaine", "Mois"], index=1, horizontal=True)
+    flux = analyse_treso["hebdomadaire" if granularite == "Semaine" else "mensuel"]
+    flux = flux.set_axis(flux.index.astype(str))
+    with profil.mesure("rendu flux"):
+        st.bar_chart(flux[["Entrées", "Sorties"]])
+
+
+@fragment
+def mouvement_manuel():
+    col1, col2 = st.columns(2)
+    with col1:
+        date = st.date_input("Date du mouvement", value=datetime.date.today(), key="treso_date")
+        libelle = st.text_input("Libellé", key="treso_libelle")
+        montant = st.number_input("Montant (€)", min_value=0.0, step=0.5, key="treso_montant")
+    with col2:
+        type_mvt = st.selectbox("Type", ["Entrée", "Sortie"], key="treso_type")
+        mode = st.selectbox("Mode de paiement", ["Espèces", "Carte bancaire", "Virement", "Chèque", "Autre"], key="treso_mode")
+        categorie = st.selectbox("Catégorie", ["Divers", "Personnel", "Vente", "Achat", "Autre"], key="treso_categorie")
+    if st.button("Ajouter le mouvement"):
+        ajout = {
+            "Date": str(date),
+            "Libellé": libelle,
+            "Type": type_mvt,
+            "Montant": montant,
+            "Mode": mode,
+            "Catégorie": categorie
+        }
+        agregats.ajouter("tresorerie", ajout)
+        annoncer("Mouvement ajouté avec succès !")
+
+
+def module_tresorerie():
     st.subheader("Vue d’ensemble de la trésorerie")
-   
-    ventes_file = "ventes.csv"
-    achats_file = "achats.csv"
-    treso_file = "tresorerie.csv"
-
-    if os.path.exists(treso_file):
-        df_treso = pd.read_csv(treso_file)
-        df_treso["Date"] = pd.to_datetime(df_treso["Date"])
-    else:
-        df_treso = pd.DataFrame(columns=["Date", "Libellé", "Type", "Montant", "Mode", "Catégorie"])
 
-    # Synchronisation avec ventes et achats si besoin (optionnel ici, tu les gères manuellement)
+    # Ventes, achats et paies sont reportés automatiquement à partir de la date de départ
+    # (seuls les nouveaux mouvements sont ajoutés)
+    debut_report = datetime.date.fromisoformat(rapprochement.debut())
+    with st.expander(f"Report automatique des ventes, achats et paies depuis le {debut_report.strftime('%d/%m/%Y')}"):
+        nouveau_debut = st.date_input("Reporter à partir du", value=debut_report, key="rapprochement_debut")
+        st.caption("Avant cette date, les mouvements sont supposés saisis à la main et ne sont pas reportés.")
+        if st.button("Changer la date de départ") and nouveau_debut != debut_report:
+            rapprochement.definir_debut(nouveau_debut)
+            annoncer(f"Report automatique à partir du {nouveau_debut.strftime('%d/%m/%Y')}.")
+    nb_reportes = rapprochement.synchroniser()
+    if nb_reportes:
+        st.caption(f"{nb_reportes} mouvement(s) reporté(s) depuis les ventes, achats et paies.")
+    df_treso = donnees.charger("tresorerie")
 
     # Vue globale
     st.markdown("### Bilan global")
-   
-    total_entrees = df_treso[df_treso["Type"] == "Entrée"]["Montant"].sum()
-    total_sorties = df_treso[df_treso["Type"] == "Sortie"]["Montant"].sum()
+
+    totaux_type = agregats.obtenir("tresorerie").par("Type")
+    total_entrees = totaux_type.get("Entrée", 0.0)
+    total_sorties = totaux_type.get("Sortie", 0.0)
     solde = total_entrees - total_sorties
     col1, col2, col3 = st.columns(3)
     col1.metric("Entrées (€)", f"{total_entrees:.2f}")
     col2.metric("Sorties (€)", f"{total_sorties:.2f}")
     col3.metric("Solde actuel (€)", f"{solde:.2f}")
 
-    df_treso["Mois"] = df_treso["Date"].apply(lambda x: x.strftime("%Y-%m"))
-    graph_data = df_treso.groupby(["Mois", "Type"])["Montant"].sum().unstack(fill_value=0)
-    st.bar_chart(graph_data)
+    # Flux, solde et prévision calculés une fois par version du registre (gestion/tresorerie.py)
+    analyse_treso = tresorerie.analyse()
+    if not analyse_treso["quotidien"].empty:
+        flux_tresorerie(analyse_treso)
+
+        st.markdown("### Évolution du solde")
+        quotidien = analyse_treso["quotidien"]
+        net_7, net_30 = tresorerie.nets_au(quotidien)
+        col1, col2 = st.columns(2)
+        col1.metric("Flux net 7 derniers jours (€)", f"{net_7:.2f}")
+        col2.metric("Flux net 30 derniers jours (€)", f"{net_30:.2f}")
+        with profil.mesure("rendu solde"):
+            st.line_chart(quotidien[["Solde"]])
+
+        st.markdown("### Prévision sur 8 semaines")
+        prevision_treso = analyse_treso["prevision"]
+        st.metric(
+            f"Solde prévu au {prevision_treso.index[-1].strftime('%d/%m/%Y')} (€)",
+            f"{prevision_treso['Solde prévu'].iloc[-1]:.2f}",
+            delta=f"{prevision_treso['Solde prévu'].iloc[-1] - quotidien['Solde'].iloc[-1]:.2f}",
+        )
+        with profil.mesure("rendu prévision"):
+            st.line_chart(prevision_treso[["Solde bas", "Solde prévu", "Solde haut"]])
+        st.caption("Moyenne des flux par jour de la semaine (12 dernières semaines) et par jour du mois "
+                   "(6 derniers mois), à partir du dernier mouvement enregistré.")
 
     st.markdown("---")
     st.subheader("Ajouter un mouvement manuel")
-    with st.form("form_treso"):
-        col1, col2 = st.columns(2)
-        with col1:
-            date = st.date_input("Date du mouvement", value=datetime.date.today())
-            libelle = st.text_input("Libellé")
-            montant = st.number_input("Montant (€)", min_value=0.0, step=0.5)
-        with col2:
-            type_mvt = st.selectbox("Type", ["Entrée", "Sortie"])
-            mode = st.selectbox("Mode de paiement", ["Espèces", "Carte bancaire", "Virement", "Chèque", "Autre"])
-            categorie = st.selectbox("Catégorie", ["Divers", "Personnel", "Vente", "Achat", "Autre"])
-        submit_treso = st.form_submit_button("Ajouter le mouvement")
-        if submit_treso:
-            ajout = {
-                "Date": pd.to_datetime(date),
-                "Libellé": libelle,
-                "Type": type_mvt,
-                "Montant": montant,
-                "Mode": mode,
-                "Catégorie": categorie
-            }
-            df_treso = pd.concat([df_treso, pd.DataFrame([ajout])], ignore_index=True)
-            df_treso.to_csv(treso_file, index=False)
-            st.success("Mouvement ajouté avec succès !")
- 
+    mouvement_manuel()
+
     st.markdown("---")
     st.subheader("Historique des mouvements")
- 
+
     if not df_treso.empty:
-        df_treso = df_treso.sort_values("Date", ascending=False)
-        st.dataframe(df_treso, use_container_width=True)
-        csv = df_treso.to_csv(index=False).encode('utf-8')
-        st.download_button("Télécharger l'historique (CSV)", data=csv, file_name="tresorerie_maison_saba.csv", mime="text/csv")
+        afficher_historique("tresorerie", filtres=("Type", "Catégorie", "Mode"))
+        bouton_export("tresorerie", "tresorerie_maison_saba")
     else:
         st.info("Aucun mouvement de trésorerie enregistré.")
- 
+
 # Module Comptes bancaires
-if module_actif == "Comptes bancaires":
-    st.subheader("Suivi des comptes bancaires")
-    comptes_file = "comptes_bancaires.csv"
- 
-    if os.path.exists(comptes_file):
-        with open(comptes_file, "r") as f:
-            comptes_data = csv.load(f)
-    else:
-        comptes_data = {}
- 
+MOIS_NOMS = ["Janvier", "Février", "Mars", "Avril", "Mai", "Juin", "Juillet", "Août", "Septembre", "Octobre", "Novembre", "Décembre"]
+
+
+@fragment
+def saisie_solde():
     with st.form("ajout_compte"):
-        col1, col2 = st.columns(2)
+        col1, col2, col3 = st.columns(3)
         with col1:
             compte_nom = st.text_input("Nom du compte", key="compte_nom")
         with col2:
-            mois = st.selectbox(
-                "Mois",
-                ["Janvier", "Février", "Mars", "Avril", "Mai", "Juin", "Juillet", "Août", "Septembre", "Octobre", "Novembre", "Décembre"],
-                index=datetime.date.today().month - 1
-            )
+            mois = st.selectbox("Mois", MOIS_NOMS, index=datetime.date.today().month - 1)
+        with col3:
+            annee = st.number_input("Année", min_value=2000, max_value=2100, value=datetime.date.today().year, step=1)
         solde = st.number_input("Solde à la fin du mois (€)", step=0.01)
         submit_solde = st.form_submit_button("Enregistrer le solde")
 
-        if submit_solde and compte_nom:
-            if compte_nom not in comptes_data:
-                comptes_data[compte_nom] = {}
-            comptes_data[compte_nom][mois] = solde
-            with open(comptes_file, "w") as f:
-                csv.dump(comptes_data, f)
-            st.success("Solde enregistré avec succès")
+    if submit_solde and compte_nom:
+        fin_mois = pd.Period(year=int(annee), month=MOIS_NOMS.index(mois) + 1, freq="M").end_time.date()
+        donnees.ajouter("soldes_bancaires", {"Date": str(fin_mois), "Compte": compte_nom, "Solde": solde, "Origine": "Saisie"})
+        annoncer("Solde enregistré avec succès")
+
+
+@fragment
+def import_releve():
+    with st.form("import_releve"):
+        fichier_releve = st.file_uploader("Relevé bancaire (CSV ou OFX)", type=["csv", "ofx", "qfx"])
+        compte_releve = st.text_input("Compte (facultatif pour un OFX)", key="compte_releve")
+        submit_releve = st.form_submit_button("Importer")
+    if submit_releve and fichier_releve is not None:
+        try:
+            ajoutees, doublons, nb_soldes = banque.importer(fichier_releve, fichier_releve.name, compte_releve or None)
+        except ValueError as e:
+            st.error(str(e))
+        else:
+            annoncer(f"{ajoutees} opération(s) importée(s), {doublons} déjà connue(s), {nb_soldes} solde(s) journalier(s).")
+
+
+def module_comptes_bancaires():
+    st.subheader("Suivi des comptes bancaires")
+    # Soldes et relevés dans les registres soldes_bancaires / releves_bancaires (gestion/banque.py)
+    saisie_solde()
+
+    st.markdown("### Importer un relevé")
+    import_releve()
 
-    if comptes_data:
+    soldes_comptes = banque.series_soldes()
+    if not soldes_comptes.empty:
         st.markdown("---")
         st.subheader("Soldes enregistrés")
-        for compte, mois_data in comptes_data.items():
-            st.markdown(f"**{compte}**")
-            df_solde = pd.DataFrame(list(mois_data.items()), columns=["Mois", "Solde (€)"]).sort_values("Mois")
-            st.dataframe(df_solde, use_container_width=True)
+        with profil.mesure("rendu soldes"):
+            st.line_chart(soldes_comptes.ffill())
+        fins_de_mois = banque.series_soldes("ME")
+        fins_de_mois.index = fins_de_mois.index.strftime("%Y-%m")
+        st.dataframe(fins_de_mois, use_container_width=True)
+
+        st.markdown("---")
+        st.subheader("Rapprochement avec la trésorerie")
+        rapport = rapprochement.ecarts_bancaires()
+        anomalies = rapport[rapport["Anomalie"]]
+        for mois_anomalie, ligne in anomalies.iterrows():
+            st.warning(f"{mois_anomalie} : les comptes ont varié de {ligne['Variation banque']:.2f} € "
+                       f"pour {ligne['Flux trésorerie']:.2f} € de flux en trésorerie (écart {ligne['Écart']:.2f} €)")
+        st.dataframe(rapport, use_container_width=True)
+        st.caption("Variation des soldes de fin de mois (tous comptes) comparée aux mouvements de trésorerie "
+                   "hors espèces du même mois.")
     else:
         st.info("Aucun compte enregistré pour le moment.")
+
+    pointage = banque.pointer()
+    if not pointage.empty:
+        st.markdown("---")
+        st.subheader("Pointage des relevés")
+        non_pointees = pointage[pointage["Mouvement"] < 0]
+        col1, col2 = st.columns(2)
+        col1.metric("Opérations pointées", len(pointage) - len(non_pointees))
+        col2.metric("Sans mouvement en trésorerie", len(non_pointees))
+        if not non_pointees.empty:
+            st.dataframe(non_pointees.drop(columns=["Mouvement", "Identifiant"]).sort_values("Date", ascending=False).head(200),
+                         use_container_width=True, hide_index=True)
+
+
+# Module Profilage (page cachée, voir gestion/profil.py)
+def module_profilage():
+    st.subheader("Profilage des reruns")
+    st.caption(f"Derniers {profil.NB_RERUNS} reruns par page ou fragment, toutes sessions du serveur. "
+               "Un fragment relancé seul apparaît comme « Page / fragment ».")
+    resume = profil.resume()
+    if resume.empty:
+        st.info("Aucun rerun mesuré pour le moment.")
+    else:
+        st.dataframe(resume, use_container_width=True, hide_index=True)
+
+        zone = st.selectbox("Détail des étapes", resume["Zone"])
+        st.dataframe(profil.etapes(zone), use_container_width=True, hide_index=True)
+        st.caption("Durée d'une étape : blocs imbriqués compris (« charger ventes » inclut « lecture » et « typage »).")
+
+    st.markdown("### Octets lus et écrits par registre")
+    st.dataframe(profil.octets_par_registre(), use_container_width=True)
+
+    # Compteurs des caches depuis le démarrage du processus : un taux de hits bas
+    # ou des reconstructions fréquentes expliquent souvent un rerun lent
+    st.markdown("### Caches")
+    compteurs = {
+        "Registres": donnees.stats_cache(),
+        "Documents": documents.stats(),
+        "Agrégats": agregats.stats(),
+        "Stock": stock.stats(),
+        "Prévisions": prevision.stats(),
+        "Rapprochement": rapprochement.stats(),
+    }
+    st.dataframe(pd.DataFrame([{"Cache": cache, "Compteur": nom, "Valeur": valeur}
+                               for cache, valeurs in compteurs.items() for nom, valeur in valeurs.items()]),
+                 use_container_width=True, hide_index=True)
+    if profil.TRACE:
+        st.caption(f"Trace JSONL : {profil.TRACE}")
+    if st.button("Remettre à zéro"):
+        profil.vider()
+        annoncer("Mesures remises à zéro.")
+
+
+# Un point d'entrée par module : la page active est seule exécutée à chaque rerun complet
+MODULES = {
+    "Dashboard": module_dashboard,
+    "Ventes": module_ventes,
+    "Achats": module_achats,
+    "Stock & Inventaire": module_stock,
+    "Recettes": module_recettes,
+    "RH": module_rh,
+    "Paie": module_paie,
+    "Trésorerie": module_tresorerie,
+    "Comptes bancaires": module_comptes_bancaires,
+    "Profilage": module_profilage,
+}
+with profil.rerun(module_actif):
+    MODULES[module_actif]()
+# Une fois la première page affichée, les autres registres, les agrégats et altair sont chargés
+# en tâche de fond, une seule fois par processus (gestion/prechauffage.py)
+prechauffage.demarrer()
+mesurer("app", debut_rerun)
@@ -0,0 +1,22 @@
+"""Les modules de gestion lisent le dossier des données et le stockage à l'import :
+chaque session de tests travaille dans un dossier temporaire, en CSV."""
+import os
+import sys
+import tempfile
+
+import pytest
+
+os.environ["MAISON_SABA_DONNEES"] = tempfile.mkdtemp(prefix="maison_saba_tests_")
+os.environ["MAISON_SABA_STOCKAGE"] = "csv"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gestion import donnees  # noqa: E402
+
+
+@pytest.fixture
+def dossier(tmp_path, monkeypatch):
+    """Dossier de données vide, propre à chaque test."""
+    monkeypatch.setattr(donnees, "DOSSIER", str(tmp_path))
+    donnees.invalider()
+    yield tmp_path
+    donnees.invalider()
@@ -0,0 +1,82 @@
+"""Import des relevés bancaires (``gestion/banque.py``)."""
+import io
+
+import pytest
+
+from gestion import banque, donnees
+
+
+def csv_releve(texte):
+    return io.BytesIO(texte.encode("utf-8"))
+
+
+def test_csv_point_virgule_decimales_point(dossier):
+    morceaux = list(banque.lire_csv(csv_releve(
+        "Date;Libellé;Montant;Solde\n"
+        "02/01/2025;Boulangerie;-12.50;987.50\n"
+        "03/01/2025;Virement;1 000.00;1987.50\n"
+    ), "Courant"))
+    releve = morceaux[0]
+    assert releve["Montant"].tolist() == [-12.5, 1000.0]
+    assert releve["Solde"].tolist() == [987.5, 1987.5]
+
+
+def test_csv_point_virgule_decimales_virgule(dossier):
+    releve = next(banque.lire_csv(csv_releve(
+        "Date;Libellé;Débit;Crédit\n"
+        "02/01/2025;Boulangerie;1.234,56;\n"
+        "03/01/2025;Virement;;12,5\n"
+    ), "Courant"))
+    assert releve["Montant"].tolist() == pytest.approx([-1234.56, 12.5])
+
+
+def test_csv_virgule_decimales_point(dossier):
+    releve = next(banque.lire_csv(csv_releve(
+        "Date,Libellé,Montant\n"
+        "02/01/2025,Boulangerie,-12.50\n"
+    ), "Courant"))
+    assert releve["Montant"].tolist() == [-12.5]
+
+
+def test_csv_reference_vide_importee(dossier):
+    releve = ("Date;Libellé;Montant;Solde;Référence\n"
+              "02/01/2025;Boulangerie;-12,50;987,50;A1\n"
+              "03/01/2025;Virement;100,00;1087,50;\n")
+    assert banque.importer(csv_releve(releve), "releve.csv", "Courant") == (2, 0, 2)
+    importees = donnees.charger("releves_bancaires")
+    assert importees["Montant"].tolist() == [-12.5, 100.0]
+    assert importees["Identifiant"].iloc[0] == "A1" and importees["Identifiant"].iloc[1] != ""
+    # Réimport : la ligne sans référence est reconnue à son empreinte
+    assert banque.importer(csv_releve(releve), "releve.csv", "Courant") == (0, 2, 2)
+
+
+def test_ofx_solde_de_fin(dossier):
+    ofx = ("<OFX><BANKACCTFROM><ACCTID>FR76</ACCTID></BANKACCTFROM><BANKTRANLIST>"
+           "<STMTTRN><DTPOSTED>20250102<TRNAMT>-12.50<FITID>F1<NAME>Boulangerie</STMTTRN>"
+           "<STMTTRN><DTPOSTED>20250103<TRNAMT>100.00<NAME>Virement</STMTTRN>"
+           "</BANKTRANLIST><LEDGERBAL><BALAMT>1087.50<DTASOF>20250103</LEDGERBAL></OFX>")
+    assert banque.importer(csv_releve(ofx), "releve.ofx") == (2, 0, 2)
+    soldes = donnees.charger("soldes_bancaires")
+    assert soldes["Solde"].tolist() == [987.5, 1087.5]
+
+
+def test_csv_plus_recent_d_abord(dossier):
+    releve = ("Date;Libellé;Montant;Solde\n"
+              "03/01/2025;Virement;100,00;1087,50\n"
+              "02/01/2025;Café;-2,50;987,50\n"
+              "02/01/2025;Boulangerie;-10,00;990,00\n")
+    banque.importer(csv_releve(releve), "releve.csv", "Courant")
+    soldes = donnees.charger("soldes_bancaires")
+    assert soldes["Solde"].tolist() == [987.5, 1087.5]
+
+
+def test_pointage_au_plus_proche(dossier):
+    donnees.ajouter_lignes("tresorerie", [
+        {"Date": "2025-01-03", "Libellé": "Loyer", "Type": "Sortie", "Montant": 10.0, "Mode": "Virement",
+         "Catégorie": "Divers"},
+    ])
+    donnees.ajouter_lignes("releves_bancaires", [
+        {"Date": "2025-01-01", "Compte": "Courant", "Libellé": "Prélèvement", "Montant": -10.0, "Identifiant": "A"},
+        {"Date": "2025-01-03", "Compte": "Courant", "Libellé": "Loyer", "Montant": -10.0, "Identifiant": "B"},
+    ])
+    assert banque.pointer()["Mouvement"].tolist() == [-1, 0]
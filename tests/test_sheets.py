@@ -0,0 +1,221 @@
+"""Client Google Sheets et synchronisation des registres, contre un faux serveur HTTP local."""
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+import pytest
+
+from gestion import donnees, sheets
+
+PLAGE = re.compile(r"^(?P<onglet>[^!]+)!(?P<col>[A-Z]+)(?P<ligne>\d+)(?::(?P<col2>[A-Z]+)(?P<ligne2>\d+))?$")
+
+
+class FauxSheets(ThreadingHTTPServer):
+    """Classeur en mémoire servant values:batchGet, batchUpdate et batchClear.
+
+    ``pannes`` : réponses imposées aux prochaines requêtes, (statut, en-têtes,
+    appliquer) ; avec ``appliquer``, la requête est traitée avant de répondre
+    l'erreur (issue incertaine vue du client).
+    """
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), Gestionnaire)
+        self.onglets = {}
+        self.version = 0
+        self.pannes = []
+        self.requetes = []
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v4"
+
+    def lignes(self, onglet):
+        return self.onglets.setdefault(onglet, [])
+
+    def ecrire(self, plage, valeurs):
+        m = PLAGE.match(plage)
+        lignes = self.lignes(m["onglet"])
+        debut = int(m["ligne"]) - 1
+        lignes.extend([] for _ in range(debut + len(valeurs) - len(lignes)))
+        for i, ligne in enumerate(valeurs):
+            lignes[debut + i] = [str(v) for v in ligne]
+        self.version += 1
+
+    def effacer(self, plage):
+        m = PLAGE.match(plage)
+        lignes = self.lignes(m["onglet"])
+        for i in range(int(m["ligne"]) - 1, min(int(m["ligne2"]), len(lignes))):
+            lignes[i] = []
+        while lignes and not lignes[-1]:
+            lignes.pop()
+        self.version += 1
+
+    def lire(self, plage):
+        m = PLAGE.match(plage)
+        lignes = self.lignes(m["onglet"])
+        fin = int(m["ligne2"]) if m["ligne2"] else len(lignes)
+        return lignes[int(m["ligne"]) - 1:fin]
+
+
+class Gestionnaire(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _repondre(self, statut, corps=None, entetes=None):
+        contenu = json.dumps(corps or {}).encode()
+        self.send_response(statut)
+        for cle, valeur in (entetes or {}).items():
+            self.send_header(cle, valeur)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(contenu)))
+        self.end_headers()
+        self.wfile.write(contenu)
+
+    def _traiter(self):
+        serveur = self.server
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        corps = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        serveur.requetes.append((self.command, unquote(url.path), params, corps))
+        panne = serveur.pannes.pop(0) if serveur.pannes else None
+        if panne is not None and not panne[2]:
+            return self._repondre(panne[0], {"error": "panne"}, panne[1])
+
+        if url.path.endswith("values:batchGet"):
+            etag = f'"{serveur.version}"'
+            if self.headers.get("If-None-Match") == etag:
+                return self._repondre(304, entetes={"ETag": etag})
+            plages = params["ranges"]
+            resultat = (200, {"valueRanges": [{"range": p, "values": serveur.lire(p)} for p in plages]}, {"ETag": etag})
+        elif url.path.endswith("values:batchUpdate"):
+            for bloc in corps["data"]:
+                serveur.ecrire(bloc["range"], bloc["values"])
+            resultat = (200, {"totalUpdatedRows": sum(len(b["values"]) for b in corps["data"])}, None)
+        elif url.path.endswith("values:batchClear"):
+            for plage in corps["ranges"]:
+                serveur.effacer(plage)
+            resultat = (200, {}, None)
+        else:
+            resultat = (404, {"error": "inconnu"}, None)
+        if panne is not None:
+            return self._repondre(panne[0], {"error": "panne après écriture"}, panne[1])
+        self._repondre(*resultat)
+
+    do_GET = do_POST = _traiter
+
+
+@pytest.fixture
+def serveur():
+    serveur = FauxSheets()
+    yield serveur
+    serveur.shutdown()
+    serveur.server_close()
+
+
+def client(serveur, **options):
+    return sheets.ClientSheets(jeton="test", url=serveur.url, attente_base=0.01, **dict({"ttl": 0.0}, **options))
+
+
+def test_plusieurs_plages_en_une_requete(serveur):
+    serveur.ecrire("Ventes!A1", [["a", "b"], ["c", "d"]])
+    serveur.ecrire("Achats!A1", [["x"]])
+    valeurs = client(serveur).lire_plages("classeur", ["Ventes!A1:B2", "Achats!A1:A1"])
+    assert valeurs == {"Ventes!A1:B2": [["a", "b"], ["c", "d"]], "Achats!A1:A1": [["x"]]}
+    assert len(serveur.requetes) == 1
+
+
+def test_revalidation_etag(serveur):
+    serveur.ecrire("Ventes!A1", [["a"]])
+    c = client(serveur)
+    assert c.lire_plage("classeur", "Ventes!A1:A1") == [["a"]]
+    assert c.lire_plage("classeur", "Ventes!A1:A1") == [["a"]]
+    assert c.compteurs["revalidations"] == 1
+    serveur.ecrire("Ventes!A1", [["b"]])
+    assert c.lire_plage("classeur", "Ventes!A1:A1") == [["b"]]
+
+
+def test_cache_pendant_ttl(serveur):
+    c = client(serveur, ttl=60.0)
+    c.lire_plage("classeur", "Ventes!A1:A1")
+    c.lire_plage("classeur", "Ventes!A1:A1")
+    assert len(serveur.requetes) == 1 and c.compteurs["cache"] == 1
+
+
+def test_429_respecte_retry_after(serveur):
+    serveur.pannes.append((429, {"Retry-After": "0.3"}, False))
+    debut = time.monotonic()
+    assert client(serveur).lire_plage("classeur", "Ventes!A1:A1") == []
+    assert time.monotonic() - debut >= 0.3
+    assert len(serveur.requetes) == 2
+
+
+def test_ecriture_positionnee_rejouee_sans_doublon(serveur):
+    serveur.pannes.append((500, None, True))
+    client(serveur).ecrire_plages("classeur", {"Ventes!A2:B2": [["1", "2"]]})
+    assert len(serveur.requetes) == 2
+    assert serveur.lignes("Ventes") == [[], ["1", "2"]]
+
+
+def vente(jour, produit, quantite=1):
+    return {"Date": jour, "Produit": produit, "Quantité": quantite, "Prix unitaire": 2.0,
+            "Total": 2.0 * quantite, "Mode de paiement": "Espèces"}
+
+
+def ecritures(serveur):
+    """Lignes de l'onglet écrites par les requêtes batchUpdate (en-tête compris)."""
+    return sum(len(bloc["values"]) for _, chemin, _, corps in serveur.requetes
+               if chemin.endswith("batchUpdate") for bloc in corps["data"])
+
+
+def attendu():
+    df = donnees.charger("ventes")
+    return [[str(v) for v in ligne] for ligne in sheets.SyncRegistre(None, "", "", "ventes")._valeurs(df).values.tolist()]
+
+
+def test_pousser_seulement_les_differences(dossier, serveur):
+    sync = sheets.SyncRegistre(client(serveur), "classeur", "Ventes", "ventes")
+    donnees.ajouter_lignes("ventes", [vente("2025-01-02", "Café"), vente("2025-01-02", "Thé", 2)])
+    assert sync.pousser() == 2
+    assert serveur.lignes("Ventes") == [donnees.REGISTRES["ventes"]["colonnes"]] + attendu()
+
+    # Rien de nouveau : aucune requête
+    nb = len(serveur.requetes)
+    assert sync.pousser() == 0
+    assert len(serveur.requetes) == nb
+
+    # Ajout : seule la nouvelle ligne part
+    donnees.ajouter("ventes", vente("2025-01-03", "Cookie", 3))
+    avant = ecritures(serveur)
+    assert sync.pousser() == 1
+    assert ecritures(serveur) - avant == 1
+
+    # Modification (registre réécrit) : seule la ligne modifiée part
+    df = donnees.copie_modifiable(donnees.charger("ventes"))
+    df.loc[1, "Quantité"] = 5
+    donnees.ecrire("ventes", df)
+    avant = ecritures(serveur)
+    assert sync.pousser() == 1
+    assert ecritures(serveur) - avant == 1
+    assert serveur.lignes("Ventes")[1:] == attendu()
+
+    # Suppression : les lignes suivantes remontent, la dernière ligne de l'onglet est vidée
+    df = donnees.charger("ventes")
+    donnees.ecrire("ventes", df.drop(index=0).reset_index(drop=True))
+    sync.pousser()
+    assert serveur.lignes("Ventes")[1:] == attendu()
+
+    # Ajout juste après la suppression : à sa place, sans décalage
+    donnees.ajouter("ventes", vente("2025-01-04", "Café"))
+    assert sync.pousser() == 1
+    assert serveur.lignes("Ventes")[1:] == attendu()
+
+
+def test_repere_recharge_apres_redemarrage(dossier, serveur):
+    donnees.ajouter("ventes", vente("2025-01-02", "Café"))
+    sheets.SyncRegistre(client(serveur), "classeur", "Ventes", "ventes").pousser()
+    # Nouveau processus : le point de synchronisation est relu sur disque
+    assert sheets.SyncRegistre(client(serveur), "classeur", "Ventes", "ventes").pousser() == 0
@@ -0,0 +1,27 @@
+"""Niveaux de stock déduits des événements (``gestion/stock.py``)."""
+from gestion import donnees, stock
+
+RECETTES = {"Cookie": {"ingredients": {"Farine": 0.1}}}
+
+
+def achat(jour, quantite):
+    return {"Date": jour, "Fournisseur": "Metro", "Produit": "Farine", "Quantité": quantite, "Unité": "kg",
+            "Prix unitaire": 1.0, "Total": quantite, "Mode de paiement": "Carte bancaire",
+            "Catégorie": "Matières premières"}
+
+
+def test_meme_jour_que_l_inventaire(dossier, monkeypatch):
+    monkeypatch.setattr(stock, "_etat", None)
+    stock.ajuster({"Farine": -1.0}, "perte", date="2025-01-02")
+    donnees.ajouter_lignes("achats", [achat("2025-01-02", 5.0)])
+    stock.enregistrer_inventaire("Farine", 10.0, date="2025-01-02")
+    # Saisie après le comptage, le même jour : appliquée
+    stock.ajuster({"Farine": -2.0}, "production", date="2025-01-02")
+    assert stock.niveaux(RECETTES)["Farine"] == 8.0
+    # Rejeu incrémental et recalcul complet donnent le même niveau
+    donnees.ajouter_lignes("achats", [achat("2025-01-03", 1.0)])
+    stock.ajuster({"Farine": -0.5}, "perte", date="2025-01-02")
+    assert stock.niveaux(RECETTES)["Farine"] == 8.5
+    stock._etat = None
+    donnees.ecrire("achats", donnees.charger("achats"))
+    assert stock.niveaux(RECETTES)["Farine"] == 8.5